@@ -328,7 +328,7 @@ userProgressReports:
   endDate: Timestamp,
   type: 'daily' | 'weekly' | 'monthly' | 'yearly' | 'custom',
   status: 'in_progress' | 'complete' | 'error',
-  reportData?: {
+  reportData?: {        // while in_progress, may already hold the stats and a partial body (streamed endpoint reports, shown by the app's report detail screen)
     videosWatched: number,
     videosLiked: number,
     videosBookmarked: number,
@@ -339,7 +339,35 @@ userProgressReports:
       fully_understood: number
     },
     body: string,        // LLM-generated report content
-    llmDuration: number  // Time taken to generate LLM response in seconds
+    llmDuration: number, // Time taken to generate LLM response in seconds
+    promptStats: {       // How much of the activity fit in the prompt token budget
+      tokenBudget: number,
+      estimatedTokens: number,
+      itemsTotal: number,
+      itemsIncluded: number,
+      itemsOmitted: number,
+      sections: Array<{label: string, total: number, included: number}>,
+      reusedReportId: string,  // activity matched this earlier report, its body was reused
+      llmOutcome: string       // 'cached' | 'primary' | 'hedge' | 'deadline' | 'error';
+                               // 'deadline' and 'error' bodies are fallbacks and never reused
+    },
+    activityFingerprint: string,  // sha256 over the period's counts and item ids
+    timings: {           // Per-stage breakdown of the report's generation
+      stages: {          // seconds; concurrent stages may overlap
+        query: number,   // activity queries, in-progress and previous-report checks
+        resolve: number, // batched document fetches (videos, members)
+        prompt: number,  // prompt building and LLM cache lookup
+        llm: number,     // model call
+        write: number    // creating the report document
+      },
+      totalSeconds: number,
+      docsRead: number,
+      promptTokens: number,
+      completionTokens: number,
+      firstContentSeconds: number,  // time to the first streamed content
+      partialWrites: number,        // partial body writes while streaming (endpoint requests)
+      llmHedged: number             // 1 when a hedged second LLM request was sent
+    }
   },
   error?: string        // Present only if status is 'error'
 }
@@ -353,19 +381,48 @@ classProgressReports:
   endDate: Timestamp,
   type: 'daily' | 'weekly' | 'monthly' | 'yearly' | 'custom',
   status: 'in_progress' | 'complete' | 'error',
-  reportData?: {
+  reportData?: {        // while in_progress, may already hold the stats and a partial body (streamed endpoint reports, shown by the app's report detail screen)
     membersActive: number,
     membersJoined: number,
     videosLiked: number,
     videosBookmarked: number,
     body: string,        // LLM-generated report content
-    llmDuration: number  // Time taken to generate LLM response in seconds
+    llmDuration: number, // Time taken to generate LLM response in seconds
+    promptStats: {       // How much of the activity fit in the prompt token budget
+      tokenBudget: number,
+      estimatedTokens: number,
+      itemsTotal: number,
+      itemsIncluded: number,
+      itemsOmitted: number,
+      sections: Array<{label: string, total: number, included: number}>,
+      reusedReportId: string,  // activity matched this earlier report, its body was reused
+      llmOutcome: string       // 'cached' | 'primary' | 'hedge' | 'deadline' | 'error';
+                               // 'deadline' and 'error' bodies are fallbacks and never reused
+    },
+    activityFingerprint: string,  // sha256 over the period's counts and item ids
+    timings: {           // Per-stage breakdown of the report's generation
+      stages: {          // seconds; concurrent stages may overlap
+        query: number,   // activity queries, in-progress and previous-report checks
+        resolve: number, // batched document fetches (videos, members)
+        prompt: number,  // prompt building and LLM cache lookup
+        llm: number,     // model call
+        write: number    // creating the report document
+      },
+      totalSeconds: number,
+      docsRead: number,
+      promptTokens: number,
+      completionTokens: number,
+      firstContentSeconds: number,  // time to the first streamed content
+      partialWrites: number,        // partial body writes while streaming (endpoint requests)
+      llmHedged: number             // 1 when a hedged second LLM request was sent
+    }
   },
   error?: string        // Present only if status is 'error'
 }
 
 
 // question collection
+// bank questions are first served under userId_videoId_{bank question id}, later repeats get auto IDs
 questions: {
   questionId: {
     userId: Reference,
@@ -375,6 +432,9 @@ questions: {
       options: Array<string>,
       correctAnswer: number,
       explanation: string,
+      llmDuration: number,
+      llmOutcome: String,      // 'bank' | 'cached' | 'primary' | 'hedge' | 'deadline' | 'error'
+      bankQuestionId?: String  // the bank question's id when served from videoQuestionBank
     }
     userAnswer: number,
     userIsCorrect: boolean,
@@ -382,4 +442,227 @@ questions: {
     createdAt: Timestamp,
     updatedAt: Timestamp
   }
-}
\ No newline at end of file
+}
+
+// pre-generated in-feed questions, filled by the fill_question_bank trigger
+videoQuestionBank: {
+  videoId: {
+    videoId: Reference,
+    questions: Array<{
+      id: String,            // hash of questionText and options (banks generated before were 'q0' .. 'q{n}')
+      questionText: String,
+      options: Array<String>, // unshuffled, the first option is correct
+      explanation: String
+    }>,
+    contentHash: String,     // hash of the video content and prompt version used
+    model: String,
+    promptVersion: String,   // e.g. 'question-bank-v2'
+    llmDuration: Number,     // duration of the whole request when generated in a batch
+    batchSize: Number,       // videos generated in the same request
+    generatedAt: Timestamp
+  }
+}
+
+// transcript digests used in question prompts instead of the full transcript,
+// regenerated when the transcript hash or promptVersion changes
+videoDigests: {
+  videoId: {
+    videoId: Reference,
+    transcriptHash: String,  // sha256 of metadata.transcript
+    keyPoints: Array<String>,
+    excerpt: String,         // transcript cut to TRANSCRIPT_EXCERPT_CHARS
+    model: String,
+    promptVersion: String,   // e.g. 'transcript-digest-v1'
+    generatedAt: Timestamp
+  }
+}
+
+// pending question bank generation, deleted once the bank is stored
+questionBankRequests: {
+  videoId: {
+    videoId: Reference,
+    status: String,          // 'pending' | 'error'
+    error?: String,          // Present only if status is 'error'
+    requestedAt: Timestamp,
+    failedAt?: Timestamp,
+    failures?: Number,       // Failed generations so far, carried over when a failed request is re-enqueued
+    retryAt?: Timestamp      // Failed requests are replaced by a new pending one after this, with doubling backoff
+  }
+}
+
+// daily activity rollups, maintained by Firestore triggers in functions/main.py
+// and rebuilt from raw activity by backfill_activity_rollups; weekly, monthly
+// and yearly reports read these instead of raw events once the coverage below
+// reaches the start of the period
+activityRollupState: {
+  coverage: {
+    coveredFrom: String,  // first UTC day ('YYYY-MM-DD') the rollups and activityIndex hold in full; '0001-01-01' once backfilled to the oldest activity
+    updatedAt: Timestamp
+  }
+}
+
+userDailyActivity: {
+  userId_YYYY-MM-DD: {
+    userId: Reference,
+    date: String,  // UTC day, 'YYYY-MM-DD'
+    counts: {
+      views: Number,
+      likes: Number,
+      bookmarks: Number,
+      not_understood: Number,        // comprehension docs by current level, on the day last assessed
+      partially_understood: Number,
+      fully_understood: Number
+    },
+    ids: {  // video ids, each list capped at 50
+      liked: Array<String>,
+      bookmarked: Array<String>,
+      not_understood: Array<String>,
+      partially_understood: Array<String>,
+      fully_understood: Array<String>
+    },
+    eventIds: Array<String>,  // last 200 trigger event ids applied, so redelivered events are skipped
+    updatedAt: Timestamp
+  }
+}
+
+classDailyActivity: {
+  classId_YYYY-MM-DD: {
+    classId: Reference,
+    date: String,  // UTC day, 'YYYY-MM-DD'
+    counts: {
+      likes: Number,
+      bookmarks: Number,
+      membersJoined: Number
+    },
+    ids: {  // each list capped at 50
+      liked: Array<String>,      // video ids
+      bookmarked: Array<String>, // video ids
+      members: Array<String>     // user ids
+    },
+    eventIds: Array<String>,  // last 200 trigger event ids applied, so redelivered events are skipped
+    updatedAt: Timestamp
+  }
+}
+
+// content-addressed LLM response cache (report bodies and in-feed questions)
+// expires via a TTL policy on expiresAt
+llmCache: {
+  sha256(model, promptVersion, inputs): {
+    model: String,
+    promptVersion: String,  // e.g. 'user-report-v1'
+    value: String | Map,    // report body, or the unshuffled question for questions
+    createdAt: Timestamp,
+    expiresAt: Timestamp
+  }
+}
+
+// LLM call outcomes per call site and UTC day, added by each instance about once a minute
+llmCallStats: {
+  site_YYYY-MM-DD: {
+    site: String,            // 'question' | 'user_report' | 'class_report'
+    date: String,
+    outcomes: {              // count per outcome
+      primary: Number,       // first request answered in time
+      hedge: Number,         // hedged second request answered first
+      deadline: Number,      // deadline passed, fallback served
+      error: Number          // every request failed
+    },
+    calls: Number,
+    totalSeconds: Number,    // summed call latency
+    updatedAt: Timestamp
+  }
+}
+
+// metrics for each report queue worker run
+reportRuns: {
+  runId: {
+    workerId: String,
+    jobs: Number,
+    complete: Number,
+    deferred: Number,       // a report was already in progress, the job was retried later
+    error: Number,
+    retries: Number,
+    rateLimited: Number,    // OpenAI 429 responses
+    durationSeconds: Number,
+    reportsPerMinute: Number,
+    latencyP50: Number,
+    latencyP95: Number,
+    concurrencyCeiling: Number,
+    concurrencyMin: Number,
+    concurrencyFinal: Number,
+    createdAt: Timestamp
+  }
+}
+
+// durable report job queue, one job per subject, report type and period
+reportJobs: {
+  '{subjectType}_{subjectId}_{type}_{startDate}_{endDate}': {
+    subjectType: 'user' | 'class',
+    subjectId: String,
+    type: 'daily' | 'weekly' | 'monthly' | 'yearly' | String,  // e.g. 'monthly+weekly+daily' for multi-period jobs
+    startDate: Timestamp,      // widest window for multi-period jobs
+    endDate: Timestamp,
+    periods: Array<{type: String, startDate: Timestamp, endDate: Timestamp}>,  // REPORT_PERIOD_MODE=multi only
+    status: 'pending' | 'leased' | 'deferred' | 'done' | 'failed',
+    attempts: Number,          // failed leases so far (deferrals do not count)
+    leaseOwner: String,        // worker holding the lease
+    leaseExpiresAt: Timestamp, // expired leases are picked up by other workers; outlives report leases
+    retryAt: Timestamp,        // deferred jobs are leased again from this time
+    deferrals: Number,         // times the job found its report already in progress
+    reportIds: Map<String, String>,  // report type -> ID of periods already generated by a deferred job
+    reportId: String,          // set when done, comma separated for multi-period jobs
+    noActivity: Boolean,       // done without a report, the period had no activity
+    skipped: Boolean,          // still in progress after REPORT_JOB_MAX_DEFERRALS deferrals
+    error: String,
+    createdAt: Timestamp,
+    updatedAt: Timestamp
+  }
+}
+
+// users and classes with any rolled-up activity per UTC day, used to find report targets
+// written once per subject and day, when its daily rollup doc is created, and rewritten per day by backfill_activity_rollups
+activityIndex: {
+  '{date}_{shard}': {
+    date: String,              // 'YYYY-MM-DD'
+    userIds: Array<String>,
+    classIds: Array<String>,
+    updatedAt: Timestamp
+  }
+}
+
+// progress of each hourly report slot (users and classes are hashed into REPORT_SLOTS slots)
+reportSlots: {
+  '{date}_{slot}': {
+    date: String,              // 'YYYY-MM-DD' (UTC) of the run
+    slot: Number,
+    type: String,              // due report types joined by '+'
+    startDate: Timestamp,
+    endDate: Timestamp,
+    status: 'running' | 'done' | 'error',
+    users: Number,
+    classes: Number,
+    jobsEnqueued: Number,
+    complete: Number,
+    deferred: Number,
+    error: Number,             // reports that failed
+    errorMessage: String,      // set when the slot itself failed
+    durationSeconds: Number,
+    startedAt: Timestamp,
+    finishedAt: Timestamp
+  }
+}
+
+// one lease per report subject and period, taken in the same transaction that
+// creates the in_progress report; deleted when the report finishes
+reportLeases: {
+  '{subjectType}_{subjectId}_{type}_{startDate}_{endDate}': {
+    subjectType: 'user' | 'class',
+    subjectId: String,
+    type: 'daily' | 'weekly' | 'monthly' | 'yearly' | 'custom',
+    startDate: Timestamp,
+    endDate: Timestamp,
+    reportId: String,       // report holding the lease
+    acquiredAt: Timestamp,
+    expiresAt: Timestamp    // after this the lease can be taken over and the report is marked error
+  }
+}
@@ -1,17 +1,25 @@
-from firebase_functions import https_fn, scheduler_fn
+from firebase_functions import https_fn, scheduler_fn, firestore_fn
 from firebase_admin import initialize_app, firestore, auth
 import firebase_admin
 from datetime import datetime, timedelta, timezone
 import json
+import hashlib
 import random
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Callable, Iterable, Optional
 import os
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
 import requests
 import aiohttp
 import asyncio
 import calendar
+import time
+import contextlib
+from contextlib import contextmanager
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
 import google.auth
 import google.auth.transport.requests
 import google.oauth2.id_token
@@ -25,6 +33,19 @@ class QuestionResponse(BaseModel):
     options: List[str] = Field(..., description="Four possible answer options, with the first one being correct")
     explanation: str = Field(..., description="Detailed explanation of why the correct answer is right")
 
+class QuestionBankResponse(BaseModel):
+    questions: List[QuestionResponse] = Field(..., description="Distinct multiple choice questions, each testing a different concept from the video")
+
+class TranscriptDigestResponse(BaseModel):
+    keyPoints: List[str] = Field(..., description="The key points a viewer should learn from the video, one short sentence each")
+
+class QuestionBankBatchItem(BaseModel):
+    videoIndex: int = Field(..., description="Number of the video these questions are about, as given in the prompt")
+    questions: List[QuestionResponse] = Field(..., description="Distinct multiple choice questions about this video, each testing a different concept")
+
+class QuestionBankBatchResponse(BaseModel):
+    videos: List[QuestionBankBatchItem] = Field(..., description="One entry per video in the prompt")
+
 def validate_environment():
     """Validate required environment variables are set."""
     required_vars = [
@@ -161,13 +182,13 @@ def calculate_tag_overlap(tags1: Dict[str, float], tags2: List[str], debug_info:
     
     return float(total_score / max_possible_score)  # Normalize by maximum possible score
 
-def get_vector_profile(db: Any, source_type: str, source_id: str) -> tuple:
+def get_vector_profile(loader: 'DocumentLoader', source_type: str, source_id: str) -> tuple:
     """Get vector and tag preferences for a user or class."""
     collection_name = 'userVectors' if source_type == 'user' else 'classVectors'
-    doc_ref = db.collection(collection_name).document(source_id)
-    doc = doc_ref.get()
+    doc_ref = loader.db.collection(collection_name).document(source_id)
+    doc = loader.get(doc_ref)
     
-    if not doc.exists:
+    if not doc:
         return [], {}
         
     data = doc.to_dict()
@@ -208,6 +229,198 @@ def format_video_response(doc: Any) -> Dict:
         'similarity_score': 0.0  # Will be populated later
     }
 
+# Per-user listing sources: (collection, owner field, newest-first timestamp field)
+LISTING_SOURCES = {
+    'likes': ('userLikes', 'userId', 'likedAt'),
+    'bookmarks': ('userBookmarks', 'userId', 'addedAt'),
+    'videos': ('videos', 'creator', 'metadata.uploadedAt'),
+}
+
+def get_listing_query(db: Any, source_id: str, video_type: str) -> Any:
+    """Build the unordered query behind a user's likes, bookmarks or videos listing."""
+    collection, owner_field, _ = LISTING_SOURCES[video_type]
+    owner_ref = db.collection('users').document(source_id)
+    return db.collection(collection).where(owner_field, '==', owner_ref)
+
+def run_concurrently(*calls: Callable[[], Any]) -> List[Any]:
+    """Run blocking calls (e.g. Firestore queries) concurrently.
+    Returns their results in the order the calls were given."""
+    async def gather_calls():
+        return await asyncio.gather(*(asyncio.to_thread(call) for call in calls))
+    
+    return asyncio.run(gather_calls())
+
+# Maximum number of references sent in a single get_all round trip
+GET_ALL_CHUNK_SIZE = 100
+
+class StageTimer:
+    """Per-report timing breakdown.
+    
+    Accumulates wall-clock seconds per named stage (query, resolve, prompt,
+    llm, write) and counters such as documents read and tokens used. Stages
+    run concurrently may overlap, so their sum can exceed the total time."""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as part of a stage."""
+        stage_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - stage_started
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+    
+    def add(self, name: str, seconds: float) -> None:
+        """Add time measured elsewhere to a stage."""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def count(self, name: str, value: int) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def record(self, name: str, value: float) -> None:
+        """Store a single measurement, such as the time to first content."""
+        with self._lock:
+            self.counters[name] = round(value, 4)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Stage seconds, total seconds so far and counters, for reportData.timings."""
+        return {
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'totalSeconds': round(time.perf_counter() - self.started, 4),
+            **self.counters
+        }
+
+class DocumentLoader:
+    """Request-scoped document loader.
+    
+    Coalesces DocumentReference reads made during one request into batched
+    get_all calls and memoizes the snapshots (including missing documents),
+    so each document is read at most once per request. Create one loader per
+    request; it is safe to share between threads of that request. With a
+    timer, fetches are timed as the 'resolve' stage and counted in docsRead.
+    field_masks maps a collection ID to the field paths fetched for its
+    documents, e.g. to leave large fields out; other documents are read whole."""
+    
+    def __init__(self, db: Any, chunk_size: int = GET_ALL_CHUNK_SIZE, timer: Optional[StageTimer] = None, field_masks: Optional[Dict[str, List[str]]] = None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.timer = timer
+        self.field_masks = field_masks or {}
+        self.reads = 0  # Number of documents fetched from Firestore
+        self._snapshots: Dict[str, Any] = {}
+        self._pending: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+    
+    def prime(self, refs: Iterable[Any]) -> None:
+        """Queue references to be fetched with the next batched read."""
+        with self._lock:
+            for ref in refs:
+                if ref and ref.path not in self._snapshots:
+                    self._pending[ref.path] = ref
+    
+    def flush(self) -> None:
+        """Fetch all queued references in get_all chunks.
+        The lock is only held to take the queue and store the snapshots, so
+        threads do not wait on each other's reads; a reference queued again
+        while another thread is fetching it may be read twice."""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending = {}
+        if not pending:
+            return
+        # Documents sharing a field mask are fetched together
+        groups: Dict[str, List[Any]] = {}
+        for ref in pending:
+            groups.setdefault(ref.path.rsplit('/', 2)[-2], []).append(ref)
+        with self.timer.stage('resolve') if self.timer else contextlib.nullcontext():
+            for collection_id, refs in groups.items():
+                field_paths = self.field_masks.get(collection_id)
+                for i in range(0, len(refs), self.chunk_size):
+                    chunk = refs[i:i + self.chunk_size]
+                    docs = list(self.db.get_all(chunk, field_paths=field_paths) if field_paths else self.db.get_all(chunk))
+                    with self._lock:
+                        for doc in docs:
+                            self._snapshots[doc.reference.path] = doc
+                        self.reads += len(chunk)
+        if self.timer:
+            self.timer.count('docsRead', len(pending))
+    
+    def get(self, ref: Any) -> Optional[Any]:
+        """Return the snapshot for a reference, or None if it does not exist."""
+        if not ref:
+            return None
+        if ref.path not in self._snapshots:
+            self.prime([ref])
+            self.flush()
+        doc = self._snapshots.get(ref.path)
+        return doc if doc is not None and doc.exists else None
+    
+    def get_all(self, refs: Iterable[Any]) -> Dict[str, Any]:
+        """Load references in batches, deduplicated by path.
+        Returns a dict mapping document path to snapshot for documents that exist."""
+        refs = [ref for ref in refs if ref]
+        self.prime(refs)
+        self.flush()
+        docs = {}
+        for ref in refs:
+            doc = self._snapshots.get(ref.path)
+            if doc is not None and doc.exists:
+                docs[ref.path] = doc
+        return docs
+
+def compute_listing_etag(db: Any, source_type: str, source_id: str, video_type: str) -> str:
+    """Compute a weak ETag for a video listing.
+
+    The fingerprint is built from a count() aggregation and a single-document
+    read of the newest entry, so it never downloads the list itself. Edits to
+    the referenced video documents are not reflected in the fingerprint."""
+    if source_type != 'user':
+        # Class listings are not backed by a query yet and are always empty
+        fingerprint = f'{source_type}:{source_id}:{video_type}:empty'
+    else:
+        timestamp_field = LISTING_SOURCES[video_type][2]
+        query = get_listing_query(db, source_id, video_type)
+        
+        count_result, newest_docs = run_concurrently(
+            lambda: query.count().get(),
+            lambda: (
+                query.order_by(timestamp_field, direction=firestore.Query.DESCENDING)
+                .select([timestamp_field])
+                .limit(1)
+                .get()
+            )
+        )
+        count = count_result[0][0].value
+        newest_marker = ''
+        if newest_docs:
+            newest_at = newest_docs[0].get(timestamp_field)
+            newest_marker = f"{newest_docs[0].id}@{newest_at.isoformat() if newest_at else ''}"
+        fingerprint = f'{source_type}:{source_id}:{video_type}:{count}:{newest_marker}'
+    
+    return f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag (weak comparison)."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    
+    def strip_weak(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+    
+    return any(strip_weak(tag) == strip_weak(etag) for tag in if_none_match.split(','))
+
 @https_fn.on_request()
 def get_videos(req: https_fn.Request) -> https_fn.Response:
     # Set CORS headers for all responses
@@ -303,6 +516,7 @@ def get_videos(req: https_fn.Request) -> https_fn.Response:
 
     # Initialize Firestore
     db = firestore.client()
+    loader = DocumentLoader(db)
     
     # Get recently watched videos (within last 24 hours)
     recently_watched = set()
@@ -332,7 +546,7 @@ def get_videos(req: https_fn.Request) -> https_fn.Response:
         debug_info['errors'] = debug_info.get('errors', []) + [f"Error fetching user views: {e}"]
     
     # Get the source vector profile
-    source_vector, source_tags = get_vector_profile(db, source_type, source_id)
+    source_vector, source_tags = get_vector_profile(loader, source_type, source_id)
     debug_info['source_vector_info'] = {
         'has_vector': bool(source_vector),
         'vector_length': len(source_vector) if source_vector else 0,
@@ -460,6 +674,8 @@ def get_videos(req: https_fn.Request) -> https_fn.Response:
                     }
                     videos.append(video)
         
+        schedule_question_bank_prefetch(db, [video['id'] for video in videos])
+        
         return https_fn.Response(
             json.dumps({
                 'videos': videos,
@@ -634,6 +850,8 @@ def get_videos(req: https_fn.Request) -> https_fn.Response:
         debug_info['decision_path']['case'] = 'empty_results'
         debug_info['decision_path']['reason'] = 'No videos found after filtering'
         debug_info['decision_path']['details']['total_candidates_processed'] = len(all_videos)
+    
+    schedule_question_bank_prefetch(db, [video['id'] for video in recommended_videos])
 
     return https_fn.Response(
         json.dumps({
@@ -650,7 +868,8 @@ def get_filtered_videos(req: https_fn.Request) -> https_fn.Response:
     cors_headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag',
         'Access-Control-Max-Age': '3600',
     }
     
@@ -717,6 +936,20 @@ def get_filtered_videos(req: https_fn.Request) -> https_fn.Response:
 
     # Initialize Firestore
     db = firestore.client()
+    
+    # Answer conditional requests from the cheap listing fingerprint
+    etag = None
+    try:
+        etag = compute_listing_etag(db, source_type, source_id, video_type)
+    except Exception as e:
+        print(f"Error computing listing ETag: {e}")
+    
+    if etag:
+        cors_headers = {**cors_headers, 'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag_matches(req.headers.get('If-None-Match', ''), etag):
+            return https_fn.Response('', status=304, headers=cors_headers)
+    
+    loader = DocumentLoader(db)
     videos_ref = db.collection('videos')
     videos = []
 
@@ -728,12 +961,13 @@ def get_filtered_videos(req: https_fn.Request) -> https_fn.Response:
                 user_ref = db.collection('users').document(source_id)
                 likes = likes_ref.where('userId', '==', user_ref).get()
                 
-                # Get the video documents for each like
+                # Get the video documents for each like in batched reads
+                loader.prime(like.get('videoId') for like in likes)
                 for like in likes:
                     video_ref = like.get('videoId')
                     if video_ref:
-                        video_doc = video_ref.get()
-                        if video_doc.exists:
+                        video_doc = loader.get(video_ref)
+                        if video_doc:
                             data = video_doc.to_dict()
                             metadata = data.get('metadata', {})
                             engagement = data.get('engagement', {
@@ -773,12 +1007,13 @@ def get_filtered_videos(req: https_fn.Request) -> https_fn.Response:
                 user_ref = db.collection('users').document(source_id)
                 bookmarks = bookmarks_ref.where('userId', '==', user_ref).get()
                 
-                # Get the video documents for each bookmark
+                # Get the video documents for each bookmark in batched reads
+                loader.prime(bookmark.get('videoId') for bookmark in bookmarks)
                 for bookmark in bookmarks:
                     video_ref = bookmark.get('videoId')
                     if video_ref:
-                        video_doc = video_ref.get()
-                        if video_doc.exists:
+                        video_doc = loader.get(video_ref)
+                        if video_doc:
                             data = video_doc.to_dict()
                             metadata = data.get('metadata', {})
                             engagement = data.get('engagement', {
@@ -873,6 +1108,222 @@ def get_filtered_videos(req: https_fn.Request) -> https_fn.Response:
         content_type='application/json'
     )
 
+@https_fn.on_request()
+def get_profile_videos(req: https_fn.Request) -> https_fn.Response:
+    """Return the first page of a user's likes, bookmarks and created videos.
+    The three listing queries run concurrently and all referenced videos are
+    resolved in one deduplicated batched fetch."""
+    # Set CORS headers for all responses
+    cors_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Access-Control-Max-Age': '3600',
+    }
+    
+    # Handle OPTIONS request (preflight)
+    if req.method == 'OPTIONS':
+        return https_fn.Response('', headers=cors_headers, status=204)
+    
+    # Verify authentication
+    auth_header = req.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return https_fn.Response(
+            json.dumps({'error': 'Unauthorized - Invalid token format'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    try:
+        # Verify the token
+        token = auth_header.split('Bearer ')[1]
+        decoded_token = auth.verify_id_token(token)
+        user_id = decoded_token['uid']
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Unauthorized - Invalid token: {str(e)}'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    # Defaults to the caller's own profile
+    source_id = req.args.get('source_id', user_id)
+    try:
+        limit = int(req.args.get('limit', 20))
+    except ValueError:
+        return https_fn.Response(
+            json.dumps({'error': 'Invalid limit'}),
+            status=400,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    if limit < 1 or limit > 100:
+        return https_fn.Response(
+            json.dumps({'error': 'limit must be between 1 and 100'}),
+            status=400,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    # Initialize Firestore
+    db = firestore.client()
+    video_types = list(LISTING_SOURCES.keys())
+    
+    # Combined fingerprint of the three listings
+    etag = None
+    try:
+        listing_etags = run_concurrently(*[
+            (lambda video_type=video_type: compute_listing_etag(db, 'user', source_id, video_type))
+            for video_type in video_types
+        ])
+        fingerprint = f"{limit}:" + '|'.join(listing_etags)
+        etag = f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+    except Exception as e:
+        print(f"Error computing profile ETag: {e}")
+    
+    if etag:
+        cors_headers = {**cors_headers, 'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag_matches(req.headers.get('If-None-Match', ''), etag):
+            return https_fn.Response('', status=304, headers=cors_headers)
+    
+    try:
+        # Fetch one extra entry per listing to know whether more pages exist
+        results = run_concurrently(*[
+            (lambda video_type=video_type: (
+                get_listing_query(db, source_id, video_type)
+                .order_by(LISTING_SOURCES[video_type][2], direction=firestore.Query.DESCENDING)
+                .limit(limit + 1)
+                .get()
+            ))
+            for video_type in video_types
+        ])
+        pages = {
+            video_type: docs[:limit]
+            for video_type, docs in zip(video_types, results)
+        }
+        has_more = {
+            video_type: len(docs) > limit
+            for video_type, docs in zip(video_types, results)
+        }
+        
+        # Resolve every liked and bookmarked video in one batched fetch
+        video_refs = [
+            doc.get('videoId')
+            for video_type in ('likes', 'bookmarks')
+            for doc in pages[video_type]
+        ]
+        video_docs = DocumentLoader(db).get_all(video_refs)
+        
+        def format_listing_video(doc: Any) -> Dict:
+            video = format_video_response(doc)
+            del video['similarity_score']
+            return video
+        
+        response_data = {'sourceId': source_id}
+        for video_type in ('likes', 'bookmarks'):
+            videos = []
+            for doc in pages[video_type]:
+                video_ref = doc.get('videoId')
+                if video_ref and video_ref.path in video_docs:
+                    videos.append(format_listing_video(video_docs[video_ref.path]))
+            response_data[video_type] = {'videos': videos, 'hasMore': has_more[video_type]}
+        
+        response_data['videos'] = {
+            'videos': [format_listing_video(doc) for doc in pages['videos']],
+            'hasMore': has_more['videos']
+        }
+        
+        return https_fn.Response(
+            json.dumps(response_data),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error fetching videos: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+@https_fn.on_request()
+def get_profile_stats(req: https_fn.Request) -> https_fn.Response:
+    """Return like, bookmark and created-video counts for a user's profile header.
+    Uses count() aggregations only, so no video documents are transferred."""
+    # Set CORS headers for all responses
+    cors_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Max-Age': '3600',
+    }
+    
+    # Handle OPTIONS request (preflight)
+    if req.method == 'OPTIONS':
+        return https_fn.Response('', headers=cors_headers, status=204)
+    
+    # Verify authentication
+    auth_header = req.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return https_fn.Response(
+            json.dumps({'error': 'Unauthorized - Invalid token format'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    try:
+        # Verify the token
+        token = auth_header.split('Bearer ')[1]
+        decoded_token = auth.verify_id_token(token)
+        user_id = decoded_token['uid']
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Unauthorized - Invalid token: {str(e)}'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    # Defaults to the caller's own profile
+    source_id = req.args.get('source_id', user_id)
+    
+    try:
+        # Initialize Firestore
+        db = firestore.client()
+        
+        # One count() aggregation per category, run concurrently
+        video_types = list(LISTING_SOURCES.keys())
+        results = run_concurrently(*[
+            (lambda video_type=video_type: get_listing_query(db, source_id, video_type).count().get())
+            for video_type in video_types
+        ])
+        stats = {
+            video_type: result[0][0].value
+            for video_type, result in zip(video_types, results)
+        }
+        
+        return https_fn.Response(
+            json.dumps({
+                'sourceId': source_id,
+                'stats': stats
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error fetching profile stats: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
 @https_fn.on_request()
 def generate_user_report(req: https_fn.Request) -> https_fn.Response:
     # Set CORS headers for all responses
@@ -901,33 +1352,16 @@ def generate_user_report(req: https_fn.Request) -> https_fn.Response:
     token = auth_header.split('Bearer ')[1]
     
     try:
-        # First try to verify as a Firebase ID token (for app calls)
+        # Firebase ID token for app calls, or a Google Cloud token for internal calls
         try:
-            decoded_token = auth.verify_id_token(token)
-            user_id = decoded_token['uid']
-        except Exception as firebase_error:
-            # If Firebase verification fails, verify as a Google Cloud token
-            try:
-                import google.auth.transport.requests
-                import google.oauth2.id_token
-                
-                auth_req = google.auth.transport.requests.Request()
-                
-                # Verify the token against Google Cloud
-                decoded_token = google.oauth2.id_token.verify_token(
-                    token,
-                    auth_req,
-                    audience=None  # or your specific function URL
-                )
-                # For internal calls, we'll trust the Cloud Platform
-                user_id = 'service-account'
-            except Exception as cloud_error:
-                return https_fn.Response(
-                    json.dumps({'error': f'Unauthorized - Invalid token. Firebase error: {str(firebase_error)}. Cloud error: {str(cloud_error)}'}),
-                    status=401,
-                    headers=cors_headers,
-                    content_type='application/json'
-                )
+            user_id = verify_request_token(token, 'generate_user_report')
+        except Exception as token_error:
+            return https_fn.Response(
+                json.dumps({'error': f'Unauthorized - Invalid token. {str(token_error)}'}),
+                status=401,
+                headers=cors_headers,
+                content_type='application/json'
+            )
     except Exception as e:
         return https_fn.Response(
             json.dumps({'error': f'Authentication error: {str(e)}'}),
@@ -945,8 +1379,8 @@ def generate_user_report(req: https_fn.Request) -> https_fn.Response:
             content_type='application/json'
         )
     
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # Shared OpenAI client
+    client = get_openai_client()
     
     try:
         # Parse request body
@@ -997,235 +1431,935 @@ def generate_user_report(req: https_fn.Request) -> https_fn.Response:
         # Initialize Firestore
         db = firestore.client()
         
-        # Check for in-progress reports
-        user_ref = db.collection('users').document(user_id)
-        in_progress_reports = (
-            db.collection('userProgressReports')
-            .where('userId', '==', user_ref)
-            .where('status', '==', 'in_progress')
-            .limit(1)
-            .get()
-        )
-        
-        if len(in_progress_reports) > 0:
-            return https_fn.Response(
-                json.dumps({
-                    'error': 'A report is already being generated for this user',
-                    'reportId': in_progress_reports[0].id
-                }),
-                status=409,  # Conflict
-                headers=cors_headers,
-                content_type='application/json'
-            )
+        report_id = run_user_report(db, client, user_id, start_date, end_date, report_type, stream_partial_body=True)
         
-        # Create report document with generated ID and initial in_progress status
-        new_report_ref = db.collection('userProgressReports').document()
+        return https_fn.Response(
+            json.dumps({
+                'success': True,
+                'reportId': report_id,
+                'noActivity': report_id is None
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+    except ReportInProgressError as e:
+        return https_fn.Response(
+            json.dumps({
+                'error': str(e),
+                'reportId': e.report_id
+            }),
+            status=409,  # Conflict
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error generating report: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+class ReportInProgressError(Exception):
+    """Raised when a report is already being generated for the subject."""
+    
+    def __init__(self, message: str, report_id: str):
+        super().__init__(message)
+        self.report_id = report_id
+
+_openai_client = None
+
+# Progress report collection and subject field per subject type
+REPORT_COLLECTIONS = {
+    'user': ('userProgressReports', 'userId'),
+    'class': ('classProgressReports', 'classId')
+}
+
+# A report lease expires after this many seconds, so a crashed run does not block the period forever
+REPORT_LEASE_SECONDS = int(os.getenv('REPORT_LEASE_SECONDS', '900'))
+
+def start_leased_report(db: Any, subject_type: str, subject_ref: Any, start_date: datetime, end_date: datetime, report_type: str) -> Tuple[Any, Any]:
+    """Take the report lease for a subject and period and create its in_progress report.
+    
+    Both happen in one transaction, so concurrent requests for the same report
+    cannot both pass. A live lease held by another report raises
+    ReportInProgressError with that report's ID. An expired lease is taken
+    over, and the report it guarded is marked as error if it is still
+    in_progress. Returns (report_ref, lease_ref)."""
+    collection, owner_field = REPORT_COLLECTIONS[subject_type]
+    lease_id = f"{subject_type}_{subject_ref.id}_{report_type}_{rollup_date_key(start_date)}_{rollup_date_key(end_date)}"
+    lease_ref = db.collection('reportLeases').document(lease_id)
+    report_ref = db.collection(collection).document()
+    
+    @firestore.transactional
+    def acquire(transaction):
+        lease_doc = lease_ref.get(transaction=transaction)
+        now = datetime.now(timezone.utc)
+        stale_report_ref = None
+        if lease_doc.exists:
+            lease = lease_doc.to_dict()
+            if lease['expiresAt'] > now:
+                raise ReportInProgressError(
+                    f'A report is already being generated for this {subject_type}',
+                    lease.get('reportId')
+                )
+            stale_report_ref = db.collection(collection).document(lease['reportId'])
+            stale_report = stale_report_ref.get(transaction=transaction)
+            if not (stale_report.exists and stale_report.get('status') == 'in_progress'):
+                stale_report_ref = None
         
-        # Create initial report data
-        report_data = {
-            'userId': user_ref,
+        # All reads are done; now write
+        if stale_report_ref:
+            transaction.update(stale_report_ref, {
+                'status': 'error',
+                'error': 'Report generation did not finish before its lease expired'
+            })
+        transaction.set(lease_ref, {
+            'subjectType': subject_type,
+            'subjectId': subject_ref.id,
+            'type': report_type,
+            'startDate': start_date,
+            'endDate': end_date,
+            'reportId': report_ref.id,
+            'acquiredAt': now,
+            'expiresAt': now + timedelta(seconds=REPORT_LEASE_SECONDS)
+        })
+        transaction.set(report_ref, {
+            owner_field: subject_ref,
             'createdAt': datetime.now(),
-            'startDate': datetime.fromisoformat(start_time),
-            'endDate': datetime.fromisoformat(end_time),
+            'startDate': start_date,
+            'endDate': end_date,
             'type': report_type,
             'status': 'in_progress'
-        }
+        })
+    
+    acquire(db.transaction())
+    return report_ref, lease_ref
 
-        # Set the initial data
-        new_report_ref.set(report_data)
+def release_report_lease(db: Any, lease_ref: Any, report_id: str) -> None:
+    """Delete a report lease if it is still held by the given report.
+    Failures are logged; the lease then simply expires."""
+    
+    @firestore.transactional
+    def release(transaction):
+        lease_doc = lease_ref.get(transaction=transaction)
+        if lease_doc.exists and lease_doc.get('reportId') == report_id:
+            transaction.delete(lease_ref)
+    
+    try:
+        release(db.transaction())
+    except Exception as e:
+        print(f"Error releasing report lease {lease_ref.id}: {str(e)}")
 
-        try:
-            # Query data for the time period
-            start_date = datetime.fromisoformat(start_time)
-            end_date = datetime.fromisoformat(end_time)
-            
-            # Get videos watched in time period
-            videos_watched_docs = (
-                db.collection('userViews')
-                .where('userId', '==', user_ref)
-                .where('watchedAt', '>=', start_date)
-                .where('watchedAt', '<=', end_date)
-            ).get()
-            videos_watched = len(videos_watched_docs)
-            
-            # Get videos liked in time period
-            videos_liked_docs = (
-                db.collection('userLikes')
+def get_openai_client() -> OpenAI:
+    """Return the OpenAI client shared by all requests handled by this instance."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return _openai_client
+
+def run_user_report(db: Any, client: OpenAI, user_id: str, start_date: datetime, end_date: datetime, report_type: str, data_pass: Optional['ReportDataPass'] = None, stream_partial_body: bool = False) -> Optional[str]:
+    """Generate and store a user progress report. Returns the report ID, or
+    None when the period had no activity and no report was stored.
+    
+    This is the report engine behind both the generate_user_report endpoint
+    and the scheduled batch run. Raises ReportInProgressError if a report is
+    already being generated for the user and period (see start_leased_report).
+    On an OpenAI RateLimitError the
+    report is deleted and the error re-raised so the caller can retry; any
+    other failure marks the report as error and is re-raised. With a
+    data_pass the activity comes from its shared rollups. Rollups are only
+    used for periods they fully cover (see rollups_cover). With
+    stream_partial_body the body is written to the in-progress report as the
+    completion streams, for clients watching the document."""
+    timer = StageTimer()
+    
+    # Take the lease for this user and period and create the in_progress report
+    user_ref = db.collection('users').document(user_id)
+    with timer.stage('write'):
+        new_report_ref, lease_ref = start_leased_report(db, 'user', user_ref, start_date, end_date, report_type)
+
+    try:
+        # Collect the user's activity in the time period
+        loader = DocumentLoader(db, timer=timer, field_masks=REPORT_FIELD_MASKS)
+        # Rollups are only read once they hold the whole period; until the
+        # backfill reaches its start, the raw activity is read instead
+        use_rollups = (data_pass is not None or report_type in ROLLUP_REPORT_TYPES) and rollups_cover(db, start_date)
+        if use_rollups and data_pass:
+            report_details, report_stats = collect_user_report_data_from_rollups(db, loader, user_ref, start_date, end_date, data_pass, timer)
+        elif use_rollups:
+            report_details, report_stats = collect_user_report_data_from_rollups(db, loader, user_ref, start_date, end_date, timer=timer)
+        else:
+            report_details, report_stats = collect_user_report_data(db, loader, user_ref, start_date, end_date, timer)
+
+        # Periods without activity get no report, rather than a placeholder one
+        if has_no_activity(report_stats):
+            new_report_ref.delete()
+            return None
+
+        # Reuse the last report when the activity has not changed, otherwise generate a new one
+        with timer.stage('query'):
+            fingerprint, unchanged = find_unchanged_report_body(
+                db, 'userProgressReports', 'userId', user_ref, report_type, report_details, report_stats
+            )
+        if unchanged:
+            llm_response, llm_duration, prompt_stats = unchanged
+        else:
+            # Stream the body into the report document as it is generated
+            partial_writer = ThrottledReportWriter(new_report_ref, report_stats) if stream_partial_body else None
+            try:
+                llm_response, llm_duration, prompt_stats = user_report_llm_response(
+                    client, report_details, report_type, timer, partial_writer
+                )
+            finally:
+                # A stream left running after a deadline or hedge must not overwrite the final body
+                if partial_writer:
+                    partial_writer.close()
+            if partial_writer:
+                timer.count('partialWrites', partial_writer.writes)
+
+        # Update report with AI-generated content and complete status
+        new_report_ref.update({
+            'status': 'complete',
+            'reportData': {
+                **report_stats,
+                'body': llm_response,
+                'llmDuration': llm_duration,
+                'promptStats': prompt_stats,
+                'activityFingerprint': fingerprint,
+                'timings': timer.to_dict()
+            }
+        })
+        return new_report_ref.id
+
+    except RateLimitError:
+        # Rate-limited attempts are retried, so drop the report instead of storing an error
+        new_report_ref.delete()
+        raise
+    except Exception as e:
+        # If AI processing fails, update status to error
+        new_report_ref.update({
+            'status': 'error',
+            'error': str(e)
+        })
+        raise e
+    finally:
+        release_report_lease(db, lease_ref, new_report_ref.id)
+
+def collect_item_ids(value: Any, section: str, item_ids: List[str]) -> List[str]:
+    """Collect 'section:id' for every item with an id nested in report details."""
+    if isinstance(value, dict):
+        if 'id' in value:
+            item_ids.append(f"{section}:{value['id']}")
+        for key, child in value.items():
+            collect_item_ids(child, section, item_ids)
+    elif isinstance(value, list):
+        for child in value:
+            collect_item_ids(child, section, item_ids)
+    return item_ids
+
+def activity_fingerprint(report_details: Dict, report_stats: Dict) -> str:
+    """Hash the counts and item ids of a report period.
+    Timestamps, notes and video text are left out, so re-reading the same
+    activity gives the same fingerprint."""
+    item_ids = []
+    for section, value in report_details.items():
+        collect_item_ids(value, section, item_ids)
+    payload = json.dumps({'stats': report_stats, 'items': sorted(item_ids)}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# Report stats that describe the subject rather than activity in the period
+STATIC_REPORT_STATS = {'membersActive'}
+
+def has_no_activity(report_stats: Dict) -> bool:
+    """True when every activity count in the report stats is zero."""
+    return all(
+        has_no_activity(value) if isinstance(value, dict) else not value
+        for name, value in report_stats.items()
+        if name not in STATIC_REPORT_STATS
+    )
+
+def find_unchanged_report_body(db: Any, collection: str, owner_field: str, owner_ref: Any, report_type: str, report_details: Dict, report_stats: Dict) -> Tuple[str, Optional[Tuple[str, float, Dict]]]:
+    """Check whether a report can skip the LLM call.
+    
+    Returns (fingerprint, result) where result is (body, duration, prompt stats)
+    like the *_report_llm_response helpers when the most recent complete
+    report of the same type had the same fingerprint, and None when a new
+    report body has to be generated."""
+    fingerprint = activity_fingerprint(report_details, report_stats)
+    
+    previous_reports = (
+        db.collection(collection)
+        .where(owner_field, '==', owner_ref)
+        .where('type', '==', report_type)
+        .where('status', '==', 'complete')
+        .order_by('createdAt', direction=firestore.Query.DESCENDING)
+        .limit(1)
+        .get()
+    )
+    for previous_report in previous_reports:
+        previous_data = previous_report.to_dict().get('reportData', {})
+        if previous_data.get('promptStats', {}).get('llmOutcome') in LLM_FALLBACK_OUTCOMES:
+            # Fallback bodies are replaced by the next generated report
+            continue
+        if previous_data.get('activityFingerprint') == fingerprint:
+            return fingerprint, (
+                previous_data.get('body', ''),
+                0.0,
+                {**previous_data.get('promptStats', {}), 'reusedReportId': previous_report.id}
+            )
+    return fingerprint, None
+
+# Video fields read by progress reports; transcripts are never sent in report
+# prompts, so report loaders leave them out of video reads
+REPORT_FIELD_MASKS = {
+    'videos': [
+        'metadata.title',
+        'metadata.description',
+        'classification.explicit.description',
+        'classification.explicit.hashtags',
+    ]
+}
+
+def build_report_video_info(video_doc: Any) -> Dict:
+    """Extract the video fields used as LLM context in progress reports."""
+    video_data = video_doc.to_dict()
+    return {
+        'id': video_doc.id,
+        'title': video_data['metadata']['title'],
+        'description': video_data['metadata']['description'],
+        'description2': video_data['classification']['explicit']['description'],
+        'hashtags': video_data['classification']['explicit'].get('hashtags', [])
+    }
+
+def collect_user_report_data(db: Any, loader: DocumentLoader, user_ref: Any, start_date: datetime, end_date: datetime, timer: Optional[StageTimer] = None) -> Tuple[Dict, Dict]:
+    """Collect a user's activity for a progress report.
+    
+    The five range queries run concurrently and every referenced video is
+    resolved in one deduplicated batched fetch.
+    Returns a tuple of (report_details for the LLM, report_stats for reportData)."""
+    timer = timer or StageTimer()
+    with timer.stage('query'):
+        (
+            videos_watched_docs,
+            videos_liked_docs,
+            videos_bookmarked_docs,
+            classes_created_docs,
+            comprehension_docs
+        ) = run_concurrently(
+            # Videos watched in time period
+            lambda: (
+                db.collection('userViews')
+                .where('userId', '==', user_ref)
+                .where('watchedAt', '>=', start_date)
+                .where('watchedAt', '<=', end_date)
+            ).get(),
+            # Videos liked in time period
+            lambda: (
+                db.collection('userLikes')
                 .where('userId', '==', user_ref)
                 .where('likedAt', '>=', start_date)
                 .where('likedAt', '<=', end_date)
-            ).get()
-            videos_liked = len(videos_liked_docs)
-            
-            # Get the full video details for liked videos
-            liked_videos = []
-            for like_doc in videos_liked_docs:
-                like_data = like_doc.to_dict()
-                video_ref = like_data.get('videoId')
-                if video_ref:
-                    video_doc = video_ref.get()
-                    if video_doc.exists:
-                        video_data = video_doc.to_dict()
-                        liked_videos.append({
-                            'id': video_doc.id,
-                            'title': video_data['metadata']['title'],
-                            'description': video_data['metadata']['description'],
-                            'description2': video_data['classification']['explicit']['description'],
-                            'transcript': video_data['metadata'].get('transcript', ''),
-                            'hashtags': video_data['classification']['explicit'].get('hashtags', [])
-                        })
-
-            # Get videos bookmarked in time period
-            videos_bookmarked_docs = (
+            ).get(),
+            # Videos bookmarked in time period
+            lambda: (
                 db.collection('userBookmarks')
                 .where('userId', '==', user_ref)
                 .where('addedAt', '>=', start_date)
                 .where('addedAt', '<=', end_date)
-            ).get()
-            videos_bookmarked = len(videos_bookmarked_docs)
-            
-            # Get the full video details for bookmarked videos
-            bookmarked_videos = []
-            for bookmark_doc in videos_bookmarked_docs:
-                bookmark_data = bookmark_doc.to_dict()
-                video_ref = bookmark_data.get('videoId')
-                if video_ref:
-                    video_doc = video_ref.get()
-                    if video_doc.exists:
-                        video_data = video_doc.to_dict()
-                        bookmarked_videos.append({
-                            'id': video_doc.id,
-                            'title': video_data['metadata']['title'],
-                            'description': video_data['metadata']['description'],
-                            'description2': video_data['classification']['explicit']['description'],
-                            'transcript': video_data['metadata'].get('transcript', ''),
-                            'hashtags': video_data['classification']['explicit'].get('hashtags', []),
-                            'addedAt': bookmark_data.get('addedAt').isoformat(),
-                            'addedBy': bookmark_data.get('userId').path if bookmark_data.get('userId') else None,
-                            'notes': bookmark_data.get('notes', '')
-                        })
-
-            # Query classes created in time period
-            classes_created_docs = (
+            ).get(),
+            # Classes created in time period
+            lambda: (
                 db.collection('classes')
                 .where('creator', '==', user_ref)
                 .where('createdAt', '>=', start_date)
                 .where('createdAt', '<=', end_date)
-            ).get()
-            classes_created = len(classes_created_docs)
-            
-            # Get full details of created classes
-            created_classes = []
-            for class_doc in classes_created_docs:
-                class_data = class_doc.to_dict()
-                created_classes.append({
-                    'id': class_doc.id,
-                    'title': class_data['title'],
-                    'description': class_data['description'],
-                    'memberCount': class_data['memberCount'],
-                    'isPublic': class_data['isPublic'],
-                    'tagPreferences': class_data.get('tagPreferences', {})
-                })
-
-            # Query video comprehensions in time period
-            comprehension_docs = (
+            ).get(),
+            # Video comprehensions in time period
+            lambda: (
                 db.collection('videoComprehension')
                 .where('userId', '==', user_ref)
                 .where('assessedAt', '>=', start_date)
                 .where('assessedAt', '<=', end_date)
             ).get()
+        )
+    timer.count('docsRead', sum(len(docs) for docs in (
+        videos_watched_docs, videos_liked_docs, videos_bookmarked_docs, classes_created_docs, comprehension_docs
+    )))
+    
+    likes = [doc.to_dict() for doc in videos_liked_docs]
+    bookmarks = [doc.to_dict() for doc in videos_bookmarked_docs]
+    comprehensions = [doc.to_dict() for doc in comprehension_docs]
+    
+    # Resolve every referenced video in one batched fetch
+    video_docs = loader.get_all([
+        data.get('videoId') for data in likes + bookmarks + comprehensions
+    ])
+    
+    def resolve_video(data: Dict) -> Any:
+        video_ref = data.get('videoId')
+        return video_docs.get(video_ref.path) if video_ref else None
+    
+    # Full video details for liked videos
+    liked_videos = []
+    for like_data in likes:
+        video_doc = resolve_video(like_data)
+        if video_doc:
+            liked_videos.append(build_report_video_info(video_doc))
+    
+    # Full video details for bookmarked videos
+    bookmarked_videos = []
+    for bookmark_data in bookmarks:
+        video_doc = resolve_video(bookmark_data)
+        if video_doc:
+            bookmarked_videos.append({
+                **build_report_video_info(video_doc),
+                'addedAt': bookmark_data.get('addedAt').isoformat(),
+                'addedBy': bookmark_data.get('userId').path if bookmark_data.get('userId') else None,
+                'notes': bookmark_data.get('notes', '')
+            })
+    
+    # Full details of created classes
+    created_classes = []
+    for class_doc in classes_created_docs:
+        class_data = class_doc.to_dict()
+        created_classes.append({
+            'id': class_doc.id,
+            'title': class_data['title'],
+            'description': class_data['description'],
+            'memberCount': class_data['memberCount'],
+            'isPublic': class_data['isPublic'],
+            'tagPreferences': class_data.get('tagPreferences', {})
+        })
+    
+    # Comprehension stats and videos per level
+    comprehension_stats = {
+        'not_understood': 0,
+        'partially_understood': 0,
+        'fully_understood': 0
+    }
+    comprehension_videos = {
+        'not_understood': [],
+        'partially_understood': [],
+        'fully_understood': []
+    }
+    for comp_data in comprehensions:
+        level = comp_data.get('comprehensionLevel')
+        if level in comprehension_stats:
+            comprehension_stats[level] += 1
             
-            # Initialize comprehension stats and videos
-            comprehension_stats = {
-                'not_understood': 0,
-                'partially_understood': 0,
-                'fully_understood': 0
-            }
-            comprehension_videos = {
-                'not_understood': [],
-                'partially_understood': [],
-                'fully_understood': []
-            }
-            
-            # Process comprehension documents
-            for doc in comprehension_docs:
-                comp_data = doc.to_dict()
-                level = comp_data.get('comprehensionLevel')
-                if level in comprehension_stats:
-                    comprehension_stats[level] += 1
-                    
-                    # Get video details
-                    video_ref = comp_data.get('videoId')
-                    if video_ref:
-                        video_doc = video_ref.get()
-                        if video_doc.exists:
-                            video_data = video_doc.to_dict()
-                            video_info = {
-                                'id': video_doc.id,
-                                'title': video_data['metadata']['title'],
-                                'description': video_data['metadata']['description'],
-                                'description2': video_data['classification']['explicit']['description'],
-                                'transcript': video_data['metadata'].get('transcript', ''),
-                                'hashtags': video_data['classification']['explicit'].get('hashtags', []),
-                                'watchCount': comp_data.get('watchCount', 0),
-                                'assessedAt': comp_data.get('assessedAt').isoformat()
-                            }
-                            comprehension_videos[level].append(video_info)
-
-            # Store all the detailed data for LLM context
-            report_details = {
-                'videos_watched_count': videos_watched,
-                'liked_videos': liked_videos,
-                'bookmarked_videos': bookmarked_videos,
-                'created_classes': created_classes,
-                'comprehension_videos': comprehension_videos
+            video_doc = resolve_video(comp_data)
+            if video_doc:
+                comprehension_videos[level].append({
+                    **build_report_video_info(video_doc),
+                    'watchCount': comp_data.get('watchCount', 0),
+                    'assessedAt': comp_data.get('assessedAt').isoformat()
+                })
+    
+    # All the detailed data for LLM context
+    report_details = {
+        'videos_watched_count': len(videos_watched_docs),
+        'liked_videos': liked_videos,
+        'bookmarked_videos': bookmarked_videos,
+        'created_classes': created_classes,
+        'comprehension_videos': comprehension_videos
+    }
+    report_stats = {
+        'videosWatched': len(videos_watched_docs),
+        'videosLiked': len(videos_liked_docs),
+        'videosBookmarked': len(videos_bookmarked_docs),
+        'classesCreated': len(classes_created_docs),
+        'comprehension': comprehension_stats
+    }
+    return report_details, report_stats
+
+# Rollup fields reports read; the redelivery guard's eventIds are left out
+ROLLUP_REPORT_FIELDS = ['date', 'counts', 'ids']
+
+def fetch_user_rollups(db: Any, user_ref: Any, start_date: datetime, end_date: datetime) -> Tuple[List[Any], List[Any]]:
+    """Read a user's daily rollups and the classes they created in a window.
+    Returns (rollup_docs, classes_created_docs)."""
+    start_key, end_key = rollup_date_key(start_date), rollup_date_key(end_date)
+    return run_concurrently(
+        lambda: (
+            db.collection('userDailyActivity')
+            .where('userId', '==', user_ref)
+            .where('date', '>=', start_key)
+            .where('date', '<', end_key)
+            .select(ROLLUP_REPORT_FIELDS)
+        ).get(),
+        # Classes created in time period (few enough to read raw)
+        lambda: (
+            db.collection('classes')
+            .where('creator', '==', user_ref)
+            .where('createdAt', '>=', start_date)
+            .where('createdAt', '<=', end_date)
+        ).get()
+    )
+
+def fetch_class_rollups(db: Any, class_ref: Any, start_date: datetime, end_date: datetime) -> List[Any]:
+    """Read a class's daily rollups in a window."""
+    start_key, end_key = rollup_date_key(start_date), rollup_date_key(end_date)
+    return (
+        db.collection('classDailyActivity')
+        .where('classId', '==', class_ref)
+        .where('date', '>=', start_key)
+        .where('date', '<', end_key)
+        .select(ROLLUP_REPORT_FIELDS)
+    ).get()
+
+def as_utc(moment: datetime) -> datetime:
+    """Treat naive datetimes as UTC, like Firestore does, so they compare with stored timestamps."""
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+class ReportDataPass:
+    """One read of a subject's rollups over the widest due report window.
+    
+    Every report period inside the window is then cut out in memory, so all
+    due report types of a subject come from a single read pass."""
+    
+    def __init__(self, db: Any, subject_type: str, subject_ref: Any, start_date: datetime, end_date: datetime):
+        if subject_type == 'user':
+            self.rollup_docs, self.created_class_docs = fetch_user_rollups(db, subject_ref, start_date, end_date)
+        else:
+            self.rollup_docs, self.created_class_docs = fetch_class_rollups(db, subject_ref, start_date, end_date), []
+    
+    def rollups(self, start_date: datetime, end_date: datetime) -> List[Any]:
+        """Rollup docs of the whole UTC days from start_date up to (not including) end_date."""
+        start_key, end_key = rollup_date_key(start_date), rollup_date_key(end_date)
+        return [doc for doc in self.rollup_docs if start_key <= doc.get('date') < end_key]
+    
+    def classes_created(self, start_date: datetime, end_date: datetime) -> List[Any]:
+        """Classes the user created between start_date and end_date."""
+        start_date, end_date = as_utc(start_date), as_utc(end_date)
+        return [
+            doc for doc in self.created_class_docs
+            if start_date <= as_utc(doc.get('createdAt')) <= end_date
+        ]
+
+def collect_user_report_data_from_rollups(db: Any, loader: DocumentLoader, user_ref: Any, start_date: datetime, end_date: datetime, data_pass: Optional[ReportDataPass] = None, timer: Optional[StageTimer] = None) -> Tuple[Dict, Dict]:
+    """Collect a user's activity for a progress report from daily rollups.
+    
+    Reads at most one userDailyActivity doc per day instead of every raw event.
+    Rollups are day-granular, so the window covers whole UTC days from the
+    start date up to (not including) the end date. With a data_pass nothing is
+    queried; the period is cut out of the pass. Returns the same shape as
+    collect_user_report_data."""
+    timer = timer or StageTimer()
+    if data_pass:
+        rollup_docs = data_pass.rollups(start_date, end_date)
+        classes_created_docs = data_pass.classes_created(start_date, end_date)
+    else:
+        with timer.stage('query'):
+            rollup_docs, classes_created_docs = fetch_user_rollups(db, user_ref, start_date, end_date)
+        timer.count('docsRead', len(rollup_docs) + len(classes_created_docs))
+    counts, video_days = merge_daily_rollups(rollup_docs)
+
+    
+    # Resolve every referenced video in one batched fetch
+    video_docs = loader.get_all(
+        db.collection('videos').document(video_id)
+        for ids in video_days.values()
+        for video_id in ids
+    )
+    
+    def rollup_videos(list_name: str) -> List[Tuple[Any, str]]:
+        return [
+            (video_docs[f'videos/{video_id}'], day)
+            for video_id, day in video_days.get(list_name, {}).items()
+            if f'videos/{video_id}' in video_docs
+        ]
+    
+    liked_videos = [build_report_video_info(video_doc) for video_doc, _ in rollup_videos('liked')]
+    bookmarked_videos = [
+        {
+            **build_report_video_info(video_doc),
+            'addedAt': day,
+            'addedBy': user_ref.path,
+            'notes': ''
+        }
+        for video_doc, day in rollup_videos('bookmarked')
+    ]
+    
+    # Full details of created classes
+    created_classes = []
+    for class_doc in classes_created_docs:
+        class_data = class_doc.to_dict()
+        created_classes.append({
+            'id': class_doc.id,
+            'title': class_data['title'],
+            'description': class_data['description'],
+            'memberCount': class_data['memberCount'],
+            'isPublic': class_data['isPublic'],
+            'tagPreferences': class_data.get('tagPreferences', {})
+        })
+    
+    comprehension_stats = {level: counts.get(level, 0) for level in COMPREHENSION_LEVELS}
+    comprehension_videos = {
+        level: [
+            {
+                **build_report_video_info(video_doc),
+                'watchCount': 0,
+                'assessedAt': day
             }
+            for video_doc, day in rollup_videos(level)
+        ]
+        for level in COMPREHENSION_LEVELS
+    }
+    
+    # All the detailed data for LLM context
+    report_details = {
+        'videos_watched_count': counts.get('views', 0),
+        'liked_videos': liked_videos,
+        'bookmarked_videos': bookmarked_videos,
+        'created_classes': created_classes,
+        'comprehension_videos': comprehension_videos
+    }
+    report_stats = {
+        'videosWatched': counts.get('views', 0),
+        'videosLiked': counts.get('likes', 0),
+        'videosBookmarked': counts.get('bookmarks', 0),
+        'classesCreated': len(classes_created_docs),
+        'comprehension': comprehension_stats
+    }
+    return report_details, report_stats
 
-            # Generate LLM response
-            llm_response, llm_duration = user_report_llm_response(client, report_details, report_type)
-
-            # Update report with AI-generated content and complete status
-            new_report_ref.update({
-                'status': 'complete',
-                'reportData': {
-                    'videosWatched': videos_watched,
-                    'videosLiked': videos_liked,
-                    'videosBookmarked': videos_bookmarked,
-                    'classesCreated': classes_created,
-                    'comprehension': comprehension_stats,
-                    'body': llm_response,
-                    'llmDuration': llm_duration
-                }
-            })
+# Approximate token budget for the detailed-information part of report prompts
+REPORT_PROMPT_TOKEN_BUDGET = int(os.getenv('REPORT_PROMPT_TOKEN_BUDGET', '3000'))
 
-            return https_fn.Response(
-                json.dumps({
-                    'success': True,
-                    'reportId': new_report_ref.id
-                }),
-                headers=cors_headers,
-                content_type='application/json'
-            )
+# Number of topics listed when omitted items are collapsed into counts
+PROMPT_SUMMARY_TOPICS = 8
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+def item_topics(item: Dict, group_by: str) -> List[str]:
+    """Return the topics an item is grouped under (a list, the keys of a map, or a single value)."""
+    value = item.get(group_by)
+    if isinstance(value, (list, dict)):
+        return [str(topic).lower().lstrip('#') for topic in value]
+    return [str(value).lower()] if value else []
+
+def build_budgeted_prompt_details(sections: List[Dict], token_budget: int = REPORT_PROMPT_TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """Render report prompt sections within a token budget.
+    
+    Each section is a dict with:
+        label: str - heading line, e.g. "1. Videos you liked"
+        items: List[Dict] - full item dicts
+        fields: List[str] - item fields included in the prompt
+        group_by: str - item field used to collapse omitted items into topic counts
+    
+    The budget is shared between sections, with unused share passed on to
+    the others. Items are ranked so those on the section's most common topics
+    come first, then kept until the section's share is used. Omitted items are
+    collapsed into per-topic counts.
+    
+    Returns a tuple of (prompt text, truncation stats)."""
+    rendered_items = []
+    for section in sections:
+        topic_counts = Counter(
+            topic for item in section['items'] for topic in item_topics(item, section['group_by'])
+        )
+        ranked = sorted(
+            section['items'],
+            key=lambda item: -sum(topic_counts[topic] for topic in item_topics(item, section['group_by']))
+        )
+        rendered_items.append([
+            (item, json.dumps({field: item.get(field) for field in section['fields']}))
+            for item in ranked
+        ])
+    
+    # Give each section an equal share of what is left, smallest sections first,
+    # so sections that need less than their share pass the rest on
+    needed = [sum(estimate_tokens(text) + 1 for _, text in items) for items in rendered_items]
+    allotments = [0] * len(sections)
+    remaining_budget = token_budget
+    order = sorted(range(len(sections)), key=lambda i: needed[i])
+    for position, index in enumerate(order):
+        share = remaining_budget // (len(order) - position)
+        allotments[index] = min(needed[index], share)
+        remaining_budget -= allotments[index]
+    
+    lines = []
+    stats = {
+        'tokenBudget': token_budget,
+        'itemsTotal': 0,
+        'itemsIncluded': 0,
+        'sections': []
+    }
+    for section, items, allotment in zip(sections, rendered_items, allotments):
+        included = []
+        used_tokens = 0
+        for item, text in items:
+            item_tokens = estimate_tokens(text) + 1
+            if used_tokens + item_tokens > allotment:
+                break
+            included.append(text)
+            used_tokens += item_tokens
+        
+        omitted = [item for item, _ in items[len(included):]]
+        line = f"{section['label']}: [{', '.join(included)}]"
+        if omitted:
+            omitted_topics = Counter(
+                topic for item in omitted for topic in item_topics(item, section['group_by'])
+            ).most_common(PROMPT_SUMMARY_TOPICS)
+            topic_summary = ', '.join(f'{topic} ({count})' for topic, count in omitted_topics)
+            line += f"\n   ...and {len(omitted)} more not shown"
+            if topic_summary:
+                line += f", grouped by {section['group_by']}: {topic_summary}"
+        lines.append(line)
+        
+        stats['itemsTotal'] += len(items)
+        stats['itemsIncluded'] += len(included)
+        stats['sections'].append({
+            'label': section['label'],
+            'total': len(items),
+            'included': len(included)
+        })
+    
+    text = '\n'.join(lines)
+    stats['itemsOmitted'] = stats['itemsTotal'] - stats['itemsIncluded']
+    stats['estimatedTokens'] = estimate_tokens(text)
+    return text, stats
 
+# Model used for report and question generation
+LLM_MODEL = "gpt-4o-mini-2024-07-18"
+
+# Prompt template versions, part of the LLM cache key.
+# Bump a version whenever its prompt template changes.
+USER_REPORT_PROMPT_VERSION = 'user-report-v1'
+CLASS_REPORT_PROMPT_VERSION = 'class-report-v1'
+QUESTION_PROMPT_VERSION = 'question-v2'
+
+class LLMCache:
+    """Content-addressed cache for LLM responses.
+    
+    Keys hash the model, the prompt template version and the structured
+    inputs, so unchanged inputs reuse the stored response. Lookups hit an
+    in-process LRU tier first and fall back to the llmCache collection."""
+    
+    def __init__(self, max_memory_entries: int = 256, ttl: timedelta = timedelta(days=30)):
+        self.max_memory_entries = max_memory_entries
+        self.ttl = ttl
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(model: str, prompt_version: str, inputs: Any) -> str:
+        """Hash the model, template version and inputs into a cache key."""
+        payload = json.dumps(
+            {'model': model, 'promptVersion': prompt_version, 'inputs': inputs},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def _remember(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for a key, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        
+        try:
+            doc = firestore.client().collection('llmCache').document(key).get()
         except Exception as e:
-            # If AI processing fails, update status to error
-            new_report_ref.update({
-                'status': 'error',
-                'error': str(e)
+            print(f"Error reading LLM cache: {e}")
+            return None
+        if not doc.exists:
+            return None
+        
+        data = doc.to_dict()
+        expires_at = data.get('expiresAt')
+        if expires_at and expires_at < datetime.now(timezone.utc):
+            return None
+        self._remember(key, data.get('value'))
+        return data.get('value')
+    
+    def set(self, key: str, value: Any, model: str, prompt_version: str) -> None:
+        """Store a value in both tiers. Failures to persist are logged, not raised."""
+        self._remember(key, value)
+        now = datetime.now(timezone.utc)
+        try:
+            firestore.client().collection('llmCache').document(key).set({
+                'model': model,
+                'promptVersion': prompt_version,
+                'value': value,
+                'createdAt': now,
+                'expiresAt': now + self.ttl
             })
-            raise e
+        except Exception as e:
+            print(f"Error writing LLM cache: {e}")
 
-    except Exception as e:
-        return https_fn.Response(
-            json.dumps({'error': f'Error generating report: {str(e)}'}),
-            status=500,
-            headers=cors_headers,
-            content_type='application/json'
-        )
+# Shared by all requests handled by this instance
+llm_cache = LLMCache()
+
+# Seconds each LLM call site may take before its caller gets a fallback response
+LLM_DEADLINES = {
+    'question': float(os.getenv('LLM_DEADLINE_QUESTION', '10')),
+    'user_report': float(os.getenv('LLM_DEADLINE_USER_REPORT', '90')),
+    'class_report': float(os.getenv('LLM_DEADLINE_CLASS_REPORT', '90')),
+}
+
+# Hedging sends a second identical request when the first has been running
+# for the call site's p95 latency; the p95 needs this many recent samples
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Threads running LLM requests, shared by all call sites of this instance
+LLM_MAX_THREADS = int(os.getenv('LLM_MAX_THREADS', '64'))
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_THREADS, thread_name_prefix='llm')
+
+# Outcomes where the caller got a fallback instead of an LLM response
+LLM_FALLBACK_OUTCOMES = {'deadline', 'error'}
+
+class LLMCallStats:
+    """Per-instance latencies and outcome counts of LLM calls, by call site.
+    
+    Latencies of successful calls give the p95 hedge delay. Outcome counts and
+    latency sums are added to llmCallStats/{site}_{YYYY-MM-DD} at most every
+    flush_interval seconds; counts still in memory when an instance shuts
+    down are lost."""
+    
+    def __init__(self, window: int = 200, flush_interval: float = 60.0):
+        self.window = window
+        self.flush_interval = flush_interval
+        self._latencies: Dict[str, deque] = {}
+        self._pending: Dict[str, Counter] = {}
+        self._seconds: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def hedge_delay(self, site: str) -> Optional[float]:
+        """p95 latency of recent successful calls, or None with too few samples."""
+        with self._lock:
+            latencies = list(self._latencies.get(site, ()))
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(latencies, 95)
+    
+    def record(self, site: str, outcome: str, seconds: float) -> None:
+        with self._lock:
+            if outcome not in LLM_FALLBACK_OUTCOMES:
+                self._latencies.setdefault(site, deque(maxlen=self.window)).append(seconds)
+            self._pending.setdefault(site, Counter())[outcome] += 1
+            self._seconds[site] = self._seconds.get(site, 0.0) + seconds
+            if time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            pending, pending_seconds = self._pending, self._seconds
+            self._pending, self._seconds = {}, {}
+            self._last_flush = time.monotonic()
+        self._flush(pending, pending_seconds)
+    
+    def _flush(self, pending: Dict[str, Counter], pending_seconds: Dict[str, float]) -> None:
+        now = datetime.now(timezone.utc)
+        date_key = rollup_date_key(now)
+        try:
+            db = firestore.client()
+            batch = db.batch()
+            for site, outcomes in pending.items():
+                batch.set(db.collection('llmCallStats').document(f'{site}_{date_key}'), {
+                    'site': site,
+                    'date': date_key,
+                    'outcomes': {outcome: firestore.Increment(count) for outcome, count in outcomes.items()},
+                    'calls': firestore.Increment(sum(outcomes.values())),
+                    'totalSeconds': firestore.Increment(round(pending_seconds.get(site, 0.0), 3)),
+                    'updatedAt': now
+                }, merge=True)
+            batch.commit()
+        except Exception as e:
+            print(f"Error writing LLM call stats: {str(e)}")
+
+# Shared by all requests handled by this instance
+llm_call_stats = LLMCallStats()
+
+def call_llm_with_deadline(site: str, request: Callable[[threading.Event, bool], Any], fallback: Callable[[], Any], timer: Optional[StageTimer] = None) -> Tuple[Any, str]:
+    """Run an LLM request within the call site's deadline (LLM_DEADLINES).
+    
+    request(cancelled, hedged) makes the OpenAI call and returns its result;
+    cancelled is set once the result is no longer needed, so streaming
+    requests can stop reading, and hedged is True for the second request.
+    With LLM_HEDGE_ENABLED a second request starts when the first has run for
+    the site's p95 latency and the first to succeed wins. When the deadline
+    passes fallback() is returned instead. If every request fails the last
+    error is re-raised, so callers keep their error handling.
+    
+    Returns (result, outcome) with outcome 'primary', 'hedge' or 'deadline';
+    outcomes are recorded in llm_call_stats and the timer's llmHedged count."""
+    deadline = LLM_DEADLINES[site]
+    started = time.monotonic()
+    cancelled = threading.Event()
+    futures = {_llm_executor.submit(request, cancelled, False): 'primary'}
+    hedge_delay = llm_call_stats.hedge_delay(site) if LLM_HEDGE_ENABLED else None
+    error = None
+    
+    try:
+        while futures:
+            elapsed = time.monotonic() - started
+            if elapsed >= deadline:
+                break
+            timeout = deadline - elapsed
+            if hedge_delay is not None:
+                timeout = min(timeout, max(0.0, hedge_delay - elapsed))
+            
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if hedge_delay is not None and time.monotonic() - started >= hedge_delay:
+                    futures[_llm_executor.submit(request, cancelled, True)] = 'hedge'
+                    hedge_delay = None
+                    if timer:
+                        timer.count('llmHedged', 1)
+                continue
+            
+            for future in done:
+                outcome = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                llm_call_stats.record(site, outcome, time.monotonic() - started)
+                return result, outcome
+            # A failed first request is not hedged; the client already retried it
+            hedge_delay = None
+    finally:
+        cancelled.set()
+    
+    if not futures and error is not None:
+        llm_call_stats.record(site, 'error', time.monotonic() - started)
+        raise error
+    print(f"LLM call for {site} passed its {deadline}s deadline, using the fallback")
+    llm_call_stats.record(site, 'deadline', time.monotonic() - started)
+    return fallback(), 'deadline'
+
+def user_report_template_body(report_details: Dict, time_period_msg: str) -> str:
+    """Plain summary of a user's activity counts, stored when the LLM misses its deadline."""
+    comprehension = report_details['comprehension_videos']
+    return (
+        f"{time_period_msg}\n\n"
+        f"You watched {report_details['videos_watched_count']} videos, liked {len(report_details['liked_videos'])} "
+        f"and bookmarked {len(report_details['bookmarked_videos'])}, and created {len(report_details['created_classes'])} classes. "
+        f"You fully understood {len(comprehension['fully_understood'])} videos, partially understood "
+        f"{len(comprehension['partially_understood'])} and are still working on {len(comprehension['not_understood'])}.\n\n"
+        "A detailed analysis could not be generated in time. Request the report again to get one."
+    )
 
-def user_report_llm_response(client: OpenAI, report_details: Dict, report_type: str = 'custom') -> tuple[str, float]:
-    """Generate an LLM response for user progress report."""
+def user_report_llm_response(client: OpenAI, report_details: Dict, report_type: str = 'custom', timer: Optional[StageTimer] = None, on_partial: Optional[Callable[[str], None]] = None) -> tuple[str, float, Dict]:
+    """Generate an LLM response for user progress report.
+    Returns a tuple of (response text, LLM duration in seconds, prompt truncation stats).
+    The completion is streamed; on_partial is called with the text so far as it arrives."""
     
+    timer = timer or StageTimer()
     start_time = datetime.now()
     
     # Get the appropriate time period message based on report type
@@ -1237,6 +2371,29 @@ def user_report_llm_response(client: OpenAI, report_details: Dict, report_type:
         'custom': "Here's your learning progress report for this period."
     }.get(report_type, "Here's your learning progress report for this period.")
     
+    # Fit the detailed information into the prompt token budget
+    details_text, prompt_stats = build_budgeted_prompt_details([
+        {'label': '1. Videos you liked', 'items': report_details['liked_videos'], 'fields': ['title', 'description'], 'group_by': 'hashtags'},
+        {'label': '2. Videos you bookmarked', 'items': report_details['bookmarked_videos'], 'fields': ['title', 'description'], 'group_by': 'hashtags'},
+        {'label': '3. Classes you created', 'items': report_details['created_classes'], 'fields': ['title', 'description', 'memberCount'], 'group_by': 'tagPreferences'},
+        {'label': "4. Videos you're still working to understand", 'items': report_details['comprehension_videos']['not_understood'], 'fields': ['title', 'description'], 'group_by': 'hashtags'},
+        {'label': "5. Videos you're getting better at", 'items': report_details['comprehension_videos']['partially_understood'], 'fields': ['title', 'description'], 'group_by': 'hashtags'},
+        {'label': "6. Videos you've mastered", 'items': report_details['comprehension_videos']['fully_understood'], 'fields': ['title', 'description'], 'group_by': 'hashtags'}
+    ])
+    
+    # Reuse the stored response when the same inputs were reported before
+    cache_key = LLMCache.make_key(LLM_MODEL, USER_REPORT_PROMPT_VERSION, {
+        'reportType': report_type,
+        'videosWatched': report_details['videos_watched_count'],
+        'details': details_text
+    })
+    cached_body = llm_cache.get(cache_key)
+    prompt_stats['cacheHit'] = cached_body is not None
+    if cached_body is not None:
+        prompt_stats['llmOutcome'] = 'cached'
+        timer.add('prompt', (datetime.now() - start_time).total_seconds())
+        return cached_body, 0.0, prompt_stats
+    
     # Format the prompt with report details
     prompt = f"""You are an AI learning assistant providing a personal progress report directly to a user. Use "you" and "your" when referring to their activities.
 Your tone should be encouraging, supportive, and motivating - celebrate their achievements and frame areas for improvement positively.
@@ -1255,12 +2412,7 @@ Activity Summary:
   * Fully Understood: {len(report_details['comprehension_videos']['fully_understood'])} videos
 
 Detailed Information:
-1. Videos you liked: {json.dumps([{'title': v['title'], 'description': v['description']} for v in report_details['liked_videos']], indent=2)}
-2. Videos you bookmarked: {json.dumps([{'title': v['title'], 'description': v['description']} for v in report_details['bookmarked_videos']], indent=2)}
-3. Classes you created: {json.dumps([{'title': c['title'], 'description': c['description'], 'memberCount': c['memberCount']} for c in report_details['created_classes']], indent=2)}
-4. Videos you're still working to understand: {json.dumps([{'title': v['title'], 'description': v['description']} for v in report_details['comprehension_videos']['not_understood']], indent=2)}
-5. Videos you're getting better at: {json.dumps([{'title': v['title'], 'description': v['description']} for v in report_details['comprehension_videos']['partially_understood']], indent=2)}
-6. Videos you've mastered: {json.dumps([{'title': v['title'], 'description': v['description']} for v in report_details['comprehension_videos']['fully_understood']], indent=2)}
+{details_text}
 
 Please provide:
 1. An encouraging summary of their learning activity and engagement, using "you" and "your"
@@ -1271,24 +2423,43 @@ Please provide:
 
 Keep the response personal, encouraging, and actionable. Focus on their progress and potential."""
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
+    timer.add('prompt', (datetime.now() - start_time).total_seconds())
+    
+    def request(cancelled: threading.Event, hedged: bool) -> str:
+        response = client.with_options(timeout=LLM_DEADLINES['user_report']).chat.completions.create(
+            model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "You are an AI learning assistant providing insights on user learning progress."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=1000
+            max_tokens=1000,
+            stream=True,
+            stream_options={'include_usage': True}
         )
+        # Only the first request streams partial bodies
+        return read_completion_stream(response, timer, None if hedged else on_partial, cancelled)
+    
+    try:
+        with timer.stage('llm'):
+            body, prompt_stats['llmOutcome'] = call_llm_with_deadline(
+                'user_report', request, lambda: user_report_template_body(report_details, time_period_msg), timer
+            )
         
         end_time = datetime.now()
         duration_seconds = (end_time - start_time).total_seconds()
         
-        return response.choices[0].message.content, duration_seconds
-        
+        if prompt_stats['llmOutcome'] not in LLM_FALLBACK_OUTCOMES:
+            llm_cache.set(cache_key, body, LLM_MODEL, USER_REPORT_PROMPT_VERSION)
+        return body, duration_seconds, prompt_stats
+    
+    except RateLimitError:
+        # Let the caller back off and retry instead of storing a fallback body
+        raise
     except Exception as e:
-        return "Error generating report analysis. Please try again later.", 0.0
+        print(f"Error generating user report analysis, storing the error message as the body: {str(e)}")
+        prompt_stats['llmOutcome'] = 'error'
+        return "Error generating report analysis. Please try again later.", 0.0, prompt_stats
 
 @https_fn.on_request()
 def generate_class_report(req: https_fn.Request) -> https_fn.Response:
@@ -1318,33 +2489,16 @@ def generate_class_report(req: https_fn.Request) -> https_fn.Response:
     token = auth_header.split('Bearer ')[1]
     
     try:
-        # First try to verify as a Firebase ID token (for app calls)
+        # Firebase ID token for app calls, or a Google Cloud token for internal calls
         try:
-            decoded_token = auth.verify_id_token(token)
-            user_id = decoded_token['uid']
-        except Exception as firebase_error:
-            # If Firebase verification fails, verify as a Google Cloud token
-            try:
-                import google.auth.transport.requests
-                import google.oauth2.id_token
-                
-                auth_req = google.auth.transport.requests.Request()
-                
-                # Verify the token against Google Cloud
-                decoded_token = google.oauth2.id_token.verify_token(
-                    token,
-                    auth_req,
-                    audience=None  # or your specific function URL
-                )
-                # For internal calls, we'll trust the Cloud Platform
-                user_id = 'service-account'
-            except Exception as cloud_error:
-                return https_fn.Response(
-                    json.dumps({'error': f'Unauthorized - Invalid token. Firebase error: {str(firebase_error)}. Cloud error: {str(cloud_error)}'}),
-                    status=401,
-                    headers=cors_headers,
-                    content_type='application/json'
-                )
+            user_id = verify_request_token(token, 'generate_class_report')
+        except Exception as token_error:
+            return https_fn.Response(
+                json.dumps({'error': f'Unauthorized - Invalid token. {str(token_error)}'}),
+                status=401,
+                headers=cors_headers,
+                content_type='application/json'
+            )
     except Exception as e:
         return https_fn.Response(
             json.dumps({'error': f'Authentication error: {str(e)}'}),
@@ -1362,10 +2516,8 @@ def generate_class_report(req: https_fn.Request) -> https_fn.Response:
             content_type='application/json'
         )
     
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    
-    # Rest of your existing code...
+    # Shared OpenAI client
+    client = get_openai_client()
 
     try:
         # Parse request body
@@ -1416,204 +2568,352 @@ def generate_class_report(req: https_fn.Request) -> https_fn.Response:
         # Initialize Firestore
         db = firestore.client()
         
-        # Check for in-progress reports
-        class_ref = db.collection('classes').document(class_id)
-        in_progress_reports = (
-            db.collection('classProgressReports')
-            .where('classId', '==', class_ref)
-            .where('status', '==', 'in_progress')
-            .limit(1)
-            .get()
-        )
-        
-        if len(in_progress_reports) > 0:
-            return https_fn.Response(
-                json.dumps({
-                    'error': 'A report is already being generated for this class',
-                    'reportId': in_progress_reports[0].id
-                }),
-                status=409,  # Conflict
-                headers=cors_headers,
-                content_type='application/json'
-            )
-        
-        # Create report document with generated ID and initial in_progress status
-        new_report_ref = db.collection('classProgressReports').document()
+        report_id = run_class_report(db, client, class_id, start_date, end_date, report_type, stream_partial_body=True)
         
-        # Create initial report data
-        report_data = {
-            'classId': class_ref,
-            'createdAt': datetime.now(),
-            'startDate': datetime.fromisoformat(start_time),
-            'endDate': datetime.fromisoformat(end_time),
-            'type': report_type,
-            'status': 'in_progress'
-        }
+        return https_fn.Response(
+            json.dumps({
+                'success': True,
+                'reportId': report_id,
+                'noActivity': report_id is None
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+    except ReportInProgressError as e:
+        return https_fn.Response(
+            json.dumps({
+                'error': str(e),
+                'reportId': e.report_id
+            }),
+            status=409,  # Conflict
+            headers=cors_headers,
+            content_type='application/json'
+        )
 
-        # Set the initial data
-        new_report_ref.set(report_data)
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error generating report: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
 
-        try:
-            # Query data for the time period
-            start_date = datetime.fromisoformat(start_time)
-            end_date = datetime.fromisoformat(end_time)
-            
-            # Get class details
-            class_doc = class_ref.get()
-            if not class_doc.exists:
-                raise Exception(f"Class {class_id} not found")
-            
-            class_data = class_doc.to_dict()
-            active_members = class_data.get('memberCount', 0)
-            class_details = {
-                'id': class_doc.id,
-                'title': class_data.get('title', ''),
-                'description': class_data.get('description', ''),
-                'memberCount': active_members,
-                'isPublic': class_data.get('isPublic', True),
-                'creator': class_data.get('creator', {}).path if class_data.get('creator') else None
+def run_class_report(db: Any, client: OpenAI, class_id: str, start_date: datetime, end_date: datetime, report_type: str, data_pass: Optional['ReportDataPass'] = None, stream_partial_body: bool = False) -> Optional[str]:
+    """Generate and store a class progress report. Returns the report ID, or
+    None when the period had no activity and no report was stored.
+    Same contract as run_user_report."""
+    timer = StageTimer()
+    
+    # Take the lease for this class and period and create the in_progress report
+    class_ref = db.collection('classes').document(class_id)
+    with timer.stage('write'):
+        new_report_ref, lease_ref = start_leased_report(db, 'class', class_ref, start_date, end_date, report_type)
+
+    try:
+        # Collect the class's activity in the time period
+        loader = DocumentLoader(db, timer=timer, field_masks=REPORT_FIELD_MASKS)
+        # Rollups are only read once they hold the whole period; until the
+        # backfill reaches its start, the raw activity is read instead
+        use_rollups = (data_pass is not None or report_type in ROLLUP_REPORT_TYPES) and rollups_cover(db, start_date)
+        if use_rollups and data_pass:
+            report_details, report_stats = collect_class_report_data_from_rollups(db, loader, class_ref, start_date, end_date, data_pass, timer)
+        elif use_rollups:
+            report_details, report_stats = collect_class_report_data_from_rollups(db, loader, class_ref, start_date, end_date, timer=timer)
+        else:
+            report_details, report_stats = collect_class_report_data(db, loader, class_ref, start_date, end_date, timer)
+
+        # Periods without activity get no report, rather than a placeholder one
+        if has_no_activity(report_stats):
+            new_report_ref.delete()
+            return None
+
+        # Reuse the last report when the activity has not changed, otherwise generate a new one
+        with timer.stage('query'):
+            fingerprint, unchanged = find_unchanged_report_body(
+                db, 'classProgressReports', 'classId', class_ref, report_type, report_details, report_stats
+            )
+        if unchanged:
+            llm_response, llm_duration, prompt_stats = unchanged
+        else:
+            # Stream the body into the report document as it is generated
+            partial_writer = ThrottledReportWriter(new_report_ref, report_stats) if stream_partial_body else None
+            try:
+                llm_response, llm_duration, prompt_stats = class_report_llm_response(
+                    client, report_details, report_type, timer, partial_writer
+                )
+            finally:
+                # A stream left running after a deadline or hedge must not overwrite the final body
+                if partial_writer:
+                    partial_writer.close()
+            if partial_writer:
+                timer.count('partialWrites', partial_writer.writes)
+
+        # Update report with AI-generated content and complete status
+        new_report_ref.update({
+            'status': 'complete',
+            'reportData': {
+                **report_stats,
+                'body': llm_response,
+                'llmDuration': llm_duration,
+                'promptStats': prompt_stats,
+                'activityFingerprint': fingerprint,
+                'timings': timer.to_dict()
             }
-            
-            # Get members who joined in the time period
-            members_joined_docs = (
-                db.collection('classMembership')
-                .where('classId', '==', class_ref)
+        })
+        return new_report_ref.id
+
+    except RateLimitError:
+        # Rate-limited attempts are retried, so drop the report instead of storing an error
+        new_report_ref.delete()
+        raise
+    except Exception as e:
+        # If AI processing fails, update status to error
+        new_report_ref.update({
+            'status': 'error',
+            'error': str(e)
+        })
+        raise e
+    finally:
+        release_report_lease(db, lease_ref, new_report_ref.id)
+
+def collect_class_report_data(db: Any, loader: DocumentLoader, class_ref: Any, start_date: datetime, end_date: datetime, timer: Optional[StageTimer] = None) -> Tuple[Dict, Dict]:
+    """Collect a class's activity for a progress report.
+    
+    The membership, like and bookmark range queries run concurrently with the
+    class read, and member and video references are resolved through the
+    request's document loader in one batched fetch.
+    Returns a tuple of (report_details for the LLM, report_stats for reportData)."""
+    timer = timer or StageTimer()
+    with timer.stage('query'):
+        (
+            class_doc,
+            members_joined_docs,
+            videos_liked_docs,
+            videos_bookmarked_docs
+        ) = run_concurrently(
+            # Class details
+            lambda: loader.get(class_ref),
+            # Members who joined in the time period
+            lambda: (
+                db.collection('classMembership')
+                .where('classId', '==', class_ref)
                 .where('joinedAt', '>=', start_date)
                 .where('joinedAt', '<=', end_date)
-            ).get()
-            members_joined = len(members_joined_docs)
-            
-            # Get member details
-            joined_members = []
-            for member_doc in members_joined_docs:
-                member_data = member_doc.to_dict()
-                user_ref = member_data.get('userId')
-                if user_ref:
-                    user_doc = user_ref.get()
-                    if user_doc.exists:
-                        user_data = user_doc.to_dict()
-                        profile = user_data.get('profile', {})
-                        joined_members.append({
-                            'id': user_doc.id,
-                            'displayName': profile.get('displayName', ''),
-                            'biography': profile.get('biography', ''),
-                            'email': user_data.get('email', ''),
-                            'joinedAt': member_data.get('joinedAt').isoformat(),
-                            'role': member_data.get('role', 'follower'),
-                            'onboardingCompleted': user_data.get('onboardingCompleted', False)
-                        })
-            
-            # Get videos liked in time period
-            videos_liked_docs = (
+            ).get(),
+            # Videos liked in time period
+            lambda: (
                 db.collection('userLikes')
                 .where('classId', 'array_contains', class_ref)
                 .where('likedAt', '>=', start_date)
                 .where('likedAt', '<=', end_date)
-            ).get()
-            videos_liked = len(videos_liked_docs)
-            
-            # Get video details for liked videos
-            liked_videos = []
-            for like_doc in videos_liked_docs:
-                like_data = like_doc.to_dict()
-                video_ref = like_data.get('videoId')
-                if video_ref:
-                    video_doc = video_ref.get()
-                    if video_doc.exists:
-                        video_data = video_doc.to_dict()
-                        liked_videos.append({
-                            'id': video_doc.id,
-                            'title': video_data['metadata']['title'],
-                            'description': video_data['metadata']['description'],
-                            'description2': video_data['classification']['explicit']['description'],
-                            'transcript': video_data['metadata'].get('transcript', ''),
-                            'hashtags': video_data['classification']['explicit'].get('hashtags', []),
-                            'likedAt': like_data.get('likedAt').isoformat(),
-                            'likedBy': like_data.get('userId').path if like_data.get('userId') else None
-                        })
-            
-            # Get videos bookmarked in time period
-            videos_bookmarked_docs = (
+            ).get(),
+            # Videos bookmarked in time period
+            lambda: (
                 db.collection('userBookmarks')
                 .where('classId', 'array_contains', class_ref)
                 .where('addedAt', '>=', start_date)
                 .where('addedAt', '<=', end_date)
             ).get()
-            videos_bookmarked = len(videos_bookmarked_docs)
-            
-            # Get video details for bookmarked videos
-            bookmarked_videos = []
-            for bookmark_doc in videos_bookmarked_docs:
-                bookmark_data = bookmark_doc.to_dict()
-                video_ref = bookmark_data.get('videoId')
-                if video_ref:
-                    video_doc = video_ref.get()
-                    if video_doc.exists:
-                        video_data = video_doc.to_dict()
-                        bookmarked_videos.append({
-                            'id': video_doc.id,
-                            'title': video_data['metadata']['title'],
-                            'description': video_data['metadata']['description'],
-                            'description2': video_data['classification']['explicit']['description'],
-                            'transcript': video_data['metadata'].get('transcript', ''),
-                            'hashtags': video_data['classification']['explicit'].get('hashtags', []),
-                            'addedAt': bookmark_data.get('addedAt').isoformat(),
-                            'addedBy': bookmark_data.get('userId').path if bookmark_data.get('userId') else None,
-                            'notes': bookmark_data.get('notes', '')
-                        })
-
-            # Store all the detailed data for LLM context
-            report_details = {
-                'class': class_details,
-                'joined_members': joined_members,
-                'liked_videos': liked_videos,
-                'bookmarked_videos': bookmarked_videos
-            }
-
-            # Generate LLM response
-            llm_response, llm_duration = class_report_llm_response(client, report_details, report_type)
-
-            # Update report with AI-generated content and complete status
-            new_report_ref.update({
-                'status': 'complete',
-                'reportData': {
-                    'membersActive': active_members,
-                    'membersJoined': members_joined,
-                    'videosLiked': videos_liked,
-                    'videosBookmarked': videos_bookmarked,
-                    'body': llm_response,
-                    'llmDuration': llm_duration
-                }
+        )
+    timer.count('docsRead', len(members_joined_docs) + len(videos_liked_docs) + len(videos_bookmarked_docs))
+    
+    if not class_doc:
+        raise Exception(f"Class {class_ref.id} not found")
+    
+    class_data = class_doc.to_dict()
+    active_members = class_data.get('memberCount', 0)
+    class_details = {
+        'id': class_doc.id,
+        'title': class_data.get('title', ''),
+        'description': class_data.get('description', ''),
+        'memberCount': active_members,
+        'isPublic': class_data.get('isPublic', True),
+        'creator': class_data.get('creator', {}).path if class_data.get('creator') else None
+    }
+    
+    memberships = [doc.to_dict() for doc in members_joined_docs]
+    likes = [doc.to_dict() for doc in videos_liked_docs]
+    bookmarks = [doc.to_dict() for doc in videos_bookmarked_docs]
+    
+    # Resolve members and videos in one batched fetch
+    loader.prime(data.get('userId') for data in memberships)
+    loader.prime(data.get('videoId') for data in likes + bookmarks)
+    loader.flush()
+    
+    # Member details
+    joined_members = []
+    for member_data in memberships:
+        user_doc = loader.get(member_data.get('userId'))
+        if user_doc:
+            user_data = user_doc.to_dict()
+            profile = user_data.get('profile', {})
+            joined_members.append({
+                'id': user_doc.id,
+                'displayName': profile.get('displayName', ''),
+                'biography': profile.get('biography', ''),
+                'email': user_data.get('email', ''),
+                'joinedAt': member_data.get('joinedAt').isoformat(),
+                'role': member_data.get('role', 'follower'),
+                'onboardingCompleted': user_data.get('onboardingCompleted', False)
+            })
+    
+    # Video details for liked videos
+    liked_videos = []
+    for like_data in likes:
+        video_doc = loader.get(like_data.get('videoId'))
+        if video_doc:
+            liked_videos.append({
+                **build_report_video_info(video_doc),
+                'likedAt': like_data.get('likedAt').isoformat(),
+                'likedBy': like_data.get('userId').path if like_data.get('userId') else None
+            })
+    
+    # Video details for bookmarked videos
+    bookmarked_videos = []
+    for bookmark_data in bookmarks:
+        video_doc = loader.get(bookmark_data.get('videoId'))
+        if video_doc:
+            bookmarked_videos.append({
+                **build_report_video_info(video_doc),
+                'addedAt': bookmark_data.get('addedAt').isoformat(),
+                'addedBy': bookmark_data.get('userId').path if bookmark_data.get('userId') else None,
+                'notes': bookmark_data.get('notes', '')
             })
+    
+    # All the detailed data for LLM context
+    report_details = {
+        'class': class_details,
+        'joined_members': joined_members,
+        'liked_videos': liked_videos,
+        'bookmarked_videos': bookmarked_videos
+    }
+    report_stats = {
+        'membersActive': active_members,
+        'membersJoined': len(members_joined_docs),
+        'videosLiked': len(videos_liked_docs),
+        'videosBookmarked': len(videos_bookmarked_docs)
+    }
+    return report_details, report_stats
 
-            return https_fn.Response(
-                json.dumps({
-                    'success': True,
-                    'reportId': new_report_ref.id
-                }),
-                headers=cors_headers,
-                content_type='application/json'
+def collect_class_report_data_from_rollups(db: Any, loader: DocumentLoader, class_ref: Any, start_date: datetime, end_date: datetime, data_pass: Optional[ReportDataPass] = None, timer: Optional[StageTimer] = None) -> Tuple[Dict, Dict]:
+    """Collect a class's activity for a progress report from daily rollups.
+    
+    Reads at most one classDailyActivity doc per day instead of every raw
+    event, over whole UTC days like collect_user_report_data_from_rollups.
+    Returns the same shape as collect_class_report_data."""
+    timer = timer or StageTimer()
+    if data_pass:
+        class_doc, rollup_docs = loader.get(class_ref), data_pass.rollups(start_date, end_date)
+    else:
+        with timer.stage('query'):
+            class_doc, rollup_docs = run_concurrently(
+                lambda: loader.get(class_ref),
+                lambda: fetch_class_rollups(db, class_ref, start_date, end_date)
             )
-
-        except Exception as e:
-            # If AI processing fails, update status to error
-            new_report_ref.update({
-                'status': 'error',
-                'error': str(e)
+        timer.count('docsRead', len(rollup_docs))
+    
+    if not class_doc:
+        raise Exception(f"Class {class_ref.id} not found")
+    
+    class_data = class_doc.to_dict()
+    active_members = class_data.get('memberCount', 0)
+    class_details = {
+        'id': class_doc.id,
+        'title': class_data.get('title', ''),
+        'description': class_data.get('description', ''),
+        'memberCount': active_members,
+        'isPublic': class_data.get('isPublic', True),
+        'creator': class_data.get('creator', {}).path if class_data.get('creator') else None
+    }
+    
+    counts, ids_by_day = merge_daily_rollups(rollup_docs)
+    member_ids = list(ids_by_day.get('members', {}).keys())
+    
+    # Resolve members, their memberships and videos in one batched fetch
+    docs = loader.get_all(
+        [db.collection('users').document(user_id) for user_id in member_ids]
+        + [db.collection('classMembership').document(f'{user_id}_{class_ref.id}') for user_id in member_ids]
+        + [
+            db.collection('videos').document(video_id)
+            for list_name in ('liked', 'bookmarked')
+            for video_id in ids_by_day.get(list_name, {})
+        ]
+    )
+    
+    # Member details
+    joined_members = []
+    for user_id in member_ids:
+        user_doc = docs.get(f'users/{user_id}')
+        if user_doc:
+            user_data = user_doc.to_dict()
+            profile = user_data.get('profile', {})
+            membership_doc = docs.get(f'classMembership/{user_id}_{class_ref.id}')
+            member_data = membership_doc.to_dict() if membership_doc else {}
+            joined_at = member_data.get('joinedAt')
+            joined_members.append({
+                'id': user_doc.id,
+                'displayName': profile.get('displayName', ''),
+                'biography': profile.get('biography', ''),
+                'email': user_data.get('email', ''),
+                'joinedAt': joined_at.isoformat() if joined_at else ids_by_day['members'][user_id],
+                'role': member_data.get('role', 'follower'),
+                'onboardingCompleted': user_data.get('onboardingCompleted', False)
+            })
+    
+    # Video details for liked and bookmarked videos
+    liked_videos = []
+    for video_id, day in ids_by_day.get('liked', {}).items():
+        video_doc = docs.get(f'videos/{video_id}')
+        if video_doc:
+            liked_videos.append({
+                **build_report_video_info(video_doc),
+                'likedAt': day,
+                'likedBy': None
+            })
+    
+    bookmarked_videos = []
+    for video_id, day in ids_by_day.get('bookmarked', {}).items():
+        video_doc = docs.get(f'videos/{video_id}')
+        if video_doc:
+            bookmarked_videos.append({
+                **build_report_video_info(video_doc),
+                'addedAt': day,
+                'addedBy': None,
+                'notes': ''
             })
-            raise e
+    
+    # All the detailed data for LLM context
+    report_details = {
+        'class': class_details,
+        'joined_members': joined_members,
+        'liked_videos': liked_videos,
+        'bookmarked_videos': bookmarked_videos
+    }
+    report_stats = {
+        'membersActive': active_members,
+        'membersJoined': counts.get('membersJoined', 0),
+        'videosLiked': counts.get('likes', 0),
+        'videosBookmarked': counts.get('bookmarks', 0)
+    }
+    return report_details, report_stats
 
-    except Exception as e:
-        return https_fn.Response(
-            json.dumps({'error': f'Error generating report: {str(e)}'}),
-            status=500,
-            headers=cors_headers,
-            content_type='application/json'
-        )
+def class_report_template_body(report_details: Dict, time_period_msg: str) -> str:
+    """Plain summary of a class's activity counts, stored when the LLM misses its deadline."""
+    return (
+        f"{time_period_msg}\n\n"
+        f"{report_details['class']['title']} has {report_details['class']['memberCount']} members. "
+        f"{len(report_details['joined_members'])} members joined, and members liked {len(report_details['liked_videos'])} "
+        f"and bookmarked {len(report_details['bookmarked_videos'])} videos.\n\n"
+        "A detailed analysis could not be generated in time. Request the report again to get one."
+    )
 
-def class_report_llm_response(client: OpenAI, report_details: Dict, report_type: str = 'custom') -> tuple[str, float]:
-    """Generate an LLM response for class progress report."""
+def class_report_llm_response(client: OpenAI, report_details: Dict, report_type: str = 'custom', timer: Optional[StageTimer] = None, on_partial: Optional[Callable[[str], None]] = None) -> tuple[str, float, Dict]:
+    """Generate an LLM response for class progress report.
+    Returns a tuple of (response text, LLM duration in seconds, prompt truncation stats).
+    The completion is streamed; on_partial is called with the text so far as it arrives."""
     
+    timer = timer or StageTimer()
     start_time = datetime.now()
     
     # Get the appropriate time period message based on report type
@@ -1625,6 +2925,26 @@ def class_report_llm_response(client: OpenAI, report_details: Dict, report_type:
         'custom': "Here's your class's progress report for this period."
     }.get(report_type, "Here's your class's progress report for this period.")
     
+    # Fit the detailed information into the prompt token budget
+    details_text, prompt_stats = build_budgeted_prompt_details([
+        {'label': '1. New members who joined your class', 'items': report_details['joined_members'], 'fields': ['displayName', 'biography', 'joinedAt', 'role'], 'group_by': 'role'},
+        {'label': '2. Videos your class members liked', 'items': report_details['liked_videos'], 'fields': ['title', 'description', 'hashtags', 'likedAt', 'likedBy'], 'group_by': 'hashtags'},
+        {'label': '3. Videos your class members bookmarked', 'items': report_details['bookmarked_videos'], 'fields': ['title', 'description', 'hashtags', 'addedAt', 'addedBy', 'notes'], 'group_by': 'hashtags'}
+    ])
+    
+    # Reuse the stored response when the same inputs were reported before
+    cache_key = LLMCache.make_key(LLM_MODEL, CLASS_REPORT_PROMPT_VERSION, {
+        'reportType': report_type,
+        'class': report_details['class'],
+        'details': details_text
+    })
+    cached_body = llm_cache.get(cache_key)
+    prompt_stats['cacheHit'] = cached_body is not None
+    if cached_body is not None:
+        prompt_stats['llmOutcome'] = 'cached'
+        timer.add('prompt', (datetime.now() - start_time).total_seconds())
+        return cached_body, 0.0, prompt_stats
+    
     # Format the prompt with report details
     prompt = f"""You are an AI learning assistant providing a class progress report to the class creator/instructor.
 Your tone should be encouraging and constructive, highlighting successes while providing actionable insights for improvement.
@@ -1644,29 +2964,7 @@ Activity Summary:
 - Videos Your Class Members Bookmarked: {len(report_details['bookmarked_videos'])} videos
 
 Detailed Information:
-1. New members who joined your class: {json.dumps([{
-    'displayName': m['displayName'],
-    'biography': m['biography'],
-    'joinedAt': m['joinedAt'],
-    'role': m['role']
-} for m in report_details['joined_members']], indent=2)}
-
-2. Videos your class members liked: {json.dumps([{
-    'title': v['title'],
-    'description': v['description'],
-    'hashtags': v['hashtags'],
-    'likedAt': v['likedAt'],
-    'likedBy': v['likedBy']
-} for v in report_details['liked_videos']], indent=2)}
-
-3. Videos your class members bookmarked: {json.dumps([{
-    'title': v['title'],
-    'description': v['description'],
-    'hashtags': v['hashtags'],
-    'addedAt': v['addedAt'],
-    'addedBy': v['addedBy'],
-    'notes': v['notes']
-} for v in report_details['bookmarked_videos']], indent=2)}
+{details_text}
 
 Please provide:
 1. An encouraging summary of your class's activity and engagement
@@ -1678,42 +2976,700 @@ Please provide:
 
 Keep the response personal, encouraging, and actionable. Focus on the class's progress and potential."""
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
+    timer.add('prompt', (datetime.now() - start_time).total_seconds())
+    
+    def request(cancelled: threading.Event, hedged: bool) -> str:
+        response = client.with_options(timeout=LLM_DEADLINES['class_report']).chat.completions.create(
+            model=LLM_MODEL,
             messages=[
                 {"role": "system", "content": "You are an AI learning assistant providing insights on class progress and engagement."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=1000
+            max_tokens=1000,
+            stream=True,
+            stream_options={'include_usage': True}
         )
+        # Only the first request streams partial bodies
+        return read_completion_stream(response, timer, None if hedged else on_partial, cancelled)
+    
+    try:
+        with timer.stage('llm'):
+            body, prompt_stats['llmOutcome'] = call_llm_with_deadline(
+                'class_report', request, lambda: class_report_template_body(report_details, time_period_msg), timer
+            )
         
         end_time = datetime.now()
         duration_seconds = (end_time - start_time).total_seconds()
         
-        return response.choices[0].message.content, duration_seconds
+        if prompt_stats['llmOutcome'] not in LLM_FALLBACK_OUTCOMES:
+            llm_cache.set(cache_key, body, LLM_MODEL, CLASS_REPORT_PROMPT_VERSION)
+        return body, duration_seconds, prompt_stats
+    
+    except RateLimitError:
+        # Let the caller back off and retry instead of storing a fallback body
+        raise
+    except Exception as e:
+        print(f"Error generating class report analysis, storing the error message as the body: {str(e)}")
+        prompt_stats['llmOutcome'] = 'error'
+        return "Error generating report analysis. Please try again later.", 0.0, prompt_stats
+
+# Minimum seconds between partial report body writes while a completion streams
+# (Firestore sustains about one write per second to a single document)
+REPORT_STREAM_WRITE_INTERVAL = float(os.getenv('REPORT_STREAM_WRITE_INTERVAL', '1.0'))
+
+def read_completion_stream(stream: Any, timer: StageTimer, on_partial: Optional[Callable[[str], None]] = None, cancelled: Optional[threading.Event] = None) -> str:
+    """Collect a streamed chat completion into its full text.
+    Records the time to first content and token usage on the timer and
+    passes the text so far to on_partial after each content chunk. Reading
+    stops, and the stream is closed, once cancelled is set."""
+    stream_started = time.perf_counter()
+    parts = []
+    for chunk in stream:
+        if cancelled is not None and cancelled.is_set():
+            stream.close()
+            break
+        # The final chunk carries usage and no choices
+        if chunk.usage:
+            timer.count('promptTokens', chunk.usage.prompt_tokens)
+            timer.count('completionTokens', chunk.usage.completion_tokens)
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        if not parts:
+            timer.record('firstContentSeconds', time.perf_counter() - stream_started)
+        parts.append(chunk.choices[0].delta.content)
+        if on_partial:
+            on_partial(''.join(parts))
+    return ''.join(parts)
+
+class ThrottledReportWriter:
+    """Writes the partial body of an in-progress report while its completion streams.
+    
+    The first content is written right away, later text at most every
+    REPORT_STREAM_WRITE_INTERVAL seconds. The app finds the in_progress report
+    through its progress screen and renders the body in the report detail
+    screen as it arrives. The report stays in_progress; the final body is
+    written when it completes. Failed partial writes are logged and skipped.
+    
+    A cancelled or timed-out stream can still deliver text after the LLM helper
+    has returned, so close() must be called before the final write: it waits
+    for a partial write in flight and drops every later one."""
+    
+    def __init__(self, report_ref: Any, report_stats: Dict, interval: float = REPORT_STREAM_WRITE_INTERVAL):
+        self.report_ref = report_ref
+        self.report_stats = report_stats
+        self.interval = interval
+        self.writes = 0
+        self._last_write = None
+        self._closed = False
+        self._lock = threading.Lock()
+    
+    def __call__(self, text: str) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            now = time.perf_counter()
+            if self._last_write is not None and now - self._last_write < self.interval:
+                return
+            self._last_write = now
+            try:
+                self.report_ref.update({
+                    'reportData': {
+                        **self.report_stats,
+                        'body': text
+                    }
+                })
+                self.writes += 1
+            except Exception as e:
+                print(f"Error writing partial report body: {str(e)}")
+    
+    def close(self) -> None:
+        """Stop writing partial bodies, after any write in flight has landed."""
+        with self._lock:
+            self._closed = True
+
+# Report types that read daily rollups instead of raw events
+ROLLUP_REPORT_TYPES = {'weekly', 'monthly', 'yearly'}
+
+# Maximum number of ids kept per list in a single daily rollup document
+ROLLUP_MAX_IDS = 50
+
+# Trigger event ids kept per daily rollup document to skip redelivered events
+ROLLUP_MAX_EVENT_IDS = int(os.getenv('ROLLUP_MAX_EVENT_IDS', '200'))
+
+COMPREHENSION_LEVELS = ['not_understood', 'partially_understood', 'fully_understood']
+
+# Active subjects per day are spread over this many activityIndex docs to
+# stay under Firestore's per-document write rate
+ACTIVITY_INDEX_SHARDS = int(os.getenv('ACTIVITY_INDEX_SHARDS', '10'))
+
+# activityIndex field that lists the owners of each rollup collection
+ACTIVITY_INDEX_FIELDS = {
+    'userDailyActivity': 'userIds',
+    'classDailyActivity': 'classIds'
+}
+
+def rollup_date_key(moment: datetime) -> str:
+    """Return the UTC day key (YYYY-MM-DD) a timestamp belongs to.
+    Naive datetimes are treated as UTC, like Firestore does."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y-%m-%d')
+
+def merge_daily_rollups(rollup_docs: List[Any]) -> Tuple[Dict[str, int], Dict[str, Dict[str, str]]]:
+    """Sum the counts of daily rollup docs and merge their id lists.
+    Returns (counts, ids) where ids maps each list name to {id: first day seen}."""
+    counts = {}
+    ids = {}
+    for doc in sorted(rollup_docs, key=lambda d: d.get('date')):
+        data = doc.to_dict()
+        for name, value in data.get('counts', {}).items():
+            counts[name] = counts.get(name, 0) + value
+        for name, values in data.get('ids', {}).items():
+            merged = ids.setdefault(name, {})
+            for value in values:
+                merged.setdefault(value, data['date'])
+    return counts, ids
+
+def update_daily_rollup(db: Any, collection: str, owner_field: str, owner_ref: Any, moment: datetime, counts: Dict[str, int], ids: Dict[str, List[str]], event_id: Optional[str] = None, removed_ids: Optional[Dict[str, List[str]]] = None) -> None:
+    """Add counts and ids to an owner's rollup doc for the day of `moment`.
+    Id lists are capped at ROLLUP_MAX_IDS; counts keep growing past the cap.
+    The first rollup of the day also records the owner in the activity index.
+    
+    Firestore triggers are delivered at least once, so with an event_id the
+    update is skipped when that event was already applied to the doc (the
+    last ROLLUP_MAX_EVENT_IDS are kept). Negative counts and removed_ids take
+    an earlier contribution back out; counts stop at zero, and a day without
+    a rollup doc is left alone."""
+    date_key = rollup_date_key(moment)
+    rollup_ref = db.collection(collection).document(f'{owner_ref.id}_{date_key}')
+    
+    @firestore.transactional
+    def apply_update(transaction):
+        snapshot = rollup_ref.get(transaction=transaction)
+        if not snapshot.exists and not any(value > 0 for value in counts.values()):
+            return False
+        data = snapshot.to_dict() if snapshot.exists else {}
         
+        event_ids = list(data.get('eventIds', []))
+        if event_id:
+            if event_id in event_ids:
+                return False
+            event_ids = (event_ids + [event_id])[-ROLLUP_MAX_EVENT_IDS:]
+        
+        new_counts = dict(data.get('counts', {}))
+        for name, value in counts.items():
+            new_counts[name] = max(new_counts.get(name, 0) + value, 0)
+        
+        new_ids = dict(data.get('ids', {}))
+        for name, values in (removed_ids or {}).items():
+            new_ids[name] = [value for value in new_ids.get(name, []) if value not in values]
+        for name, values in ids.items():
+            current = list(new_ids.get(name, []))
+            for value in values:
+                if value not in current and len(current) < ROLLUP_MAX_IDS:
+                    current.append(value)
+            new_ids[name] = current
+        
+        transaction.set(rollup_ref, {
+            owner_field: owner_ref,
+            'date': date_key,
+            'counts': new_counts,
+            'ids': new_ids,
+            'eventIds': event_ids,
+            'updatedAt': datetime.now(timezone.utc)
+        })
+        return not snapshot.exists
+    
+    if apply_update(db.transaction()):
+        index_active_subject(db, ACTIVITY_INDEX_FIELDS[collection], owner_ref.id, date_key)
+
+def activity_index_shard(subject_id: str) -> int:
+    """Stable shard number for a subject id (Python's hash() is salted per process)."""
+    return int(hashlib.md5(subject_id.encode()).hexdigest(), 16) % ACTIVITY_INDEX_SHARDS
+
+def index_active_subject(db: Any, field: str, subject_id: str, date_key: str) -> None:
+    """Add a user or class id to the activity index of a day."""
+    index_ref = db.collection('activityIndex').document(f'{date_key}_{activity_index_shard(subject_id)}')
+    index_ref.set({
+        'date': date_key,
+        field: firestore.ArrayUnion([subject_id]),
+        'updatedAt': datetime.now(timezone.utc)
+    }, merge=True)
+
+def scan_active_report_subjects(db: Any, start_time: datetime, end_time: datetime) -> Tuple[List[str], List[str]]:
+    """Return (user_ids, class_ids) with activity between start_time and end_time
+    from the raw userViews, userLikes and userBookmarks docs of the window."""
+    views, likes, bookmarks = run_concurrently(*[
+        lambda collection=collection, field=field: (
+            db.collection(collection)
+            .where(field, '>=', start_time)
+            .where(field, '<=', end_time)
+        ).get()
+        for collection, field in (('userViews', 'watchedAt'), ('userLikes', 'likedAt'), ('userBookmarks', 'addedAt'))
+    ])
+    user_ids = set()
+    class_ids = set()
+    for doc in views + likes + bookmarks:
+        data = doc.to_dict()
+        if data.get('userId'):
+            user_ids.add(data['userId'].id)
+        # classId is an array in userLikes and userBookmarks
+        class_ids.update(class_ref.id for class_ref in data.get('classId', []) or [] if class_ref)
+    return sorted(user_ids), sorted(class_ids)
+
+def get_active_report_subjects(db: Any, start_time: datetime, end_time: datetime) -> Tuple[List[str], List[str]]:
+    """Return (user_ids, class_ids) with any activity between start_time and end_time.
+    
+    Reads the activityIndex docs of every day the window touches, so subjects
+    active earlier on the first day or later on the last day are included too.
+    Until the index covers start_time (see rollups_cover), the raw activity of
+    the window is scanned instead."""
+    if not rollups_cover(db, start_time):
+        return scan_active_report_subjects(db, start_time, end_time)
+    
+    index_docs = (
+        db.collection('activityIndex')
+        .where('date', '>=', rollup_date_key(start_time))
+        .where('date', '<=', rollup_date_key(end_time))
+        .get()
+    )
+    user_ids = set()
+    class_ids = set()
+    for doc in index_docs:
+        data = doc.to_dict()
+        user_ids.update(data.get('userIds', []))
+        class_ids.update(data.get('classIds', []))
+    return sorted(user_ids), sorted(class_ids)
+
+def rollup_class_activity(db: Any, before: Optional[Dict], after: Dict, moment: datetime, count_name: str, list_name: str, event_id: Optional[str] = None) -> None:
+    """Add a like or bookmark to the rollups of every class it was newly made in.
+    Classes are added to an existing doc with arrayUnion, so only the class refs
+    missing from the previous version of the doc are counted."""
+    previous = {ref.path for ref in (before or {}).get('classId', []) or [] if ref}
+    video_ref = after.get('videoId')
+    for class_ref in after.get('classId', []) or []:
+        if not class_ref or class_ref.path in previous:
+            continue
+        update_daily_rollup(
+            db, 'classDailyActivity', 'classId', class_ref, moment,
+            {count_name: 1},
+            {list_name: [video_ref.id]} if video_ref else {},
+            event_id
+        )
+
+@firestore_fn.on_document_created(document="userViews/{viewId}")
+def rollup_user_view(event: firestore_fn.Event[firestore_fn.DocumentSnapshot]) -> None:
+    """Count a video view in the viewer's daily rollup."""
+    data = event.data.to_dict() if event.data else None
+    if not data or not data.get('userId'):
+        return
+    
+    db = firestore.client()
+    moment = data.get('watchedAt') or datetime.now(timezone.utc)
+    update_daily_rollup(db, 'userDailyActivity', 'userId', data['userId'], moment, {'views': 1}, {}, event.id)
+
+@firestore_fn.on_document_written(document="userLikes/{likeId}")
+def rollup_user_like(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot]]) -> None:
+    """Count a like in the user's and classes' daily rollups.
+    The user counts once when the doc is created; classes count as they are added to it."""
+    before = event.data.before.to_dict() if event.data.before else None
+    after = event.data.after.to_dict() if event.data.after else None
+    if not after or not after.get('userId'):
+        return
+    
+    db = firestore.client()
+    moment = after.get('likedAt') or datetime.now(timezone.utc)
+    if not before:
+        video_ref = after.get('videoId')
+        update_daily_rollup(
+            db, 'userDailyActivity', 'userId', after['userId'], moment,
+            {'likes': 1},
+            {'liked': [video_ref.id]} if video_ref else {},
+            event.id
+        )
+    rollup_class_activity(db, before, after, moment, 'likes', 'liked', event.id)
+
+@firestore_fn.on_document_written(document="userBookmarks/{bookmarkId}")
+def rollup_user_bookmark(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot]]) -> None:
+    """Count a bookmark in the user's and classes' daily rollups.
+    The user counts once when the doc is created; classes count as they are added to it."""
+    before = event.data.before.to_dict() if event.data.before else None
+    after = event.data.after.to_dict() if event.data.after else None
+    if not after or not after.get('userId'):
+        return
+    
+    db = firestore.client()
+    moment = after.get('addedAt') or datetime.now(timezone.utc)
+    if not before:
+        video_ref = after.get('videoId')
+        update_daily_rollup(
+            db, 'userDailyActivity', 'userId', after['userId'], moment,
+            {'bookmarks': 1},
+            {'bookmarked': [video_ref.id]} if video_ref else {},
+            event.id
+        )
+    rollup_class_activity(db, before, after, moment, 'bookmarks', 'bookmarked', event.id)
+
+def comprehension_contribution(data: Optional[Dict]) -> Optional[Tuple[datetime, str, Optional[str]]]:
+    """Return the (assessedAt, level, video id) a videoComprehension doc counts
+    as in its user's rollups, or None when it does not count."""
+    if not data or not data.get('userId') or not data.get('assessedAt'):
+        return None
+    level = data.get('comprehensionLevel')
+    if level not in COMPREHENSION_LEVELS:
+        return None
+    video_ref = data.get('videoId')
+    return data['assessedAt'], level, video_ref.id if video_ref else None
+
+@firestore_fn.on_document_written(document="videoComprehension/{comprehensionId}")
+def rollup_video_comprehension(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot]]) -> None:
+    """Keep a user's daily rollups counting each comprehension doc once, at its
+    current level on the day it was last assessed, like the raw-query reports.
+    Comprehension docs are upserted, so a re-assessment moves the count from
+    the previous level and day to the new ones."""
+    before = event.data.before.to_dict() if event.data.before else None
+    after = event.data.after.to_dict() if event.data.after else None
+    old, new = comprehension_contribution(before), comprehension_contribution(after)
+    if old == new:
+        return
+    
+    db = firestore.client()
+    user_ref = (after if new else before)['userId']
+    if old and new and rollup_date_key(old[0]) == rollup_date_key(new[0]):
+        # Same day: move the count between levels in one update
+        counts = {old[1]: -1}
+        counts[new[1]] = counts.get(new[1], 0) + 1
+        update_daily_rollup(
+            db, 'userDailyActivity', 'userId', user_ref, new[0], counts,
+            {new[1]: [new[2]]} if new[2] else {},
+            event.id,
+            {old[1]: [old[2]]} if old[2] else {}
+        )
+        return
+    if old:
+        update_daily_rollup(
+            db, 'userDailyActivity', 'userId', user_ref, old[0], {old[1]: -1}, {},
+            event.id,
+            {old[1]: [old[2]]} if old[2] else {}
+        )
+    if new:
+        update_daily_rollup(
+            db, 'userDailyActivity', 'userId', user_ref, new[0], {new[1]: 1},
+            {new[1]: [new[2]]} if new[2] else {},
+            event.id
+        )
+
+@firestore_fn.on_document_created(document="classMembership/{membershipId}")
+def rollup_class_membership(event: firestore_fn.Event[firestore_fn.DocumentSnapshot]) -> None:
+    """Count a new member in the class's daily rollup."""
+    data = event.data.to_dict() if event.data else None
+    if not data or not data.get('classId'):
+        return
+    
+    db = firestore.client()
+    moment = data.get('joinedAt') or datetime.now(timezone.utc)
+    user_ref = data.get('userId')
+    update_daily_rollup(
+        db, 'classDailyActivity', 'classId', data['classId'], moment,
+        {'membersJoined': 1},
+        {'members': [user_ref.id]} if user_ref else {},
+        event.id
+    )
+
+# Days of raw activity one backfill_activity_rollups call rebuilds by default, and at most
+ROLLUP_BACKFILL_DAYS = int(os.getenv('ROLLUP_BACKFILL_DAYS', '30'))
+ROLLUP_BACKFILL_MAX_DAYS = 90
+
+# Raw activity collections the rollups are built from, with the timestamp
+# field that decides the day each doc counts on
+ROLLUP_SOURCES = {
+    'userViews': 'watchedAt',
+    'userLikes': 'likedAt',
+    'userBookmarks': 'addedAt',
+    'videoComprehension': 'assessedAt',
+    'classMembership': 'joinedAt'
+}
+
+# coveredFrom once the backfill has reached the oldest raw activity
+ROLLUP_COVERAGE_ALL = '0001-01-01'
+
+# Seconds a function instance reuses its last read of the rollup coverage
+ROLLUP_COVERAGE_CACHE_SECONDS = int(os.getenv('ROLLUP_COVERAGE_CACHE_SECONDS', '300'))
+_rollup_coverage = {'coveredFrom': None, 'readAt': None}
+_rollup_coverage_lock = threading.Lock()
+
+def get_rollup_coverage(db: Any) -> Optional[str]:
+    """Return the first UTC day (YYYY-MM-DD) from which the daily rollups and
+    the activity index hold all activity, or None before the backfill has run.
+    Read from activityRollupState/coverage and cached per instance."""
+    now = time.monotonic()
+    with _rollup_coverage_lock:
+        if _rollup_coverage['readAt'] is not None and now - _rollup_coverage['readAt'] < ROLLUP_COVERAGE_CACHE_SECONDS:
+            return _rollup_coverage['coveredFrom']
+    snapshot = db.collection('activityRollupState').document('coverage').get()
+    covered_from = snapshot.get('coveredFrom') if snapshot.exists else None
+    with _rollup_coverage_lock:
+        _rollup_coverage.update({'coveredFrom': covered_from, 'readAt': now})
+    return covered_from
+
+def rollups_cover(db: Any, start_date: datetime) -> bool:
+    """Whether the rollups and the activity index hold all activity from start_date on.
+    The triggers fill them from deploy time and backfill_activity_rollups before
+    that; until the backfill has reached start_date, callers read raw activity."""
+    covered_from = get_rollup_coverage(db)
+    return covered_from is not None and covered_from <= rollup_date_key(start_date)
+
+def collect_raw_rollups(db: Any, start_date: datetime, end_date: datetime) -> Dict[str, Dict]:
+    """Build the daily rollups of the raw activity between start_date and
+    (not including) end_date, counting each doc the way the rollup triggers do.
+    Returns a dict mapping rollup doc path to its collection, owner, date, counts and ids."""
+    views, likes, bookmarks, comprehensions, memberships = run_concurrently(*[
+        lambda collection=collection, field=field: (
+            db.collection(collection)
+            .where(field, '>=', start_date)
+            .where(field, '<', end_date)
+        ).get()
+        for collection, field in ROLLUP_SOURCES.items()
+    ])
+    
+    rollups = {}
+    def add(collection: str, owner_field: str, owner_ref: Any, moment: datetime, counts: Dict[str, int], ids: Dict[str, List[str]]) -> None:
+        date_key = rollup_date_key(moment)
+        rollup = rollups.setdefault(f'{collection}/{owner_ref.id}_{date_key}', {
+            'collection': collection,
+            'ownerField': owner_field,
+            'ownerRef': owner_ref,
+            'date': date_key,
+            'counts': {},
+            'ids': {}
+        })
+        for name, value in counts.items():
+            rollup['counts'][name] = rollup['counts'].get(name, 0) + value
+        for name, values in ids.items():
+            current = rollup['ids'].setdefault(name, [])
+            for value in values:
+                if value not in current and len(current) < ROLLUP_MAX_IDS:
+                    current.append(value)
+    
+    for doc in views:
+        data = doc.to_dict()
+        if data.get('userId'):
+            add('userDailyActivity', 'userId', data['userId'], data['watchedAt'], {'views': 1}, {})
+    for docs, field, count_name, list_name in (
+        (likes, 'likedAt', 'likes', 'liked'),
+        (bookmarks, 'addedAt', 'bookmarks', 'bookmarked')
+    ):
+        for doc in docs:
+            data = doc.to_dict()
+            video_ref = data.get('videoId')
+            ids = {list_name: [video_ref.id]} if video_ref else {}
+            if data.get('userId'):
+                add('userDailyActivity', 'userId', data['userId'], data[field], {count_name: 1}, ids)
+            for class_ref in data.get('classId', []) or []:
+                if class_ref:
+                    add('classDailyActivity', 'classId', class_ref, data[field], {count_name: 1}, ids)
+    for doc in comprehensions:
+        data = doc.to_dict()
+        contribution = comprehension_contribution(data)
+        if contribution:
+            moment, level, video_id = contribution
+            add('userDailyActivity', 'userId', data['userId'], moment, {level: 1}, {level: [video_id]} if video_id else {})
+    for doc in memberships:
+        data = doc.to_dict()
+        if data.get('classId'):
+            user_ref = data.get('userId')
+            add('classDailyActivity', 'classId', data['classId'], data['joinedAt'], {'membersJoined': 1}, {'members': [user_ref.id]} if user_ref else {})
+    return rollups
+
+def rebuild_activity_rollups(db: Any, start_date: datetime, end_date: datetime) -> int:
+    """Replace the daily rollups and activity index of the UTC days from
+    start_date up to (not including) end_date with ones rebuilt from raw
+    activity. Both dates must be UTC midnights. Rebuilt docs start without
+    eventIds, so only days whose trigger events have all been delivered
+    should be rebuilt. Returns the number of rollup docs written."""
+    rollups = collect_raw_rollups(db, start_date, end_date)
+    start_key, end_key = rollup_date_key(start_date), rollup_date_key(end_date)
+    now = datetime.now(timezone.utc)
+    
+    # Rollups of these days that no raw activity backs any more are removed
+    writes = [
+        (doc.reference, None)
+        for collection in ACTIVITY_INDEX_FIELDS
+        for doc in (
+            db.collection(collection)
+            .where('date', '>=', start_key)
+            .where('date', '<', end_key)
+            .select(['date'])
+        ).get()
+        if doc.reference.path not in rollups
+    ]
+    index = {}
+    for path, rollup in rollups.items():
+        writes.append((db.collection(rollup['collection']).document(f"{rollup['ownerRef'].id}_{rollup['date']}"), {
+            rollup['ownerField']: rollup['ownerRef'],
+            'date': rollup['date'],
+            'counts': rollup['counts'],
+            'ids': rollup['ids'],
+            'eventIds': [],
+            'updatedAt': now
+        }))
+        index_id = f"{rollup['date']}_{activity_index_shard(rollup['ownerRef'].id)}"
+        index.setdefault(index_id, {'userIds': set(), 'classIds': set()})[
+            ACTIVITY_INDEX_FIELDS[rollup['collection']]
+        ].add(rollup['ownerRef'].id)
+    
+    # Every index shard of every rebuilt day is rewritten, or removed when empty
+    day = start_date
+    while day < end_date:
+        date_key = rollup_date_key(day)
+        for shard in range(ACTIVITY_INDEX_SHARDS):
+            entry = index.get(f'{date_key}_{shard}')
+            writes.append((db.collection('activityIndex').document(f'{date_key}_{shard}'), {
+                'date': date_key,
+                'userIds': sorted(entry['userIds']),
+                'classIds': sorted(entry['classIds']),
+                'updatedAt': now
+            } if entry else None))
+        day += timedelta(days=1)
+    
+    for i in range(0, len(writes), 500):
+        batch = db.batch()
+        for doc_ref, data in writes[i:i + 500]:
+            if data is None:
+                batch.delete(doc_ref)
+            else:
+                batch.set(doc_ref, data)
+        batch.commit()
+    return len(rollups)
+
+@https_fn.on_request(timeout_sec=540)
+def backfill_activity_rollups(req: https_fn.Request) -> https_fn.Response:
+    """Rebuild daily rollups and the activity index from raw activity, working
+    back in time. Restricted to internal service calls.
+    
+    Body: {days?: int}. Each call rebuilds the days before the oldest covered
+    day (before today on the first call) and moves activityRollupState/coverage
+    back to them; call it again until the response has done: true. Start once
+    the rollup triggers have been deployed for a full UTC day, so the first
+    rebuilt days have no trigger events left to deliver."""
+    cors_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Max-Age': '3600',
+    }
+    
+    # Handle OPTIONS request (preflight)
+    if req.method == 'OPTIONS':
+        return https_fn.Response('', headers=cors_headers, status=204)
+    
+    # Verify authentication
+    auth_header = req.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return https_fn.Response(
+            json.dumps({'error': 'Unauthorized - Invalid token format'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    token = auth_header.split('Bearer ')[1]
+    
+    try:
+        caller_id = verify_request_token(token, 'backfill_activity_rollups')
+        if caller_id != 'service-account':
+            return https_fn.Response(
+                json.dumps({'error': 'Unauthorized - Service access required'}),
+                status=403,
+                headers=cors_headers,
+                content_type='application/json'
+            )
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Authentication error: {str(e)}'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    try:
+        request_json = req.get_json(silent=True) or {}
+        days = int(request_json.get('days', ROLLUP_BACKFILL_DAYS))
+        if not 1 <= days <= ROLLUP_BACKFILL_MAX_DAYS:
+            return https_fn.Response(
+                json.dumps({'error': f'At most {ROLLUP_BACKFILL_MAX_DAYS} days per call'}),
+                status=400,
+                headers=cors_headers,
+                content_type='application/json'
+            )
+        
+        db = firestore.client()
+        coverage_ref = db.collection('activityRollupState').document('coverage')
+        coverage = coverage_ref.get()
+        covered_from = coverage.get('coveredFrom') if coverage.exists else None
+        rollups = 0
+        if covered_from != ROLLUP_COVERAGE_ALL:
+            if covered_from:
+                end_date = datetime.strptime(covered_from, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            else:
+                end_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            start_date = end_date - timedelta(days=days)
+            rollups = rebuild_activity_rollups(db, start_date, end_date)
+            
+            # Done once no raw activity is older than the rebuilt days
+            older = run_concurrently(*[
+                lambda collection=collection, field=field: (
+                    db.collection(collection).where(field, '<', start_date).limit(1)
+                ).get()
+                for collection, field in ROLLUP_SOURCES.items()
+            ])
+            covered_from = rollup_date_key(start_date) if any(older) else ROLLUP_COVERAGE_ALL
+            coverage_ref.set({'coveredFrom': covered_from, 'updatedAt': datetime.now(timezone.utc)})
+            with _rollup_coverage_lock:
+                _rollup_coverage['readAt'] = None
+        
+        return https_fn.Response(
+            json.dumps({
+                'success': True,
+                'rollups': rollups,
+                'coveredFrom': covered_from,
+                'done': covered_from == ROLLUP_COVERAGE_ALL
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
     except Exception as e:
-        return "Error generating report analysis. Please try again later.", 0.0
+        print(f"Error backfilling activity rollups: {str(e)}")
+        return https_fn.Response(
+            json.dumps({'error': f'Error backfilling activity rollups: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
 
-def get_report_types_and_dates() -> Tuple[str, datetime, datetime]:
-    """Determine which report type to generate based on current date.
-    Returns a tuple of (report_type, start_date, end_date).
+# 'single' generates only the highest-priority due report type per run,
+# 'multi' generates every due type from one shared data pass per subject
+REPORT_PERIOD_MODE = os.getenv('REPORT_PERIOD_MODE', 'single')
+
+def get_due_report_periods() -> List[Tuple[str, datetime, datetime]]:
+    """Return every report period due today as (report_type, start_date, end_date),
+    highest priority first.
     
     Priority order:
     1. Yearly (January 1st)
     2. Monthly (1st of any month)
     3. Weekly (Mondays)
-    4. Daily (default)
+    4. Daily (every day)
     """
     now = datetime.now()
+    periods = []
     
     # Check if it's first day of the year
     if now.month == 1 and now.day == 1:
         yearly_end = now
         yearly_start = datetime(now.year - 1, 1, 1)
-        return ('yearly', yearly_start, yearly_end)
+        periods.append(('yearly', yearly_start, yearly_end))
     
     # Check if it's first of the month
     if now.day == 1:
@@ -1723,74 +3679,653 @@ def get_report_types_and_dates() -> Tuple[str, datetime, datetime]:
         else:
             monthly_start = datetime(now.year, now.month - 1, 1)
         monthly_end = now
-        return ('monthly', monthly_start, monthly_end)
+        periods.append(('monthly', monthly_start, monthly_end))
     
     # Check if it's Monday
     if now.weekday() == 0:
         weekly_end = now
         weekly_start = weekly_end - timedelta(days=7)
-        return ('weekly', weekly_start, weekly_end)
+        periods.append(('weekly', weekly_start, weekly_end))
     
-    # Default to daily report
+    # Daily reports are always due
     daily_end = now
     daily_start = daily_end - timedelta(days=1)
-    return ('daily', daily_start, daily_end)
+    periods.append(('daily', daily_start, daily_end))
+    return periods
 
-async def trigger_user_report(session: aiohttp.ClientSession, function_url_base: str, user_doc: Any, report_type: str, start_time: datetime, end_time: datetime, auth_header: Dict[str, str]) -> None:
-    """Trigger report generation for a single user."""
+def get_report_types_and_dates() -> Tuple[str, datetime, datetime]:
+    """Determine which report type to generate based on current date.
+    Returns a tuple of (report_type, start_date, end_date) for the
+    highest-priority due period."""
+    return get_due_report_periods()[0]
+
+def run_reports_for_periods(db: Any, client: OpenAI, subject_type: str, subject_id: str, periods: List[Dict], report_ids: Dict[str, str]) -> str:
+    """Generate every due report of a subject from one shared data pass.
+    
+    periods is a list of {type, startDate, endDate}. The subject's rollups are
+    read once over the widest window and cut into each period in memory, once
+    the rollups cover that window.
+    Generated report IDs are stored in report_ids by type, and types already
+    there are skipped, so a retry after a rate limit does not duplicate
+    reports. Returns the IDs of stored reports joined by commas (periods
+    without activity store none). Raises
+    ReportInProgressError after the other periods when any period's report
+    is already in progress, so the job is retried for it."""
+    collection = 'users' if subject_type == 'user' else 'classes'
+    run_report = run_user_report if subject_type == 'user' else run_class_report
+    window_start = min(period['startDate'] for period in periods)
+    # Before the rollups cover the window, each report reads raw activity
+    data_pass = ReportDataPass(
+        db, subject_type, db.collection(collection).document(subject_id),
+        window_start,
+        max(period['endDate'] for period in periods)
+    ) if rollups_cover(db, window_start) else None
+    
+    in_progress = []
+    for period in periods:
+        if period['type'] in report_ids:
+            continue
+        try:
+            report_ids[period['type']] = run_report(
+                db, client, subject_id, period['startDate'], period['endDate'], period['type'], data_pass
+            )
+        except ReportInProgressError as e:
+            print(f"Deferring {period['type']} report for {subject_type} {subject_id}: {str(e)}")
+            in_progress.append(period['type'])
+    
+    if in_progress:
+        raise ReportInProgressError(
+            f"{', '.join(in_progress)} reports are already being generated for this {subject_type}", None
+        )
+    return ','.join(report_ids[period['type']] for period in periods if report_ids.get(period['type']))
+
+async def trigger_drain_worker(session: aiohttp.ClientSession, function_url_base: str, auth_header: Dict[str, str]) -> None:
+    """Start a report queue worker on another function instance."""
     try:
-        # Prepare request data
-        user_data = {
-            'id': user_doc.id,
-            'startTime': start_time.isoformat(),
-            'endTime': end_time.isoformat(),
-            'type': report_type
-        }
-        
-        # Call the user report generation endpoint
         async with session.post(
-            f"{function_url_base}/generate_user_report",
-            json=user_data,
+            f"{function_url_base}/drain_report_jobs",
+            json={},
             headers=auth_header
         ) as response:
             if not response.ok:
                 response_text = await response.text()
-                print(f"Error generating {report_type} report for user {user_doc.id}: {response_text}")
+                print(f"Error draining report jobs: {response_text}")
             
     except Exception as e:
-        print(f"Error triggering {report_type} report for user {user_doc.id}: {str(e)}")
+        print(f"Error triggering report queue worker: {str(e)}")
 
-async def trigger_class_report(session: aiohttp.ClientSession, function_url_base: str, class_doc: Any, report_type: str, start_time: datetime, end_time: datetime, auth_header: Dict[str, str]) -> None:
-    """Trigger report generation for a single class."""
-    try:
-        # Prepare request data
-        class_data = {
-            'id': class_doc.id,
-            'startTime': start_time.isoformat(),
-            'endTime': end_time.isoformat(),
-            'type': report_type
+# How scheduled reports are dispatched: 'inprocess' drains the report job
+# queue inside the scheduled job only, 'http' also starts REPORT_HTTP_WORKERS
+# drain_report_jobs workers on other instances
+REPORT_DISPATCH_MODE = os.getenv('REPORT_DISPATCH_MODE', 'inprocess')
+REPORT_HTTP_WORKERS = int(os.getenv('REPORT_HTTP_WORKERS', '4'))
+
+# Report job leases expire after this many seconds, so a crashed worker's jobs are picked up again.
+# They outlive report leases, so a re-leased job finds the crashed run's report lease expired
+REPORT_JOB_LEASE_SECONDS = max(int(os.getenv('REPORT_JOB_LEASE_SECONDS', '1200')), REPORT_LEASE_SECONDS + 60)
+
+# A job whose report is already in progress is retried after this many seconds,
+# at most REPORT_JOB_MAX_DEFERRALS times before it is marked done as skipped
+REPORT_JOB_DEFER_SECONDS = int(os.getenv('REPORT_JOB_DEFER_SECONDS', '300'))
+REPORT_JOB_MAX_DEFERRALS = int(os.getenv('REPORT_JOB_MAX_DEFERRALS', '6'))
+
+# Leases per job before it is marked failed
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', '3'))
+
+# Ceiling on the number of reports generated at once by the in-process worker pool
+REPORT_MAX_WORKERS = int(os.getenv('REPORT_MAX_WORKERS', '8'))
+
+# Attempts per report after the first one when OpenAI rate-limits us
+REPORT_MAX_RETRIES = int(os.getenv('REPORT_MAX_RETRIES', '3'))
+
+# Base delay in seconds for exponential retry backoff
+REPORT_RETRY_BASE_DELAY = float(os.getenv('REPORT_RETRY_BASE_DELAY', '2.0'))
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(pct / 100 * len(ordered))))
+    return float(ordered[rank - 1])
+
+class AdaptiveConcurrencyLimiter:
+    """Additive-increase / multiplicative-decrease concurrency limit.
+    
+    Starts at half the ceiling and grows by one slot per window of successful
+    jobs. The limit is halved when a job is rate-limited or when its latency
+    exceeds latency_factor times the running (EWMA) baseline."""
+    
+    def __init__(self, ceiling: int, latency_factor: float = 2.0, warmup: int = 5):
+        self.ceiling = max(1, ceiling)
+        self.limit = max(1, self.ceiling // 2)
+        self.min_limit = self.limit
+        self.latency_factor = latency_factor
+        self.warmup = warmup
+        self.in_flight = 0
+        self._baseline = None
+        self._samples = 0
+        self._increase_credit = 0.0
+        self._condition = asyncio.Condition()
+    
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+    
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+    
+    def _decrease(self) -> None:
+        self.limit = max(1, self.limit // 2)
+        self.min_limit = min(self.min_limit, self.limit)
+        self._increase_credit = 0.0
+    
+    async def on_success(self, latency: float) -> None:
+        async with self._condition:
+            slow = (
+                self._samples >= self.warmup
+                and latency > self.latency_factor * self._baseline
+            )
+            self._samples += 1
+            self._baseline = latency if self._baseline is None else 0.8 * self._baseline + 0.2 * latency
+            
+            if slow:
+                self._decrease()
+            else:
+                self._increase_credit += 1.0 / self.limit
+                if self._increase_credit >= 1.0 and self.limit < self.ceiling:
+                    self.limit += 1
+                    self._increase_credit = 0.0
+            self._condition.notify_all()
+    
+    async def on_rate_limited(self) -> None:
+        async with self._condition:
+            self._decrease()
+
+def report_job_id(subject_type: str, subject_id: str, report_type: str, start_time: datetime, end_time: datetime) -> str:
+    """Deterministic reportJobs ID: one job per subject, report type and period."""
+    return f"{subject_type}_{subject_id}_{report_type}_{rollup_date_key(start_time)}_{rollup_date_key(end_time)}"
+
+def enqueue_report_jobs(db: Any, subjects: List[Tuple[str, str]], periods: List[Tuple[str, datetime, datetime]]) -> int:
+    """Create pending reportJobs for (subject_type, subject_id) pairs.
+    
+    With one period there is one job per subject and period. With several
+    (REPORT_PERIOD_MODE=multi) each subject gets a single job listing all of
+    them, so its reports share one data pass. Jobs that already exist are
+    left untouched, so enqueuing is idempotent across reruns. Returns the
+    number of jobs created."""
+    report_type = '+'.join(period_type for period_type, _, _ in periods)
+    start_time = min(period_start for _, period_start, _ in periods)
+    end_time = max(period_end for _, _, period_end in periods)
+    job_periods = [
+        {'type': period_type, 'startDate': period_start, 'endDate': period_end}
+        for period_type, period_start, period_end in periods
+    ] if len(periods) > 1 else None
+    jobs_ref = db.collection('reportJobs')
+    job_refs = {
+        report_job_id(subject_type, subject_id, report_type, start_time, end_time): (subject_type, subject_id)
+        for subject_type, subject_id in subjects
+    }
+    existing = DocumentLoader(db).get_all(jobs_ref.document(job_id) for job_id in job_refs)
+    new_job_ids = [job_id for job_id in job_refs if f'reportJobs/{job_id}' not in existing]
+    
+    now = datetime.now(timezone.utc)
+    created = 0
+    for i in range(0, len(new_job_ids), 500):
+        batch = db.batch()
+        for job_id in new_job_ids[i:i + 500]:
+            subject_type, subject_id = job_refs[job_id]
+            batch.create(jobs_ref.document(job_id), {
+                'subjectType': subject_type,
+                'subjectId': subject_id,
+                'type': report_type,
+                'startDate': start_time,
+                'endDate': end_time,
+                'status': 'pending',
+                'attempts': 0,
+                'createdAt': now,
+                'updatedAt': now,
+                **({'periods': job_periods} if job_periods else {})
+            })
+        try:
+            batch.commit()
+            created += len(new_job_ids[i:i + 500])
+        except AlreadyExists:
+            # Another run enqueued some of these jobs first; create the rest one by one
+            for job_id in new_job_ids[i:i + 500]:
+                subject_type, subject_id = job_refs[job_id]
+                try:
+                    jobs_ref.document(job_id).create({
+                        'subjectType': subject_type,
+                        'subjectId': subject_id,
+                        'type': report_type,
+                        'startDate': start_time,
+                        'endDate': end_time,
+                        'status': 'pending',
+                        'attempts': 0,
+                        'createdAt': now,
+                        'updatedAt': now,
+                        **({'periods': job_periods} if job_periods else {})
+                    })
+                    created += 1
+                except AlreadyExists:
+                    pass
+    return created
+
+def try_lease_report_job(db: Any, job_ref: Any, worker_id: str) -> Optional[Dict]:
+    """Transactionally lease a pending job, a leased job whose lease expired or a
+    deferred job whose retry time has come.
+    Returns the leased job data (with its 'id'), or None if it was not claimable."""
+    
+    @firestore.transactional
+    def claim(transaction):
+        snapshot = job_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        
+        job = snapshot.to_dict()
+        now = datetime.now(timezone.utc)
+        lease_expired = (
+            job.get('status') == 'leased'
+            and job.get('leaseExpiresAt') is not None
+            and job['leaseExpiresAt'] <= now
+        )
+        retry_due = (
+            job.get('status') == 'deferred'
+            and job.get('retryAt') is not None
+            and job['retryAt'] <= now
+        )
+        if job.get('status') != 'pending' and not lease_expired and not retry_due:
+            return None
+        
+        update = {
+            'status': 'leased',
+            'leaseOwner': worker_id,
+            'leaseExpiresAt': now + timedelta(seconds=REPORT_JOB_LEASE_SECONDS),
+            'attempts': job.get('attempts', 0) + 1,
+            'updatedAt': now
         }
+        transaction.update(job_ref, update)
+        return {**job, **update, 'id': job_ref.id}
+    
+    return claim(db.transaction())
+
+def lease_report_jobs(db: Any, worker_id: str, limit: int) -> List[Dict]:
+    """Lease up to `limit` pending, lease-expired or due deferred report jobs for a worker."""
+    now = datetime.now(timezone.utc)
+    pending_docs, expired_docs, deferred_docs = run_concurrently(
+        lambda: db.collection('reportJobs').where('status', '==', 'pending').limit(limit).get(),
+        lambda: (
+            db.collection('reportJobs')
+            .where('status', '==', 'leased')
+            .where('leaseExpiresAt', '<=', now)
+            .limit(limit)
+            .get()
+        ),
+        lambda: (
+            db.collection('reportJobs')
+            .where('status', '==', 'deferred')
+            .where('retryAt', '<=', now)
+            .limit(limit)
+            .get()
+        )
+    )
+    candidates = list({
+        doc.id: doc.reference for doc in list(pending_docs) + list(expired_docs) + list(deferred_docs)
+    }.values())[:limit]
+    
+    # Other workers may race for the same candidates; the transactions pick one winner
+    leased = run_concurrently(*[
+        (lambda job_ref=job_ref: try_lease_report_job(db, job_ref, worker_id))
+        for job_ref in candidates
+    ]) if candidates else []
+    return [job for job in leased if job]
+
+def complete_report_job(db: Any, job: Dict, outcome: str, detail: str) -> None:
+    """Record a leased job's outcome: done, deferred, back to pending for another attempt, or failed.
+    
+    A deferred job (its report was already in progress) is retried after
+    REPORT_JOB_DEFER_SECONDS without using up an attempt, and keeps the report
+    IDs of periods already generated; after REPORT_JOB_MAX_DEFERRALS it is
+    marked done as skipped."""
+    now = datetime.now(timezone.utc)
+    job_ref = db.collection('reportJobs').document(job['id'])
+    if outcome == 'complete':
+        job_ref.update({'status': 'done', 'reportId': detail or None, 'noActivity': not detail, 'leaseExpiresAt': None, 'updatedAt': now})
+    elif outcome == 'deferred' and job.get('deferrals', 0) >= REPORT_JOB_MAX_DEFERRALS:
+        job_ref.update({'status': 'done', 'skipped': True, 'error': detail, 'leaseExpiresAt': None, 'updatedAt': now})
+    elif outcome == 'deferred':
+        job_ref.update({
+            'status': 'deferred',
+            'error': detail,
+            'attempts': max(0, job.get('attempts', 1) - 1),
+            'deferrals': job.get('deferrals', 0) + 1,
+            'reportIds': job.get('reportIds') or {},
+            'retryAt': now + timedelta(seconds=REPORT_JOB_DEFER_SECONDS),
+            'leaseOwner': None,
+            'leaseExpiresAt': None,
+            'updatedAt': now
+        })
+    elif job.get('attempts', 0) >= REPORT_JOB_MAX_ATTEMPTS:
+        job_ref.update({'status': 'failed', 'error': detail, 'leaseExpiresAt': None, 'updatedAt': now})
+    else:
+        job_ref.update({'status': 'pending', 'error': detail, 'leaseOwner': None, 'leaseExpiresAt': None, 'updatedAt': now})
+
+def new_report_run_metrics() -> Dict[str, Any]:
+    return {'jobs': 0, 'complete': 0, 'deferred': 0, 'error': 0, 'retries': 0, 'rateLimited': 0, 'latencies': []}
+
+def summarize_report_run(metrics: Dict[str, Any], limiter: AdaptiveConcurrencyLimiter, run_started: datetime) -> Dict[str, Any]:
+    """Turn raw run metrics into the throughput and latency summary stored in reportRuns."""
+    duration = (datetime.now(timezone.utc) - run_started).total_seconds()
+    summary = {key: value for key, value in metrics.items() if key != 'latencies'}
+    summary.update({
+        'durationSeconds': duration,
+        'reportsPerMinute': metrics['complete'] / duration * 60 if duration > 0 else 0.0,
+        'latencyP50': percentile(metrics['latencies'], 50),
+        'latencyP95': percentile(metrics['latencies'], 95),
+        'concurrencyCeiling': limiter.ceiling,
+        'concurrencyMin': limiter.min_limit,
+        'concurrencyFinal': limiter.limit
+    })
+    return summary
+
+async def run_report_batch(db: Any, client: OpenAI, report_jobs: List[Dict], limiter: AdaptiveConcurrencyLimiter, metrics: Dict[str, Any], on_result: Optional[Callable[[Dict, str, str], None]] = None) -> None:
+    """Run report jobs in-process under an adaptive concurrency limit.
+    
+    Each job is a dict with subjectType ('user' or 'class'), subjectId, type,
+    startDate and endDate, plus periods for multi-period jobs. All workers
+    share the Firestore and OpenAI clients.
+    Rate-limited reports are retried with jittered exponential backoff.
+    Counts, retries and latencies are accumulated in `metrics`, and
+    on_result(job, outcome, detail) is called (in a worker thread) with
+    outcome 'complete' (detail is the report ID, empty when the period had
+    no activity and no report was stored), 'deferred' (a report was
+    already in progress; job['reportIds'] holds the periods already done) or
+    'error'."""
+    
+    async def record(job: Dict, outcome: str, detail: str) -> None:
+        metrics[outcome] += 1
+        if on_result:
+            try:
+                await asyncio.to_thread(on_result, job, outcome, detail)
+            except Exception as e:
+                print(f"Error recording report job outcome: {str(e)}")
+    
+    async def run_job(job: Dict) -> None:
+        subject_type, subject_id, report_type = job['subjectType'], job['subjectId'], job['type']
+        run_report = run_user_report if subject_type == 'user' else run_class_report
+        report_ids = job.setdefault('reportIds', {})
+        for attempt in range(REPORT_MAX_RETRIES + 1):
+            await limiter.acquire()
+            job_started = datetime.now(timezone.utc)
+            try:
+                if job.get('periods'):
+                    report_id = await asyncio.to_thread(
+                        run_reports_for_periods, db, client, subject_type, subject_id, job['periods'], report_ids
+                    )
+                else:
+                    report_id = await asyncio.to_thread(
+                        run_report, db, client, subject_id, job['startDate'], job['endDate'], report_type
+                    )
+                latency = (datetime.now(timezone.utc) - job_started).total_seconds()
+                metrics['latencies'].append(latency)
+                await limiter.on_success(latency)
+                outcome = ('complete', report_id)
+            except ReportInProgressError as e:
+                outcome = ('deferred', str(e))
+            except RateLimitError as e:
+                metrics['rateLimited'] += 1
+                await limiter.on_rate_limited()
+                outcome = None
+                if attempt == REPORT_MAX_RETRIES:
+                    print(f"Giving up on {report_type} report for {subject_type} {subject_id} after {attempt + 1} attempts: {str(e)}")
+                    outcome = ('error', f'Rate limited: {str(e)}')
+            except Exception as e:
+                print(f"Error generating {report_type} report for {subject_type} {subject_id}: {str(e)}")
+                outcome = ('error', str(e))
+            finally:
+                await limiter.release()
+            
+            if outcome:
+                await record(job, *outcome)
+                return
+            
+            # Full jitter: sleep a random amount up to the exponential backoff
+            metrics['retries'] += 1
+            await asyncio.sleep(random.uniform(0, REPORT_RETRY_BASE_DELAY * (2 ** attempt)))
+    
+    metrics['jobs'] += len(report_jobs)
+    await asyncio.gather(*(run_job(job) for job in report_jobs))
+
+async def drain_report_job_queue(db: Any, client: OpenAI, worker_id: str, max_workers: int = REPORT_MAX_WORKERS) -> Dict[str, Any]:
+    """Lease and run report jobs until the queue has nothing claimable left.
+    Several instances can drain the queue at once. Returns the run summary."""
+    limiter = AdaptiveConcurrencyLimiter(max_workers)
+    metrics = new_report_run_metrics()
+    run_started = datetime.now(timezone.utc)
+    
+    while True:
+        jobs = await asyncio.to_thread(lease_report_jobs, db, worker_id, max_workers * 2)
+        if not jobs:
+            break
+        await run_report_batch(
+            db, client, jobs, limiter, metrics,
+            on_result=lambda job, outcome, detail: complete_report_job(db, job, outcome, detail)
+        )
+    
+    summary = summarize_report_run(metrics, limiter, run_started)
+    summary['workerId'] = worker_id
+    return summary
+
+class ServiceTokenProvider:
+    """Firebase ID token of the internal service account, for service-to-service calls.
+    
+    The token is minted once (custom token exchanged through identitytoolkit)
+    and reused until shortly before it expires. Within refresh_ahead of the
+    expiry a background thread fetches the next one while callers keep using
+    the current token; only a missing or nearly expired token is refreshed
+    synchronously."""
+    
+    def __init__(self, refresh_ahead: timedelta = timedelta(minutes=10), min_validity: timedelta = timedelta(minutes=1)):
+        self.refresh_ahead = refresh_ahead
+        self.min_validity = min_validity
+        self._session = requests.Session()
+        self._token = None
+        self._expires_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+    
+    def _exchange(self) -> Tuple[str, datetime]:
+        """Mint a custom token and exchange it for an ID token and its expiry."""
+        # Create a custom token for internal service account
+        custom_token = auth.create_custom_token('service-account')
         
-        # Call the class report generation endpoint
-        async with session.post(
-            f"{function_url_base}/generate_class_report",
-            json=class_data,
-            headers=auth_header
-        ) as response:
-            if not response.ok:
-                response_text = await response.text()
-                print(f"Error generating {report_type} report for class {class_doc.id}: {response_text}")
+        # Exchange custom token for ID token using Firebase Auth REST API
+        firebase_api_key = os.getenv('PYTHON_FIREBASE_API_KEY')
+        if not firebase_api_key:
+            raise ValueError("FIREBASE_API_KEY environment variable not set")
             
+        exchange_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithCustomToken?key={firebase_api_key}"
+        
+        # Make the token exchange request over the pooled session
+        requested_at = datetime.now(timezone.utc)
+        response = self._session.post(
+            exchange_url,
+            json={'token': custom_token.decode(), 'returnSecureToken': True}
+        )
+        
+        if not response.ok:
+            raise Exception(f"Failed to exchange custom token: {response.text}")
+        
+        response_data = response.json()
+        expires_in = int(response_data.get('expiresIn', 3600))
+        return response_data['idToken'], requested_at + timedelta(seconds=expires_in)
+    
+    def _refresh(self) -> str:
+        # One exchange at a time; callers that waited reuse its result
+        with self._refresh_lock:
+            with self._lock:
+                if self._token and datetime.now(timezone.utc) < self._expires_at - self.refresh_ahead:
+                    return self._token
+            token, expires_at = self._exchange()
+            with self._lock:
+                self._token, self._expires_at = token, expires_at
+            return token
+    
+    def _refresh_in_background(self) -> None:
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"Error refreshing service token: {str(e)}")
+    
+    def get_token(self) -> str:
+        """Return a valid ID token, refreshing it when it is about to expire."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            token, expires_at = self._token, self._expires_at
+        
+        if token and now < expires_at - self.refresh_ahead:
+            return token
+        if token and now < expires_at - self.min_validity:
+            if not self._refresh_lock.locked():
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return token
+        return self._refresh()
+
+# Shared by all service calls made from this instance
+service_token_provider = ServiceTokenProvider()
+
+def create_service_auth_header() -> Dict[str, str]:
+    """Create an Authorization header for internal service-to-service calls."""
+    try:
+        return {'Authorization': f'Bearer {service_token_provider.get_token()}'}
     except Exception as e:
-        print(f"Error triggering {report_type} report for class {class_doc.id}: {str(e)}")
+        print(f"Error creating auth token: {str(e)}")
+        raise e
 
+class VerifiedTokenCache:
+    """In-process LRU of verified service tokens, keyed by the token's hash.
+    Entries are dropped when the token expires."""
+    
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached uid for a token hash, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            uid, expires_at = entry
+            if expires_at <= datetime.now(timezone.utc).timestamp():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return uid
+    
+    def set(self, key: str, uid: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (uid, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
 
-@scheduler_fn.on_schedule(schedule="0 15 * * *")
-def trigger_daily_reports(event: scheduler_fn.ScheduledEvent) -> None:
-    """Trigger report generation for all active users and classes at 9am."""
-    return _trigger_reports()
+verified_token_cache = VerifiedTokenCache()
 
-@https_fn.on_request()
+# Reused for Google certificate fetches when verifying Cloud tokens
+_google_auth_request = google.auth.transport.requests.Request()
+
+# Service accounts (e.g. Cloud Scheduler or invoker accounts) whose Google-signed
+# ID tokens are accepted as internal calls, comma separated
+SERVICE_INVOKER_EMAILS = {
+    email.strip() for email in os.getenv('SERVICE_INVOKER_EMAILS', '').split(',') if email.strip()
+}
+
+def verify_request_token(token: str, function_name: str) -> str:
+    """Verify a bearer token sent to a function and return the caller's uid.
+    
+    Firebase ID tokens (app calls and the internal service account) return
+    their uid. Google-signed ID tokens return 'service-account' only when
+    their audience is this function's URL (FUNCTION_URL_BASE/function_name)
+    and their verified email is in SERVICE_INVOKER_EMAILS. Verified service
+    tokens are cached per function until they expire, so repeated internal
+    calls skip verification. Raises ValueError when neither verification
+    succeeds."""
+    key = hashlib.sha256(f'{function_name}:{token}'.encode()).hexdigest()
+    cached_uid = verified_token_cache.get(key)
+    if cached_uid:
+        return cached_uid
+    
+    try:
+        decoded_token = auth.verify_id_token(token)
+        uid = decoded_token['uid']
+    except Exception as firebase_error:
+        try:
+            function_url_base = os.getenv('FUNCTION_URL_BASE')
+            if not function_url_base or not SERVICE_INVOKER_EMAILS:
+                raise ValueError('Google-signed tokens are not accepted (FUNCTION_URL_BASE or SERVICE_INVOKER_EMAILS not set)')
+            decoded_token = google.oauth2.id_token.verify_token(
+                token,
+                _google_auth_request,
+                audience=f"{function_url_base.rstrip('/')}/{function_name}"
+            )
+            if not decoded_token.get('email_verified') or decoded_token.get('email') not in SERVICE_INVOKER_EMAILS:
+                raise ValueError(f"{decoded_token.get('email')} is not an allowed service invoker")
+            uid = 'service-account'
+        except Exception as cloud_error:
+            raise ValueError(f'Firebase error: {str(firebase_error)}. Cloud error: {str(cloud_error)}')
+    
+    if uid == 'service-account' and decoded_token.get('exp'):
+        verified_token_cache.set(key, uid, float(decoded_token['exp']))
+    return uid
+
+async def start_http_drain_workers(worker_count: int) -> None:
+    """Start drain_report_jobs workers on other instances (REPORT_DISPATCH_MODE=http)."""
+    # Get the function URL base from environment
+    function_url_base = os.getenv('FUNCTION_URL_BASE')
+    if not function_url_base:
+        raise ValueError("FUNCTION_URL_BASE environment variable not set")
+    
+    auth_header = await asyncio.to_thread(create_service_auth_header)
+    
+    # Workers answer once the queue is drained, so allow as long as the function timeout
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1800)) as session:
+        await asyncio.gather(*[
+            trigger_drain_worker(session, function_url_base, auth_header)
+            for _ in range(worker_count)
+        ])
+
+# Users and classes are spread over this many hourly report slots by a
+# stable hash, the first slot running at REPORT_SLOT_START_HOUR UTC. Each
+# subject is always reported in the same slot, so its periods line up.
+REPORT_SLOTS = int(os.getenv('REPORT_SLOTS', '24'))
+REPORT_SLOT_START_HOUR = int(os.getenv('REPORT_SLOT_START_HOUR', '0'))
+
+def report_slot(subject_type: str, subject_id: str) -> int:
+    """Stable report slot of a user or class."""
+    digest = hashlib.md5(f'{subject_type}:{subject_id}'.encode()).hexdigest()
+    return int(digest, 16) % REPORT_SLOTS
+
+def current_report_slot(now: datetime) -> Optional[int]:
+    """Slot due at this UTC hour, or None if no slot runs this hour."""
+    slot = (now.hour - REPORT_SLOT_START_HOUR) % 24
+    return slot if slot < REPORT_SLOTS else None
+
+# Reports are now generated inside the triggering function, so allow long runs
+@scheduler_fn.on_schedule(schedule="0 * * * *", timeout_sec=1800)
+def trigger_hourly_reports(event: scheduler_fn.ScheduledEvent) -> None:
+    """Trigger report generation for the active users and classes of this hour's slot."""
+    slot = current_report_slot(datetime.now(timezone.utc))
+    if slot is None:
+        return
+    return _trigger_reports(slot)
+
+@https_fn.on_request(timeout_sec=1800)
 def trigger_reports_manually(req: https_fn.Request) -> https_fn.Response:
     """HTTP endpoint to manually trigger report generation.
     This endpoint is restricted to admin users only."""
@@ -1825,9 +4360,9 @@ def trigger_reports_manually(req: https_fn.Request) -> https_fn.Response:
         
         # Get user's admin status from Firestore
         db = firestore.client()
-        user_doc = db.collection('users').document(user_id).get()
+        user_doc = DocumentLoader(db).get(db.collection('users').document(user_id))
         
-        if not user_doc.exists:
+        if not user_doc:
             return https_fn.Response(
                 json.dumps({'error': 'User not found'}),
                 status=404,
@@ -1845,7 +4380,314 @@ def trigger_reports_manually(req: https_fn.Request) -> https_fn.Response:
                 headers=cors_headers,
                 content_type='application/json'
             )
-        
+        
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Authentication error: {str(e)}'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    try:
+        # Log the manual trigger event
+        db.collection('adminLogs').add({
+            'event': 'manual_report_trigger',
+            'triggeredBy': user_id,
+            'timestamp': datetime.now()
+        })
+        
+        _trigger_reports()
+        return https_fn.Response(
+            json.dumps({
+                'success': True,
+                'message': 'Report generation triggered successfully',
+                'triggeredBy': user_id
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Error triggering reports: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+# Percentiles reported by get_report_timing_stats
+TIMING_PERCENTILES = [50, 90, 95, 99]
+
+def summarize_report_timings(timings: List[Dict]) -> Dict[str, Any]:
+    """Percentiles of total time, each stage and each counter across report timings."""
+    def percentiles(values: List[float]) -> Dict[str, float]:
+        return {f'p{pct}': round(percentile(values, pct), 4) for pct in TIMING_PERCENTILES}
+    
+    stage_names = sorted({name for timing in timings for name in timing.get('stages', {})})
+    counter_names = sorted({
+        name for timing in timings for name, value in timing.items()
+        if name not in ('stages', 'totalSeconds') and isinstance(value, (int, float))
+    })
+    return {
+        'totalSeconds': percentiles([timing.get('totalSeconds', 0.0) for timing in timings]),
+        # Reports that skipped a stage count as 0 for it
+        'stages': {
+            name: percentiles([timing.get('stages', {}).get(name, 0.0) for timing in timings])
+            for name in stage_names
+        },
+        **{name: percentiles([timing.get(name, 0) for timing in timings]) for name in counter_names}
+    }
+
+@https_fn.on_request()
+def get_report_timing_stats(req: https_fn.Request) -> https_fn.Response:
+    """Percentiles of the per-stage timings of recent complete reports.
+    
+    Query params: subject ('user' or 'class', default 'user'), type (report
+    type filter, optional) and limit (number of recent reports, 1-1000,
+    default 200). Restricted to admin users."""
+    
+    # Set CORS headers for all responses
+    cors_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Max-Age': '3600',
+    }
+    
+    # Handle OPTIONS request (preflight)
+    if req.method == 'OPTIONS':
+        return https_fn.Response('', headers=cors_headers, status=204)
+    
+    # Verify authentication
+    auth_header = req.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return https_fn.Response(
+            json.dumps({'error': 'Unauthorized - Invalid token format'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    try:
+        # Verify the token and check the user's admin status
+        token = auth_header.split('Bearer ')[1]
+        decoded_token = auth.verify_id_token(token)
+        db = firestore.client()
+        user_doc = DocumentLoader(db).get(db.collection('users').document(decoded_token['uid']))
+        
+        if not user_doc or not user_doc.to_dict().get('isAdmin', False):
+            return https_fn.Response(
+                json.dumps({'error': 'Unauthorized - Admin access required'}),
+                status=403,
+                headers=cors_headers,
+                content_type='application/json'
+            )
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Authentication error: {str(e)}'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    subject = req.args.get('subject', 'user')
+    if subject not in ('user', 'class'):
+        return https_fn.Response(
+            json.dumps({'error': 'subject must be user or class'}),
+            status=400,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    try:
+        limit = int(req.args.get('limit', '200'))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= 1000:
+        return https_fn.Response(
+            json.dumps({'error': 'limit must be between 1 and 1000'}),
+            status=400,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    report_type = req.args.get('type')
+    
+    try:
+        query = (
+            db.collection('userProgressReports' if subject == 'user' else 'classProgressReports')
+            .where('status', '==', 'complete')
+        )
+        if report_type:
+            query = query.where('type', '==', report_type)
+        report_docs = (
+            query.order_by('createdAt', direction=firestore.Query.DESCENDING)
+            .select(['reportData.timings'])
+            .limit(limit)
+            .get()
+        )
+        
+        # Reports created before timings were recorded are left out
+        timings = [
+            doc.get('reportData.timings') for doc in report_docs
+            if doc.get('reportData.timings')
+        ]
+        return https_fn.Response(
+            json.dumps({
+                'subject': subject,
+                'type': report_type,
+                'reports': len(timings),
+                'percentiles': summarize_report_timings(timings)
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    except Exception as e:
+        print(f"Error computing report timing stats: {str(e)}")
+        return https_fn.Response(
+            json.dumps({'error': f'Error computing report timing stats: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+
+def _trigger_reports(slot: Optional[int] = None) -> None:
+    """Internal function containing the report generation logic.
+    This is shared between the scheduled and manual triggers. The scheduled
+    trigger passes its hourly slot; manual runs (slot None) cover every subject."""
+    slot_ref = None
+    try:
+        # Initialize Firestore
+        db = firestore.client()
+        
+        # Get the due report periods and the window covering them all
+        periods = get_due_report_periods() if REPORT_PERIOD_MODE == 'multi' else [get_report_types_and_dates()]
+        report_type = '+'.join(period_type for period_type, _, _ in periods)
+        start_time = min(period_start for _, period_start, _ in periods)
+        end_time = max(period_end for _, _, period_end in periods)
+        
+        # Track the slot's progress; an hour that already ran is not repeated
+        if slot is not None:
+            slot_ref = db.collection('reportSlots').document(f'{rollup_date_key(end_time)}_{slot}')
+            slot_doc = slot_ref.get()
+            if slot_doc.exists and slot_doc.to_dict().get('status') == 'done':
+                print(f"Report slot {slot_ref.id} already done")
+                return
+            slot_ref.set({
+                'date': rollup_date_key(end_time),
+                'slot': slot,
+                'type': report_type,
+                'startDate': start_time,
+                'endDate': end_time,
+                'status': 'running',
+                'startedAt': datetime.now(timezone.utc)
+            }, merge=True)
+        
+        # Find active users and classes from the activity index (or raw
+        # activity until the index is backfilled), keep those in this slot,
+        # then check they still exist in one batched read
+        user_ids, class_ids = get_active_report_subjects(db, start_time, end_time)
+        if slot is not None:
+            user_ids = [user_id for user_id in user_ids if report_slot('user', user_id) == slot]
+            class_ids = [class_id for class_id in class_ids if report_slot('class', class_id) == slot]
+        existing = DocumentLoader(db).get_all(
+            [db.collection('users').document(user_id) for user_id in user_ids]
+            + [db.collection('classes').document(class_id) for class_id in class_ids]
+        )
+        active_users = [doc for path, doc in existing.items() if path.startswith('users/')]
+        active_classes = [doc for path, doc in existing.items() if path.startswith('classes/')]
+        
+        # Record one durable job per report; reruns skip jobs that already exist
+        created = enqueue_report_jobs(
+            db,
+            [('user', user_doc.id) for user_doc in active_users]
+            + [('class', class_doc.id) for class_doc in active_classes],
+            periods
+        )
+        print(f"Enqueued {created} {report_type} report jobs")
+        if slot_ref:
+            slot_ref.update({
+                'users': len(active_users),
+                'classes': len(active_classes),
+                'jobsEnqueued': created
+            })
+        
+        summary = run_report_workers(db)
+        if slot_ref:
+            slot_ref.update({
+                'status': 'done',
+                'finishedAt': datetime.now(timezone.utc),
+                'complete': summary['complete'],
+                'deferred': summary['deferred'],
+                'error': summary['error'],
+                'durationSeconds': summary['durationSeconds']
+            })
+                
+    except Exception as e:
+        print(f"Error in trigger_hourly_reports: {str(e)}")
+        if slot_ref:
+            slot_ref.update({'status': 'error', 'errorMessage': str(e)})
+        raise e
+
+def run_report_workers(db: Any, start_remote_workers: bool = True) -> Dict[str, Any]:
+    """Drain the report job queue in this instance, plus remote workers in http mode.
+    Stores and returns this worker's run summary."""
+    if not os.getenv('OPENAI_API_KEY'):
+        raise ValueError("OPENAI_API_KEY environment variable not set")
+    worker_id = f"{os.getenv('K_REVISION', 'local')}-{os.getpid()}-{random.getrandbits(32):08x}"
+    
+    async def main():
+        local_worker = drain_report_job_queue(db, get_openai_client(), worker_id)
+        if start_remote_workers and REPORT_DISPATCH_MODE == 'http':
+            summary, _ = await asyncio.gather(local_worker, start_http_drain_workers(REPORT_HTTP_WORKERS))
+            return summary
+        return await local_worker
+    
+    summary = asyncio.run(main())
+    print(f"Report worker {worker_id} finished: {json.dumps(summary)}")
+    
+    # Keep per-run metrics for throughput and failure tracking
+    db.collection('reportRuns').add({
+        **summary,
+        'createdAt': datetime.now(timezone.utc)
+    })
+    return summary
+
+@https_fn.on_request(timeout_sec=1800)
+def drain_report_jobs(req: https_fn.Request) -> https_fn.Response:
+    """Drain the report job queue on this instance.
+    Called by the report trigger in http mode; restricted to internal service calls."""
+    cors_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Max-Age': '3600',
+    }
+    
+    # Handle OPTIONS request (preflight)
+    if req.method == 'OPTIONS':
+        return https_fn.Response('', headers=cors_headers, status=204)
+    
+    # Verify authentication
+    auth_header = req.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return https_fn.Response(
+            json.dumps({'error': 'Unauthorized - Invalid token format'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    token = auth_header.split('Bearer ')[1]
+    
+    try:
+        # Internal calls use the service account's Firebase token or a Google Cloud token
+        caller_id = verify_request_token(token, 'drain_report_jobs')
+        if caller_id != 'service-account':
+            return https_fn.Response(
+                json.dumps({'error': 'Unauthorized - Service access required'}),
+                status=403,
+                headers=cors_headers,
+                content_type='application/json'
+            )
     except Exception as e:
         return https_fn.Response(
             json.dumps({'error': f'Authentication error: {str(e)}'}),
@@ -1855,162 +4697,21 @@ def trigger_reports_manually(req: https_fn.Request) -> https_fn.Response:
         )
     
     try:
-        # Log the manual trigger event
-        db.collection('adminLogs').add({
-            'event': 'manual_report_trigger',
-            'triggeredBy': user_id,
-            'timestamp': datetime.now()
-        })
-        
-        _trigger_reports()
+        summary = run_report_workers(firestore.client(), start_remote_workers=False)
         return https_fn.Response(
-            json.dumps({
-                'success': True,
-                'message': 'Report generation triggered successfully',
-                'triggeredBy': user_id
-            }),
+            json.dumps({'success': True, 'summary': summary}),
             headers=cors_headers,
             content_type='application/json'
         )
     except Exception as e:
+        print(f"Error draining report jobs: {str(e)}")
         return https_fn.Response(
-            json.dumps({'error': f'Error triggering reports: {str(e)}'}),
+            json.dumps({'error': f'Error draining report jobs: {str(e)}'}),
             status=500,
             headers=cors_headers,
             content_type='application/json'
         )
 
-def _trigger_reports() -> None:
-    """Internal function containing the report generation logic.
-    This is shared between the scheduled and manual triggers."""
-    try:
-        # Initialize Firestore
-        db = firestore.client()
-        
-        # Get the function URL base from environment
-        function_url_base = os.getenv('FUNCTION_URL_BASE')
-        if not function_url_base:
-            raise ValueError("FUNCTION_URL_BASE environment variable not set")
-        
-        # Create a custom token for internal service-to-service calls
-        try:
-            # Get app instance
-            app = firebase_admin.get_app()
-            
-            # Create a custom token for internal service account
-            custom_token = auth.create_custom_token('service-account')
-            
-            # Exchange custom token for ID token using Firebase Auth REST API
-            firebase_api_key = os.getenv('PYTHON_FIREBASE_API_KEY')
-            if not firebase_api_key:
-                raise ValueError("FIREBASE_API_KEY environment variable not set")
-                
-            exchange_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithCustomToken?key={firebase_api_key}"
-            
-            # Make the token exchange request
-            response = requests.post(
-                exchange_url,
-                json={'token': custom_token.decode(), 'returnSecureToken': True}
-            )
-            
-            if not response.ok:
-                raise Exception(f"Failed to exchange custom token: {response.text}")
-                
-            # Extract the ID token from the response
-            id_token = response.json()['idToken']
-            auth_header = {'Authorization': f'Bearer {id_token}'}
-            
-        except Exception as e:
-            print(f"Error creating auth token: {str(e)}")
-            raise e
-        
-        # Get report type and date range
-        report_type, start_time, end_time = get_report_types_and_dates()
-        
-        # Get unique users who have viewed videos in the time period
-        active_user_refs = set()
-        user_views = (
-            db.collection('userViews')
-            .where('watchedAt', '>=', start_time)
-            .where('watchedAt', '<=', end_time)
-            .get()
-        )
-        for view in user_views:
-            view_data = view.to_dict()
-            if 'userId' in view_data:
-                active_user_refs.add(view_data['userId'])
-        
-        # Get the actual user documents
-        active_users = [ref.get() for ref in active_user_refs if ref.get().exists]
-        
-        # Get unique classes that have likes or bookmarks in the time period
-        active_class_refs = set()
-        
-        # Check userLikes for class activity
-        class_likes = (
-            db.collection('userLikes')
-            .where('likedAt', '>=', start_time)
-            .where('likedAt', '<=', end_time)
-            .get()
-        )
-        for like in class_likes:
-            like_data = like.to_dict()
-            if 'classId' in like_data:
-                # classId is an array in userLikes
-                for class_ref in like_data['classId']:
-                    active_class_refs.add(class_ref)
-        
-        # Check userBookmarks for class activity
-        class_bookmarks = (
-            db.collection('userBookmarks')
-            .where('addedAt', '>=', start_time)
-            .where('addedAt', '<=', end_time)
-            .get()
-        )
-        for bookmark in class_bookmarks:
-            bookmark_data = bookmark.to_dict()
-            if 'classId' in bookmark_data:
-                # classId is an array in userBookmarks
-                for class_ref in bookmark_data['classId']:
-                    active_class_refs.add(class_ref)
-        
-        # Get the actual class documents
-        active_classes = [ref.get() for ref in active_class_refs if ref.get().exists]
-        
-        async def main():
-            # Create a shared session for all requests
-            async with aiohttp.ClientSession() as session:
-                tasks = []
-                
-                # Add user report tasks
-                user_tasks = [
-                    trigger_user_report(
-                        session, function_url_base, user_doc, 
-                        report_type, start_time, end_time, auth_header
-                    )
-                    for user_doc in active_users
-                ]
-                tasks.extend(user_tasks)
-                
-                # Add class report tasks
-                class_tasks = [
-                    trigger_class_report(
-                        session, function_url_base, class_doc,
-                        report_type, start_time, end_time, auth_header
-                    )
-                    for class_doc in active_classes
-                ]
-                tasks.extend(class_tasks)
-                
-                # Run all tasks concurrently
-                await asyncio.gather(*tasks)
-        
-        # Run the async tasks
-        asyncio.run(main())
-                
-    except Exception as e:
-        print(f"Error in trigger_daily_reports: {str(e)}")
-        raise e
 
 @https_fn.on_request()
 def generate_in_feed_question(req: https_fn.Request) -> https_fn.Response:
@@ -2066,26 +4767,64 @@ def generate_in_feed_question(req: https_fn.Request) -> https_fn.Response:
         # Initialize Firestore
         db = firestore.client()
         
-        # Create question document in Firestore with test data
         user_ref = db.collection('users').document(user_id)
-        question_ref = db.collection('questions').document()
         
         # get the random video details
         index = random.randint(0, len(video_ids) - 1)
         video_id = video_ids[index]
-        video_doc = db.collection('videos').document(video_id).get()
-        video_details = {
-            'title': video_doc.to_dict()['metadata']['title'],
-            'description': video_doc.to_dict()['metadata']['description'],
-            'transcript': video_doc.to_dict()['metadata']['transcript'],
-            'description2': video_doc.to_dict()['classification']['explicit']['description'],
-        }
-
-        # Initialize OpenAI client
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-        # Generate the question from openai
-        question = generate_question_from_video(client, video_details)
+        
+        # Read the video's question bank, then in one batched read which of its
+        # questions this user has already been served (served docs are named
+        # after the bank question IDs, which follow the question content)
+        bank_ref = db.collection('videoQuestionBank').document(video_id)
+        loader = DocumentLoader(db)
+        bank_doc = loader.get(bank_ref)
+        bank_questions = (bank_doc.to_dict().get('questions') or []) if bank_doc else []
+        served_refs = [
+            db.collection('questions').document(bank_question_doc_id(user_id, video_id, bank_question['id']))
+            for bank_question in bank_questions
+        ]
+        served = loader.get_all(served_refs)
+        
+        served_question_id = None
+        if bank_questions:
+            unseen = [i for i, served_ref in enumerate(served_refs) if served_ref.path not in served]
+            if unseen:
+                question_index = unseen[0]
+                question_ref = served_refs[question_index]
+            else:
+                # Every bank question was served; repeat one under a fresh
+                # question doc so it can be answered again
+                question_index = random.randrange(len(bank_questions))
+                question_ref = db.collection('questions').document()
+            bank_question = bank_questions[question_index]
+            served_question_id = bank_question['id']
+            question = {**shuffle_question_options(bank_question), 'llmDuration': 0.0, 'llmOutcome': 'bank'}
+        else:
+            video_ref = db.collection('videos').document(video_id)
+            digest_ref = db.collection('videoDigests').document(video_id)
+            video_docs = loader.get_all([video_ref, digest_ref])
+            video_doc = video_docs.get(video_ref.path)
+            if not video_doc:
+                return https_fn.Response(
+                    json.dumps({'error': f'Video {video_id} not found'}),
+                    status=404,
+                    headers=cors_headers,
+                    content_type='application/json'
+                )
+            
+            # Fill the bank in the background so later requests skip the LLM
+            enqueue_question_banks(db, [video_id])
+            
+            # Generate the question from openai
+            question_ref = db.collection('questions').document()
+            # Use the transcript digest if it is current; the bank job refreshes it
+            digest_doc = video_docs.get(digest_ref.path)
+            video_details = apply_video_digest(
+                question_video_details(video_doc),
+                digest_doc.to_dict() if digest_doc else None
+            )
+            question = generate_question_from_video(get_openai_client(), video_details)
 
 
         # Store the question in Firestore
@@ -2098,11 +4837,14 @@ def generate_in_feed_question(req: https_fn.Request) -> https_fn.Response:
                 'options': question['options'],
                 'correctAnswer': question['correctAnswer'],
                 'explanation': question['explanation'],
-                'llmDuration': question['llmDuration']  # Add the timing information
+                'llmDuration': question['llmDuration'],  # Add the timing information
+                'llmOutcome': question['llmOutcome']
             },
             'createdAt': datetime.now(timezone.utc),
             'updatedAt': datetime.now(timezone.utc)
         }
+        if served_question_id:
+            question_doc['data']['bankQuestionId'] = served_question_id
         
         # Store the question in Firestore
         question_ref.set(question_doc)
@@ -2149,15 +4891,17 @@ def generate_question_from_video(client: OpenAI, video_details: Dict) -> dict:
             - options: List[str]
             - explanation: str
             - llmDuration: float (time taken for LLM response)
+            - llmOutcome: str ('cached', 'primary', 'hedge', 'deadline' or 'error')
     """
     start_time = datetime.now(timezone.utc)
     
+    # Reuse a stored question for unchanged video content; options are reshuffled below
+    cache_key = LLMCache.make_key(LLM_MODEL, QUESTION_PROMPT_VERSION, video_details)
+    response_data = llm_cache.get(cache_key)
+    
     prompt = f"""Based on the following video content, generate an educational question that tests the viewer's understanding.
     
-Video Title: {video_details['title']}
-Video Description: {video_details['description']}
-Video Transcript: {video_details['transcript']}
-Additional Context: {video_details['description2']}
+{format_question_video(video_details)}
 
 Generate a multiple-choice question that:
 1. Mention the video title in the question
@@ -2168,52 +4912,662 @@ Generate a multiple-choice question that:
 6. Uses clear, unambiguous language
 """
 
-    try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini-2024-07-18",
+    def request(cancelled: threading.Event, hedged: bool) -> Dict:
+        completion = client.with_options(timeout=LLM_DEADLINES['question']).beta.chat.completions.parse(
+            model=LLM_MODEL,
             messages=[
-                {"role": "system", "content": "You are an expert educational content creator, skilled at generating clear, unambiguous multiple choice questions that test understanding."},
+                {"role": "system", "content": QUESTION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             response_format=QuestionResponse
         )
-        
-        end_time = datetime.now(timezone.utc)
-        llm_duration = (end_time - start_time).total_seconds()
-        
-        # Get the response data
-        response_data = completion.choices[0].message.parsed.model_dump()
+        return completion.choices[0].message.parsed.model_dump()
 
-        # Shuffle options and update correct answer index
-        options = response_data['options']
-        correct_option = options[0]  # Save the correct answer (which was first)
-        random.shuffle(options)  # Shuffle all options
-        correct_answer = options.index(correct_option)  # Find new index of correct answer
+    try:
+        if response_data is None:
+            response_data, llm_outcome = call_llm_with_deadline('question', request, lambda: None)
+            if response_data is None:
+                return {**fallback_question(), 'llmOutcome': llm_outcome}
+            
+            end_time = datetime.now(timezone.utc)
+            llm_duration = (end_time - start_time).total_seconds()
+            llm_cache.set(cache_key, response_data, LLM_MODEL, QUESTION_PROMPT_VERSION)
+        else:
+            llm_duration = 0.0
+            llm_outcome = 'cached'
         
         # Return shuffled data with timing information
-        return {
-            'questionText': response_data['questionText'],
-            'options': options,
-            'correctAnswer': correct_answer,
-            'explanation': response_data['explanation'],
-            'llmDuration': llm_duration
-        }
+        return {**shuffle_question_options(response_data), 'llmDuration': llm_duration, 'llmOutcome': llm_outcome}
 
     except Exception as e:
         print(f"Error in OpenAI question generation: {str(e)}")
-        # Return the placeholder as fallback
-        return {
-            'questionText': "Looks like we had an error generating a question. Go ahead and pick C...",
-            'options': [
-                "Option A",
-                "Option B",
-                "Option C",
-                "Option D"
+        return {**fallback_question(), 'llmOutcome': 'error'}
+
+def fallback_question() -> dict:
+    """Placeholder question served when generation fails or misses its deadline."""
+    return {
+        'questionText': "Looks like we had an error generating a question. Go ahead and pick C...",
+        'options': [
+            "Option A",
+            "Option B",
+            "Option C",
+            "Option D"
+        ],
+        'correctAnswer': 2,
+        'explanation': "Thought we would try to help you out. Sorry for the inconvenience!",
+        'llmDuration': 0.0
+    }
+
+def shuffle_question_options(question: Dict) -> dict:
+    """Shuffle a question's options, whose first entry is the correct answer.
+    Returns questionText, options, correctAnswer (new index) and explanation;
+    the input question is left untouched so cached questions can be reused."""
+    options = list(question['options'])
+    correct_option = options[0]  # Save the correct answer (which was first)
+    random.shuffle(options)  # Shuffle all options
+    return {
+        'questionText': question['questionText'],
+        'options': options,
+        'correctAnswer': options.index(correct_option),  # Find new index of correct answer
+        'explanation': question['explanation'],
+    }
+
+def question_video_details(video_doc: Any) -> Dict:
+    """Extract the video fields question prompts are built from."""
+    data = video_doc.to_dict()
+    return {
+        'title': data['metadata']['title'],
+        'description': data['metadata']['description'],
+        'transcript': data['metadata']['transcript'],
+        'description2': data['classification']['explicit']['description'],
+    }
+
+# Length cap of the transcript excerpt stored with each video digest
+TRANSCRIPT_EXCERPT_CHARS = int(os.getenv('TRANSCRIPT_EXCERPT_CHARS', '1500'))
+TRANSCRIPT_DIGEST_KEY_POINTS = 6
+TRANSCRIPT_DIGEST_PROMPT_VERSION = 'transcript-digest-v1'
+
+def transcript_hash(transcript: str) -> str:
+    """Hash a transcript so digests can tell when it changed."""
+    return hashlib.sha256((transcript or '').encode()).hexdigest()
+
+def transcript_excerpt(transcript: str, max_chars: int = TRANSCRIPT_EXCERPT_CHARS) -> str:
+    """Cut a transcript to at most max_chars, at a word boundary where possible."""
+    transcript = (transcript or '').strip()
+    if len(transcript) <= max_chars:
+        return transcript
+    excerpt = transcript[:max_chars]
+    if ' ' in excerpt:
+        excerpt = excerpt.rsplit(' ', 1)[0]
+    return excerpt + '...'
+
+def is_current_digest(digest: Optional[Dict], transcript: str) -> bool:
+    """True when a stored digest was made from this transcript with the current prompt."""
+    return bool(digest) and (
+        digest.get('transcriptHash') == transcript_hash(transcript)
+        and digest.get('promptVersion') == TRANSCRIPT_DIGEST_PROMPT_VERSION
+    )
+
+def generate_video_digest(db: Any, client: OpenAI, video_id: str, transcript: str) -> Dict:
+    """Summarize a transcript into key points and store it in videoDigests with
+    a length-capped excerpt and the transcript hash. Returns the digest."""
+    key_points = []
+    if (transcript or '').strip():
+        completion = client.beta.chat.completions.parse(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": "You are an expert educational content creator, skilled at summarizing video transcripts into their key learning points."},
+                {"role": "user", "content": f"List the {TRANSCRIPT_DIGEST_KEY_POINTS} most important points a viewer should learn from this video transcript, one short sentence each.\n\nTranscript: {transcript}"}
             ],
-            'correctAnswer': 2,
-            'explanation': "Thought we would try to help you out. Sorry for the inconvenience!",
-            'llmDuration': 0.0
+            response_format=TranscriptDigestResponse
+        )
+        key_points = [
+            point.strip() for point in completion.choices[0].message.parsed.keyPoints if point.strip()
+        ][:TRANSCRIPT_DIGEST_KEY_POINTS]
+    
+    digest = {
+        'videoId': db.collection('videos').document(video_id),
+        'transcriptHash': transcript_hash(transcript),
+        'keyPoints': key_points,
+        'excerpt': transcript_excerpt(transcript),
+        'model': LLM_MODEL,
+        'promptVersion': TRANSCRIPT_DIGEST_PROMPT_VERSION,
+        'generatedAt': datetime.now(timezone.utc)
+    }
+    db.collection('videoDigests').document(video_id).set(digest)
+    return digest
+
+def apply_video_digest(video_details: Dict, digest: Optional[Dict]) -> Dict:
+    """Swap the full transcript in question video details for the digest's
+    key points and excerpt. Without a current digest the details are unchanged."""
+    if not is_current_digest(digest, video_details['transcript']):
+        return video_details
+    return {**video_details, 'keyPoints': digest.get('keyPoints') or [], 'transcript': digest.get('excerpt', '')}
+
+def digested_video_details(db: Any, client: OpenAI, video_id: str, video_details: Dict, digest_doc: Any) -> Dict:
+    """Apply the video's digest, regenerating it first if the transcript changed.
+    Digest failures are logged and the full transcript is used instead."""
+    digest = digest_doc.to_dict() if digest_doc else None
+    if not is_current_digest(digest, video_details['transcript']):
+        try:
+            digest = generate_video_digest(db, client, video_id, video_details['transcript'])
+        except Exception as e:
+            print(f"Error generating digest for video {video_id}: {str(e)}")
+    return apply_video_digest(video_details, digest)
+
+# Number of questions pre-generated per video in videoQuestionBank
+QUESTION_BANK_SIZE = int(os.getenv('QUESTION_BANK_SIZE', '5'))
+QUESTION_BANK_PROMPT_VERSION = 'question-bank-v2'
+
+def bank_question_id(question: Dict) -> str:
+    """ID of a bank question derived from its text and options, so a regenerated
+    bank gives new questions new IDs and keeps the IDs of unchanged ones."""
+    payload = json.dumps([question['questionText'], question['options']])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def bank_question_doc_id(user_id: str, video_id: str, question_id: str) -> str:
+    """Deterministic questions doc ID for a bank question served to a user, so
+    one batched read tells which of a bank's questions the user has seen."""
+    return f"{user_id}_{video_id}_{question_id}"
+
+def is_valid_bank_question(question: Dict) -> bool:
+    """Check a generated question has text, an explanation and four distinct options."""
+    options = question.get('options') or []
+    return (
+        bool((question.get('questionText') or '').strip())
+        and bool((question.get('explanation') or '').strip())
+        and len(options) == 4
+        and all((option or '').strip() for option in options)
+        and len(set(options)) == 4
+    )
+
+# Failed question bank requests are retried after this many seconds, doubling
+# with every further failure of the same video up to the maximum
+QUESTION_BANK_RETRY_SECONDS = int(os.getenv('QUESTION_BANK_RETRY_SECONDS', '600'))
+QUESTION_BANK_MAX_RETRY_SECONDS = int(os.getenv('QUESTION_BANK_MAX_RETRY_SECONDS', '86400'))
+
+def question_bank_retry_at(failed_at: datetime, failures: int) -> datetime:
+    """When a request that has failed this many times may be enqueued again."""
+    delay = min(QUESTION_BANK_RETRY_SECONDS * 2 ** max(failures - 1, 0), QUESTION_BANK_MAX_RETRY_SECONDS)
+    return failed_at + timedelta(seconds=delay)
+
+def is_question_bank_request_open(request: Dict, now: datetime) -> bool:
+    """Whether a request doc still blocks a new one: pending requests always do,
+    failed ones until their retryAt has passed."""
+    if request.get('status') != 'error':
+        return True
+    retry_at = request.get('retryAt')
+    return retry_at is not None and retry_at > now
+
+def enqueue_question_banks(db: Any, video_ids: Iterable[str]) -> int:
+    """Request question bank generation for videos.
+    
+    Creates questionBankRequests/{videoId}, which fill_question_bank picks up.
+    Videos with a pending request, or a failed one still backing off, are
+    skipped; a failed request past its retryAt is replaced by a new one, which
+    carries the failure count forward. Returns the number of requests created."""
+    def enqueue(video_id: str) -> bool:
+        request_ref = db.collection('questionBankRequests').document(video_id)
+        request = {
+            'videoId': db.collection('videos').document(video_id),
+            'status': 'pending',
+            'requestedAt': datetime.now(timezone.utc)
         }
+        try:
+            request_ref.create(request)
+            return True
+        except AlreadyExists:
+            pass
+        except Exception as e:
+            print(f"Error enqueuing question bank for video {video_id}: {str(e)}")
+            return False
+        
+        try:
+            snapshot = request_ref.get()
+            previous = snapshot.to_dict() if snapshot.exists else None
+            if previous and is_question_bank_request_open(previous, request['requestedAt']):
+                return False
+            if previous:
+                # The precondition lets only one caller replace the failed request;
+                # the create must be a separate write for fill_question_bank to fire
+                request_ref.delete(option=db.write_option(last_update_time=snapshot.update_time))
+                request['failures'] = previous.get('failures', 1)
+            request_ref.create(request)
+            return True
+        except (AlreadyExists, FailedPrecondition):
+            return False
+        except Exception as e:
+            print(f"Error re-enqueuing question bank for video {video_id}: {str(e)}")
+            return False
+    
+    video_ids = list(dict.fromkeys(video_ids))
+    if not video_ids:
+        return 0
+    return sum(run_concurrently(*[lambda video_id=video_id: enqueue(video_id) for video_id in video_ids]))
+
+# Whether get_videos requests question banks for the videos it serves,
+# and how many served videos are checked per request
+QUESTION_PREFETCH_ENABLED = os.getenv('QUESTION_PREFETCH_ENABLED', 'true').lower() == 'true'
+QUESTION_PREFETCH_MAX_VIDEOS = int(os.getenv('QUESTION_PREFETCH_MAX_VIDEOS', '10'))
+
+# Prefetches run on these threads after get_videos has built its response;
+# new ones are dropped while this many are queued or running
+QUESTION_PREFETCH_MAX_THREADS = int(os.getenv('QUESTION_PREFETCH_MAX_THREADS', '2'))
+QUESTION_PREFETCH_MAX_PENDING = int(os.getenv('QUESTION_PREFETCH_MAX_PENDING', '20'))
+_prefetch_executor = ThreadPoolExecutor(max_workers=QUESTION_PREFETCH_MAX_THREADS, thread_name_prefix='prefetch')
+_prefetch_pending = 0
+_prefetch_pending_lock = threading.Lock()
+
+# Only existence and retry state are needed, not the bank's questions
+QUESTION_PREFETCH_FIELD_MASKS = {
+    'videoQuestionBank': ['videoId'],
+    'questionBankRequests': ['status', 'retryAt']
+}
+
+def prefetch_question_banks(db: Any, video_ids: Iterable[str]) -> int:
+    """Request question banks for served videos that have neither a bank nor an
+    open request, so questions are ready before the client asks for one.
+    
+    New requests are created in one batch; if that fails (e.g. another request
+    created one of them first) or a failed request past its retryAt has to be
+    replaced, enqueue_question_banks handles those videos one by one.
+    Errors are logged, never raised. Returns the number of requests created."""
+    if not QUESTION_PREFETCH_ENABLED:
+        return 0
+    try:
+        video_ids = list(dict.fromkeys(video_ids))[:QUESTION_PREFETCH_MAX_VIDEOS]
+        bank_refs = [db.collection('videoQuestionBank').document(video_id) for video_id in video_ids]
+        request_refs = [db.collection('questionBankRequests').document(video_id) for video_id in video_ids]
+        docs = DocumentLoader(db, field_masks=QUESTION_PREFETCH_FIELD_MASKS).get_all(bank_refs + request_refs)
+        now = datetime.now(timezone.utc)
+        new, retry = [], []
+        for video_id, bank_ref, request_ref in zip(video_ids, bank_refs, request_refs):
+            if bank_ref.path in docs:
+                continue
+            if request_ref.path not in docs:
+                new.append((video_id, request_ref))
+            elif not is_question_bank_request_open(docs[request_ref.path].to_dict() or {}, now):
+                retry.append(video_id)
+        
+        created = 0
+        if new:
+            try:
+                batch = db.batch()
+                for video_id, request_ref in new:
+                    batch.create(request_ref, {
+                        'videoId': db.collection('videos').document(video_id),
+                        'status': 'pending',
+                        'requestedAt': now
+                    })
+                batch.commit()
+                created = len(new)
+            except Exception as e:
+                print(f"Error batch enqueuing question banks, enqueuing one by one: {str(e)}")
+                retry = [video_id for video_id, _ in new] + retry
+        return created + enqueue_question_banks(db, retry)
+    except Exception as e:
+        print(f"Error prefetching question banks: {str(e)}")
+        return 0
+
+def schedule_question_bank_prefetch(db: Any, video_ids: Iterable[str]) -> bool:
+    """Run prefetch_question_banks on a background thread, so it adds no reads
+    or writes to the request that served the videos. The prefetch is dropped
+    when QUESTION_PREFETCH_MAX_PENDING are already waiting; the next request
+    for the same videos enqueues them. Returns whether it was scheduled."""
+    global _prefetch_pending
+    video_ids = list(dict.fromkeys(video_ids))
+    if not QUESTION_PREFETCH_ENABLED or not video_ids:
+        return False
+    with _prefetch_pending_lock:
+        if _prefetch_pending >= QUESTION_PREFETCH_MAX_PENDING:
+            return False
+        _prefetch_pending += 1
+    
+    def run() -> None:
+        global _prefetch_pending
+        try:
+            prefetch_question_banks(db, video_ids)
+        finally:
+            with _prefetch_pending_lock:
+                _prefetch_pending -= 1
+    
+    try:
+        _prefetch_executor.submit(run)
+        return True
+    except Exception as e:
+        with _prefetch_pending_lock:
+            _prefetch_pending -= 1
+        print(f"Error scheduling question bank prefetch: {str(e)}")
+        return False
+
+QUESTION_SYSTEM_PROMPT = "You are an expert educational content creator, skilled at generating clear, unambiguous multiple choice questions that test understanding."
+
+QUESTION_BANK_GUIDELINES = """Generate multiple-choice questions that:
+1. Mention the video title in the question
+2. Each test a different concept from the video
+3. Have 4 options where the FIRST option is ALWAYS the correct answer
+4. Include a clear explanation of why the correct answer is right
+5. Ensure wrong options are plausible but clearly incorrect
+6. Use clear, unambiguous language
+"""
+
+def format_question_video(video_details: Dict) -> str:
+    """Format the video fields of a question prompt. With a transcript digest
+    applied (see apply_video_digest) the key points and excerpt replace the
+    full transcript."""
+    if video_details.get('keyPoints') is not None:
+        key_points = '\n'.join(f"- {point}" for point in video_details['keyPoints'])
+        transcript = f"""Key Points:
+{key_points}
+Transcript Excerpt: {video_details['transcript']}"""
+    else:
+        transcript = f"Video Transcript: {video_details['transcript']}"
+    return f"""Video Title: {video_details['title']}
+Video Description: {video_details['description']}
+{transcript}
+Additional Context: {video_details['description2']}"""
+
+def valid_bank_questions(questions: List[QuestionResponse]) -> List[Dict]:
+    """Return the valid generated questions as dicts, without duplicates and at
+    most QUESTION_BANK_SIZE."""
+    generated = [question.model_dump() for question in questions]
+    valid = {}
+    for question in generated:
+        if is_valid_bank_question(question):
+            valid.setdefault(bank_question_id(question), question)
+    return list(valid.values())[:QUESTION_BANK_SIZE]
+
+def question_bank_record(db: Any, video_id: str, questions: List[Dict], content_hash: str, llm_duration: float, batch_size: int = 1) -> Dict:
+    """Build the videoQuestionBank document for generated questions."""
+    return {
+        'videoId': db.collection('videos').document(video_id),
+        'questions': [{'id': bank_question_id(question), **question} for question in questions],
+        'contentHash': content_hash,
+        'model': LLM_MODEL,
+        'promptVersion': QUESTION_BANK_PROMPT_VERSION,
+        'llmDuration': llm_duration,
+        'batchSize': batch_size,
+        'generatedAt': datetime.now(timezone.utc)
+    }
+
+def generate_question_bank(db: Any, client: OpenAI, video_id: str) -> int:
+    """Generate and store the question bank for a video.
+    
+    Asks for QUESTION_BANK_SIZE distinct questions in one structured-output
+    call and keeps the valid ones. A bank generated from the same video content
+    and prompt version is left as is. Returns the number of banked questions."""
+    video_doc = db.collection('videos').document(video_id).get()
+    if not video_doc.exists:
+        raise ValueError(f"Video {video_id} not found")
+    video_details = question_video_details(video_doc)
+    content_hash = LLMCache.make_key(LLM_MODEL, QUESTION_BANK_PROMPT_VERSION, video_details)
+    
+    bank_ref = db.collection('videoQuestionBank').document(video_id)
+    bank_doc = bank_ref.get()
+    if bank_doc.exists and bank_doc.get('contentHash') == content_hash:
+        return len(bank_doc.get('questions') or [])
+    
+    digest_doc = db.collection('videoDigests').document(video_id).get()
+    video_details = digested_video_details(db, client, video_id, video_details, digest_doc if digest_doc.exists else None)
+    
+    prompt = f"""Based on the following video content, generate {QUESTION_BANK_SIZE} educational questions that test the viewer's understanding.
+    
+{format_question_video(video_details)}
+
+{QUESTION_BANK_GUIDELINES}"""
+    
+    start_time = datetime.now(timezone.utc)
+    completion = client.beta.chat.completions.parse(
+        model=LLM_MODEL,
+        messages=[
+            {"role": "system", "content": QUESTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        response_format=QuestionBankResponse
+    )
+    llm_duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+    
+    questions = valid_bank_questions(completion.choices[0].message.parsed.questions)
+    if not questions:
+        raise ValueError(f"No valid questions generated for video {video_id}")
+    
+    bank_ref.set(question_bank_record(db, video_id, questions, content_hash, llm_duration))
+    return len(questions)
+
+# Maximum number of videos sent in one batched question bank request
+QUESTION_BANK_BATCH_SIZE = int(os.getenv('QUESTION_BANK_BATCH_SIZE', '5'))
+
+def request_question_bank_batch(client: OpenAI, videos: List[Dict]) -> Tuple[Dict[int, List[Dict]], float]:
+    """Generate question banks for several videos in one structured-output call.
+    
+    Videos are numbered in the prompt and each result names the number it
+    answers. Results are validated one by one: unknown or repeated numbers are
+    dropped and so are invalid questions. Returns the valid questions by video
+    index and the LLM duration in seconds."""
+    sections = [
+        f"Video {index}:\n{format_question_video(video_details)}"
+        for index, video_details in enumerate(videos)
+    ]
+    prompt = f"""Based on the following {len(videos)} videos, generate {QUESTION_BANK_SIZE} educational questions for EACH video that test the viewer's understanding.
+Return one result per video with its videoIndex; each video's questions must only be about that video.
+
+{chr(10).join(sections)}
+
+{QUESTION_BANK_GUIDELINES}"""
+    
+    start_time = datetime.now(timezone.utc)
+    completion = client.beta.chat.completions.parse(
+        model=LLM_MODEL,
+        messages=[
+            {"role": "system", "content": QUESTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        response_format=QuestionBankBatchResponse
+    )
+    llm_duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+    
+    banks = {}
+    for item in completion.choices[0].message.parsed.videos:
+        if not 0 <= item.videoIndex < len(videos) or item.videoIndex in banks:
+            print(f"Dropping batched question result for video index {item.videoIndex}")
+            continue
+        questions = valid_bank_questions(item.questions)
+        if questions:
+            banks[item.videoIndex] = questions
+    return banks, llm_duration
+
+def generate_question_banks(db: Any, client: OpenAI, video_ids: Iterable[str]) -> Dict[str, int]:
+    """Generate and store question banks for many videos, e.g. a new catalog.
+    
+    Videos whose bank is up to date are skipped; the rest are sent
+    QUESTION_BANK_BATCH_SIZE at a time through request_question_bank_batch.
+    Videos a batch returns no valid questions for are retried on their own
+    with generate_question_bank. Returns the banked question count per video
+    ID, 0 where generation failed."""
+    video_ids = list(dict.fromkeys(video_ids))
+    video_refs = [db.collection('videos').document(video_id) for video_id in video_ids]
+    bank_refs = [db.collection('videoQuestionBank').document(video_id) for video_id in video_ids]
+    digest_refs = [db.collection('videoDigests').document(video_id) for video_id in video_ids]
+    docs = DocumentLoader(db).get_all(video_refs + bank_refs + digest_refs)
+    
+    results = {}
+    pending = []  # (video_id, bank_ref, video_details, content_hash)
+    for video_id, video_ref, bank_ref, digest_ref in zip(video_ids, video_refs, bank_refs, digest_refs):
+        video_doc = docs.get(video_ref.path)
+        if not video_doc:
+            print(f"Skipping question bank for missing video {video_id}")
+            results[video_id] = 0
+            continue
+        video_details = question_video_details(video_doc)
+        content_hash = LLMCache.make_key(LLM_MODEL, QUESTION_BANK_PROMPT_VERSION, video_details)
+        bank_doc = docs.get(bank_ref.path)
+        if bank_doc and bank_doc.get('contentHash') == content_hash:
+            results[video_id] = len(bank_doc.get('questions') or [])
+            continue
+        pending.append((video_id, bank_ref, video_details, content_hash, docs.get(digest_ref.path)))
+    
+    # Refresh missing or outdated transcript digests concurrently before batching
+    if pending:
+        pending = [
+            (video_id, bank_ref, video_details, content_hash)
+            for (video_id, bank_ref, _, content_hash, _), video_details in zip(pending, run_concurrently(*[
+                lambda item=item: digested_video_details(db, client, item[0], item[2], item[4])
+                for item in pending
+            ]))
+        ]
+    
+    for i in range(0, len(pending), QUESTION_BANK_BATCH_SIZE):
+        chunk = pending[i:i + QUESTION_BANK_BATCH_SIZE]
+        try:
+            banks, llm_duration = request_question_bank_batch(client, [video_details for _, _, video_details, _ in chunk])
+        except Exception as e:
+            print(f"Error in batched question bank generation: {str(e)}")
+            banks, llm_duration = {}, 0.0
+        
+        batch = db.batch()
+        retry = []
+        for index, (video_id, bank_ref, _, content_hash) in enumerate(chunk):
+            questions = banks.get(index)
+            if not questions:
+                retry.append(video_id)
+                continue
+            batch.set(bank_ref, question_bank_record(db, video_id, questions, content_hash, llm_duration, len(chunk)))
+            results[video_id] = len(questions)
+        if len(retry) < len(chunk):
+            batch.commit()
+        
+        for video_id in retry:
+            try:
+                results[video_id] = generate_question_bank(db, client, video_id)
+            except Exception as e:
+                print(f"Error generating question bank for video {video_id}: {str(e)}")
+                results[video_id] = 0
+    
+    return results
+
+@firestore_fn.on_document_created(document="questionBankRequests/{videoId}", timeout_sec=120)
+def fill_question_bank(event: firestore_fn.Event[firestore_fn.DocumentSnapshot]) -> None:
+    """Generate the question bank for a requested video.
+    Successful requests are deleted; failed ones stay with status 'error' and a
+    retryAt, after which enqueue_question_banks replaces them."""
+    video_id = event.params['videoId']
+    db = firestore.client()
+    request_ref = db.collection('questionBankRequests').document(video_id)
+    try:
+        generate_question_bank(db, get_openai_client(), video_id)
+        request_ref.delete()
+    except Exception as e:
+        print(f"Error generating question bank for video {video_id}: {str(e)}")
+        request = event.data.to_dict() if event.data else None
+        failures = (request or {}).get('failures', 0) + 1
+        failed_at = datetime.now(timezone.utc)
+        request_ref.update({
+            'status': 'error',
+            'error': str(e),
+            'failedAt': failed_at,
+            'failures': failures,
+            'retryAt': question_bank_retry_at(failed_at, failures)
+        })
+
+# Maximum number of catalog videos handled by one backfill_question_banks call
+QUESTION_BACKFILL_MAX_VIDEOS = 100
+
+def catalog_page_query(db: Any, limit: int, start_after: Optional[str] = None) -> Any:
+    """Query a page of video IDs ordered by document ID, after the start_after video ID.
+    Only IDs are read; generate_question_banks loads the videos it generates for."""
+    videos_ref = db.collection('videos')
+    query = videos_ref.order_by('__name__').select(['__name__']).limit(limit)
+    if start_after:
+        # Cursors take field values; a bare DocumentReference is rejected
+        query = query.start_after({'__name__': videos_ref.document(start_after)})
+    return query
+
+@https_fn.on_request(timeout_sec=540)
+def backfill_question_banks(req: https_fn.Request) -> https_fn.Response:
+    """Fill question banks for a list of videos or a page of the catalog using
+    batched generation. Restricted to internal service calls.
+    
+    Body: {videoIds?: [...]} or {limit?: int, startAfter?: videoId}; catalog
+    pages are ordered by video ID and the response carries nextStartAfter."""
+    cors_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        'Access-Control-Max-Age': '3600',
+    }
+    
+    # Handle OPTIONS request (preflight)
+    if req.method == 'OPTIONS':
+        return https_fn.Response('', headers=cors_headers, status=204)
+    
+    # Verify authentication
+    auth_header = req.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return https_fn.Response(
+            json.dumps({'error': 'Unauthorized - Invalid token format'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    token = auth_header.split('Bearer ')[1]
+    
+    try:
+        caller_id = verify_request_token(token, 'backfill_question_banks')
+        if caller_id != 'service-account':
+            return https_fn.Response(
+                json.dumps({'error': 'Unauthorized - Service access required'}),
+                status=403,
+                headers=cors_headers,
+                content_type='application/json'
+            )
+    except Exception as e:
+        return https_fn.Response(
+            json.dumps({'error': f'Authentication error: {str(e)}'}),
+            status=401,
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    
+    try:
+        request_json = req.get_json(silent=True) or {}
+        video_ids = request_json.get('videoIds') or []
+        limit = int(request_json.get('limit', QUESTION_BACKFILL_MAX_VIDEOS))
+        if len(video_ids) > QUESTION_BACKFILL_MAX_VIDEOS or not 1 <= limit <= QUESTION_BACKFILL_MAX_VIDEOS:
+            return https_fn.Response(
+                json.dumps({'error': f'At most {QUESTION_BACKFILL_MAX_VIDEOS} videos per call'}),
+                status=400,
+                headers=cors_headers,
+                content_type='application/json'
+            )
+        
+        db = firestore.client()
+        next_start_after = None
+        if not video_ids:
+            query = catalog_page_query(db, limit, request_json.get('startAfter'))
+            video_ids = [doc.id for doc in query.get()]
+            if len(video_ids) == limit:
+                next_start_after = video_ids[-1]
+        
+        results = generate_question_banks(db, get_openai_client(), video_ids)
+        return https_fn.Response(
+            json.dumps({
+                'success': True,
+                'videos': len(results),
+                'failed': [video_id for video_id, count in results.items() if not count],
+                'nextStartAfter': next_start_after
+            }),
+            headers=cors_headers,
+            content_type='application/json'
+        )
+    except Exception as e:
+        print(f"Error backfilling question banks: {str(e)}")
+        return https_fn.Response(
+            json.dumps({'error': f'Error backfilling question banks: {str(e)}'}),
+            status=500,
+            headers=cors_headers,
+            content_type='application/json'
+        )
 
 @https_fn.on_request()
 def retrieve_suggested_class_tags(req: https_fn.Request) -> https_fn.Response:
@@ -2354,9 +5708,12 @@ def retrieve_suggested_class_tags(req: https_fn.Request) -> https_fn.Response:
         # Firestore operations
         try:
             db = firestore.client()
+            tag_docs = DocumentLoader(db).get_all(
+                db.collection('videoTags').document(tag_id) for tag_id in tag_ids
+            )
             for tag_id in tag_ids:
-                tag_doc = db.collection('videoTags').document(tag_id).get()
-                if tag_doc.exists:
+                tag_doc = tag_docs.get(f'videoTags/{tag_id}')
+                if tag_doc:
                     tag_data = tag_doc.to_dict()
                     tag_details.append({
                         'id': tag_id,
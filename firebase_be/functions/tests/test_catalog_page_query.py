@@ -0,0 +1,38 @@
+"""Tests for the catalog paging used by backfill_question_banks.
+
+Queries are built against a real Firestore client (anonymous credentials,
+no network) and checked through the protobuf sent to the backend."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+firestore_v1 = pytest.importorskip('google.cloud.firestore_v1')
+credentials = pytest.importorskip('google.auth.credentials')
+main = pytest.importorskip('main')
+
+PROJECT = 'test-project'
+
+
+@pytest.fixture
+def db():
+    return firestore_v1.Client(project=PROJECT, credentials=credentials.AnonymousCredentials())
+
+
+def test_first_page_has_no_cursor(db):
+    query_pb = main.catalog_page_query(db, 10)._to_protobuf()
+
+    assert 'start_at' not in query_pb
+    assert [order.field.field_path for order in query_pb.order_by] == ['__name__']
+    assert [field.field_path for field in query_pb.select.fields] == ['__name__']
+
+
+def test_start_after_cursor_points_at_the_video(db):
+    query_pb = main.catalog_page_query(db, 10, 'video123')._to_protobuf()
+
+    assert not query_pb.start_at.before
+    assert [value.reference_value for value in query_pb.start_at.values] == [
+        f'projects/{PROJECT}/databases/(default)/documents/videos/video123'
+    ]
@@ -0,0 +1,676 @@
+"""Load test for the scheduled report pipeline.
+
+Runs the real report pipeline from functions/main.py (_trigger_reports:
+target discovery, job queue, in-process workers, data collection, prompt
+building and LLM calls) against stand-ins, so it costs nothing:
+
+- an in-memory Firestore fake covering the client API the pipeline uses
+- a local fake OpenAI server with configurable latency, 429 and 500 rates
+
+Synthetic users, classes, videos and activity are seeded at the requested
+scale, then the run's throughput, tail latency and failure rates are printed.
+
+Example:
+    python load_test_reports.py --users 500 --classes 50 --latency-ms 800 --rate-limit-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+
+class FakeArrayUnion:
+    def __init__(self, values: List[Any]):
+        self.values = list(values)
+
+
+class FakeIncrement:
+    def __init__(self, value: float):
+        self.value = value
+
+
+def normalize(value: Any) -> Any:
+    """Store datetimes as UTC-aware values, like Firestore returns them."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+def get_field(data: Dict, field_path: str) -> Any:
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def apply_field_mask(data: Optional[Dict], field_paths: Optional[List[str]]) -> Optional[Dict]:
+    """Keep only the given field paths, as get_all(field_paths=...) does."""
+    if data is None or field_paths is None:
+        return data
+    masked: Dict = {}
+    for field_path in field_paths:
+        value = get_field(data, field_path)
+        if value is None:
+            continue
+        *parents, name = field_path.split('.')
+        target = masked
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[name] = value
+    return masked
+
+
+def apply_value(current: Any, value: Any) -> Any:
+    if isinstance(value, FakeArrayUnion):
+        merged = list(current) if isinstance(current, list) else []
+        merged.extend(item for item in value.values if item not in merged)
+        return merged
+    if isinstance(value, FakeIncrement):
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    if isinstance(value, dict):
+        return {key: apply_value(None, item) for key, item in value.items()}
+    return normalize(value)
+
+
+def deep_merge(current: Dict, update: Dict) -> Dict:
+    merged = dict(current)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = apply_value(merged.get(key), value)
+    return merged
+
+
+class FakeSnapshot:
+    def __init__(self, reference: 'FakeDocumentReference', data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return json_copy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str) -> Any:
+        return get_field(self._data or {}, field_path)
+
+
+def json_copy(value: Any) -> Any:
+    """Copy nested dicts and lists, keeping references and datetimes as they are."""
+    if isinstance(value, dict):
+        return {key: json_copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_copy(item) for item in value]
+    return value
+
+
+class FakeDocumentReference:
+    def __init__(self, db: 'FakeFirestore', collection: str, doc_id: str):
+        self._db = db
+        self.id = doc_id
+        self.path = f'{collection}/{doc_id}'
+        self.collection_name = collection
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def get(self, transaction: Any = None) -> FakeSnapshot:
+        self._db.simulate_latency()
+        with self._db.lock:
+            return FakeSnapshot(self, self._db.docs.get(self.path))
+
+    def set(self, data: Dict, merge: bool = False) -> None:
+        self._db.simulate_latency()
+        with self._db.lock:
+            current = self._db.docs.get(self.path) or {}
+            if merge:
+                self._db.docs[self.path] = deep_merge(current, data)
+            else:
+                self._db.docs[self.path] = {key: apply_value(None, value) for key, value in data.items()}
+
+    def create(self, data: Dict) -> None:
+        with self._db.lock:
+            if self.path in self._db.docs:
+                raise AlreadyExists(f'Document already exists: {self.path}')
+            self.set(data)
+
+    def update(self, data: Dict) -> None:
+        self._db.simulate_latency()
+        with self._db.lock:
+            if self.path not in self._db.docs:
+                raise NotFound(f'No document to update: {self.path}')
+            current = self._db.docs[self.path]
+            for key, value in data.items():
+                parts = key.split('.')
+                target = current
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = apply_value(target.get(parts[-1]), value)
+
+    def delete(self) -> None:
+        self._db.simulate_latency()
+        with self._db.lock:
+            self._db.docs.pop(self.path, None)
+
+
+class FakeQuery:
+    def __init__(self, db: 'FakeFirestore', collection: str, filters=None, orders=None, limit_count=None, offset_count=0):
+        self._db = db
+        self._collection = collection
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit_count
+        self._offset = offset_count
+
+    def _copy(self, **changes) -> 'FakeQuery':
+        state = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit_count': self._limit,
+            'offset_count': self._offset
+        }
+        state.update(changes)
+        return FakeQuery(self._db, self._collection, **state)
+
+    def where(self, field_path: str, op: str, value: Any) -> 'FakeQuery':
+        return self._copy(filters=self._filters + [(field_path, op, normalize(value))])
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING') -> 'FakeQuery':
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count: int) -> 'FakeQuery':
+        return self._copy(limit_count=count)
+
+    def offset(self, count: int) -> 'FakeQuery':
+        return self._copy(offset_count=count)
+
+    def select(self, field_paths: List[str]) -> 'FakeQuery':
+        return self
+
+    def _matches(self, data: Dict) -> bool:
+        for field_path, op, value in self._filters:
+            field_value = get_field(data, field_path)
+            try:
+                if op == '==' and not field_value == value:
+                    return False
+                if op == 'array_contains' and not (isinstance(field_value, list) and value in field_value):
+                    return False
+                if op in ('<', '<=', '>', '>='):
+                    if field_value is None or type(field_value) is not type(value) and not (
+                        isinstance(field_value, datetime) and isinstance(value, datetime)
+                    ):
+                        return False
+                    if op == '<' and not field_value < value:
+                        return False
+                    if op == '<=' and not field_value <= value:
+                        return False
+                    if op == '>' and not field_value > value:
+                        return False
+                    if op == '>=' and not field_value >= value:
+                        return False
+            except TypeError:
+                return False
+        return True
+
+    def get(self) -> List[FakeSnapshot]:
+        self._db.simulate_latency()
+        prefix = f'{self._collection}/'
+        with self._db.lock:
+            matches = [
+                (path, data) for path, data in self._db.docs.items()
+                if path.startswith(prefix) and '/' not in path[len(prefix):] and self._matches(data)
+            ]
+        for field_path, direction in reversed(self._orders):
+            matches.sort(
+                key=lambda item: (get_field(item[1], field_path) is None, get_field(item[1], field_path)),
+                reverse=direction == 'DESCENDING'
+            )
+        matches = matches[self._offset:]
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        return [
+            FakeSnapshot(FakeDocumentReference(self._db, self._collection, path[len(prefix):]), data)
+            for path, data in matches
+        ]
+
+    def stream(self):
+        return iter(self.get())
+
+    def count(self) -> SimpleNamespace:
+        return SimpleNamespace(get=lambda: [[SimpleNamespace(value=len(self.get()))]])
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: 'FakeFirestore', name: str):
+        super().__init__(db, name)
+        self.id = name
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._db, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict):
+        doc_ref = self.document()
+        doc_ref.set(data)
+        return datetime.now(timezone.utc), doc_ref
+
+
+class FakeWriteBatch:
+    def __init__(self, db: 'FakeFirestore'):
+        self._db = db
+        self._ops = []
+
+    def create(self, doc_ref: FakeDocumentReference, data: Dict) -> None:
+        self._ops.append(('create', doc_ref, data))
+
+    def set(self, doc_ref: FakeDocumentReference, data: Dict, merge: bool = False) -> None:
+        self._ops.append(('set', doc_ref, (data, merge)))
+
+    def update(self, doc_ref: FakeDocumentReference, data: Dict) -> None:
+        self._ops.append(('update', doc_ref, data))
+
+    def commit(self) -> None:
+        with self._db.lock:
+            # Batches are atomic: fail before writing anything
+            for op, doc_ref, _ in self._ops:
+                if op == 'create' and doc_ref.path in self._db.docs:
+                    raise AlreadyExists(f'Document already exists: {doc_ref.path}')
+            for op, doc_ref, data in self._ops:
+                if op == 'set':
+                    doc_ref.set(data[0], merge=data[1])
+                else:
+                    getattr(doc_ref, op)(data)
+
+
+class FakeTransaction:
+    def __init__(self, db: 'FakeFirestore'):
+        self.db = db
+
+    def set(self, doc_ref: FakeDocumentReference, data: Dict, merge: bool = False) -> None:
+        doc_ref.set(data, merge=merge)
+
+    def update(self, doc_ref: FakeDocumentReference, data: Dict) -> None:
+        doc_ref.update(data)
+
+    def create(self, doc_ref: FakeDocumentReference, data: Dict) -> None:
+        doc_ref.create(data)
+
+    def delete(self, doc_ref: FakeDocumentReference) -> None:
+        doc_ref.delete()
+
+
+def fake_transactional(func):
+    """Transactions run serialized under the fake's lock, so they never conflict."""
+    def run(transaction: FakeTransaction, *args, **kwargs):
+        with transaction.db.lock:
+            return func(transaction, *args, **kwargs)
+    return run
+
+
+class FakeFirestore:
+    """In-memory stand-in for the Firestore client.
+    Every read and write can be delayed by latency_ms to mimic network round trips."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.docs: Dict[str, Dict] = {}
+        self.lock = threading.RLock()
+        self.latency_ms = latency_ms
+        self.operations = 0
+
+    def simulate_latency(self) -> None:
+        self.operations += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def get_all(self, refs: List[FakeDocumentReference], field_paths: Optional[List[str]] = None):
+        self.simulate_latency()
+        with self.lock:
+            return [FakeSnapshot(ref, apply_field_mask(self.docs.get(ref.path), field_paths)) for ref in refs]
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+
+class FakeOpenAIServer:
+    """Local OpenAI-compatible chat completions endpoint with injected latency and errors.
+    The latency is spent before the first byte; streamed responses then send
+    one word every token_interval_ms."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, rate_limit_rate: float, error_rate: float, token_interval_ms: float = 20.0):
+        self.latency_ms = latency_ms
+        self.token_interval_ms = token_interval_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.stats = Counter()
+        self.base_url = None
+        self._ready = threading.Event()
+
+    async def handle_chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.stats['requests'] += 1
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.stats['rateLimited'] += 1
+            return web.json_response(
+                {'error': {'message': 'Rate limit reached (load test)', 'type': 'rate_limit_error', 'code': 'rate_limit_exceeded'}},
+                status=429
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats['errors'] += 1
+            return web.json_response(
+                {'error': {'message': 'Internal error (load test)', 'type': 'server_error', 'code': None}},
+                status=500
+            )
+
+        prompt_chars = sum(len(message.get('content') or '') for message in body.get('messages', []))
+        content = "Synthetic progress report generated by the load test server."
+        usage = {
+            'prompt_tokens': prompt_chars // 4,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': prompt_chars // 4 + len(content) // 4
+        }
+        self.stats['completed'] += 1
+        if body.get('stream'):
+            return await self.stream_chat(request, body, content, usage)
+        return web.json_response({
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4o-mini'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': usage
+        })
+
+    async def stream_chat(self, request: web.Request, body: Dict, content: str, usage: Dict) -> web.StreamResponse:
+        """Send the completion as server-sent events, one word per chunk, then usage."""
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+
+        async def send(choices: List[Dict], chunk_usage: Optional[Dict] = None) -> None:
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'gpt-4o-mini'),
+                'choices': choices,
+                'usage': chunk_usage
+            }
+            await response.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+
+        for word in content.split(' '):
+            await send([{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}])
+            await asyncio.sleep(self.token_interval_ms / 1000)
+        await send([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        await send([], usage)
+        await response.write(b'data: [DONE]\n\n')
+        await response.write_eof()
+        return response
+
+    def _serve(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle_chat)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        host, port = runner.addresses[0][:2]
+        self.base_url = f'http://{host}:{port}/v1'
+        self._ready.set()
+        loop.run_forever()
+
+    def start(self) -> str:
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+        return self.base_url
+
+
+def random_moment(start: datetime, end: datetime) -> datetime:
+    return start + (end - start) * random.random()
+
+
+def seed_data(main: Any, db: FakeFirestore, args: argparse.Namespace, start: datetime, end: datetime) -> None:
+    """Create synthetic users, classes, videos and activity in the report window.
+    Daily rollups and the activity index are maintained the same way the
+    Firestore triggers do it."""
+    now = datetime.now(timezone.utc)
+    hashtags = [f'topic{i}' for i in range(40)]
+
+    user_refs = []
+    for i in range(args.users):
+        user_ref = db.collection('users').document(f'user{i:06d}')
+        user_ref.set({
+            'createdAt': now - timedelta(days=400),
+            'email': f'user{i}@example.com',
+            'profile': {'displayName': f'Load Test User {i}', 'biography': 'Synthetic user'},
+            'uid': user_ref.id
+        })
+        user_refs.append(user_ref)
+
+    video_refs = []
+    for i in range(args.videos):
+        video_ref = db.collection('videos').document(f'video{i:06d}')
+        video_ref.set({
+            'creator': random.choice(user_refs),
+            'metadata': {
+                'title': f'Synthetic video {i}',
+                'description': 'A short synthetic lesson used by the load test.',
+                'transcript': 'Synthetic transcript. ' * args.transcript_words,
+                'uploadedAt': now - timedelta(days=500)
+            },
+            'classification': {
+                'explicit': {
+                    'description': 'Synthetic classification description.',
+                    'hashtags': random.sample(hashtags, 3)
+                }
+            }
+        })
+        video_refs.append(video_ref)
+
+    for i in range(args.classes):
+        class_ref = db.collection('classes').document(f'class{i:05d}')
+        members = random.sample(user_refs, min(len(user_refs), args.members_per_class))
+        class_ref.set({
+            'title': f'Synthetic class {i}',
+            'description': 'A synthetic class used by the load test.',
+            'creator': members[0] if members else None,
+            'memberCount': len(members),
+            'isPublic': True,
+            'createdAt': now - timedelta(days=400)
+        })
+        for member_ref in members:
+            joined_at = random_moment(start, end)
+            db.collection('classMembership').document(f'{member_ref.id}_{class_ref.id}').set({
+                'classId': class_ref,
+                'userId': member_ref,
+                'role': 'follower',
+                'joinedAt': joined_at
+            })
+            main.update_daily_rollup(
+                db, 'classDailyActivity', 'classId', class_ref, joined_at,
+                {'membersJoined': 1}, {'members': [member_ref.id]}
+            )
+
+    class_refs = [db.collection('classes').document(f'class{i:05d}') for i in range(args.classes)]
+    for user_ref in user_refs:
+        if random.random() >= args.active_fraction:
+            continue
+        for _ in range(random.randint(1, args.events_per_user)):
+            video_ref = random.choice(video_refs)
+            moment = random_moment(start, end)
+            kind = random.choice(['view', 'view', 'like', 'bookmark', 'comprehension'])
+            if kind == 'view':
+                db.collection('userViews').add({'userId': user_ref, 'videoId': video_ref, 'watchedAt': moment})
+                main.update_daily_rollup(db, 'userDailyActivity', 'userId', user_ref, moment, {'views': 1}, {})
+            elif kind in ('like', 'bookmark'):
+                class_ids = random.sample(class_refs, min(len(class_refs), random.randint(0, 2)))
+                collection, field, count_name, list_name = (
+                    ('userLikes', 'likedAt', 'likes', 'liked') if kind == 'like'
+                    else ('userBookmarks', 'addedAt', 'bookmarks', 'bookmarked')
+                )
+                data = {'userId': user_ref, 'videoId': video_ref, 'classId': class_ids, field: moment}
+                db.collection(collection).add(data)
+                main.update_daily_rollup(
+                    db, 'userDailyActivity', 'userId', user_ref, moment,
+                    {count_name: 1}, {list_name: [video_ref.id]}
+                )
+                main.rollup_class_activity(db, None, data, moment, count_name, list_name)
+            else:
+                level = random.choice(main.COMPREHENSION_LEVELS)
+                db.collection('videoComprehension').document(f'{user_ref.id}_{video_ref.id}').set({
+                    'userId': user_ref,
+                    'videoId': video_ref,
+                    'comprehensionLevel': level,
+                    'watchCount': random.randint(1, 4),
+                    'assessedAt': moment
+                })
+                main.update_daily_rollup(
+                    db, 'userDailyActivity', 'userId', user_ref, moment,
+                    {level: 1}, {level: [video_ref.id]}
+                )
+
+    # Every seeded event went into the rollups, so they cover all history
+    db.collection('activityRollupState').document('coverage').set({
+        'coveredFrom': main.ROLLUP_COVERAGE_ALL,
+        'updatedAt': now
+    })
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load test the report pipeline against Firestore and OpenAI stand-ins.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=300)
+    parser.add_argument('--members-per-class', type=int, default=15)
+    parser.add_argument('--active-fraction', type=float, default=0.8, help='share of users with activity in the window')
+    parser.add_argument('--events-per-user', type=int, default=12, help='maximum events per active user')
+    parser.add_argument('--transcript-words', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=1500.0, help='mean fake LLM latency')
+    parser.add_argument('--jitter-ms', type=float, default=500.0, help='standard deviation of fake LLM latency')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.02, help='share of LLM calls answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='share of LLM calls answered with 500')
+    parser.add_argument('--token-interval-ms', type=float, default=20.0, help='delay between streamed completion chunks')
+    parser.add_argument('--firestore-latency-ms', type=float, default=5.0, help='delay added to every Firestore operation')
+    parser.add_argument('--workers', type=int, default=8, help='REPORT_MAX_WORKERS for the run')
+    parser.add_argument('--retry-base-delay', type=float, default=0.5, help='REPORT_RETRY_BASE_DELAY for the run')
+    parser.add_argument('--period-mode', choices=['single', 'multi'], default='single', help='REPORT_PERIOD_MODE for the run')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+
+    # Engine settings are read when main.py is imported
+    os.environ.update({
+        'OPENAI_API_KEY': 'load-test',
+        'REPORT_DISPATCH_MODE': 'inprocess',
+        'REPORT_MAX_WORKERS': str(args.workers),
+        'REPORT_RETRY_BASE_DELAY': str(args.retry_base_delay),
+        'REPORT_PERIOD_MODE': args.period_mode
+    })
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions'))
+    import main as functions_main
+    from openai import OpenAI
+
+    server = FakeOpenAIServer(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.error_rate, args.token_interval_ms)
+    base_url = server.start()
+
+    # Swap the Firestore module and the shared OpenAI client for the stand-ins
+    db = FakeFirestore()
+    functions_main.firestore = SimpleNamespace(
+        client=lambda: db,
+        transactional=fake_transactional,
+        ArrayUnion=FakeArrayUnion,
+        Increment=FakeIncrement,
+        Query=SimpleNamespace(ASCENDING='ASCENDING', DESCENDING='DESCENDING')
+    )
+    functions_main._openai_client = OpenAI(api_key='load-test', base_url=base_url, max_retries=0)
+
+    periods = functions_main.get_due_report_periods()
+    if args.period_mode == 'single':
+        periods = periods[:1]
+    window_start = min(period_start for _, period_start, _ in periods)
+    window_end = max(period_end for _, _, period_end in periods)
+
+    print(f"Seeding {args.users} users, {args.classes} classes and {args.videos} videos "
+          f"for {'+'.join(period_type for period_type, _, _ in periods)} reports...")
+    seed_started = time.time()
+    seed_data(functions_main, db, args, window_start - timedelta(days=1), window_end)
+    print(f"Seeded {len(db.docs)} documents in {time.time() - seed_started:.1f}s")
+
+    db.latency_ms = args.firestore_latency_ms
+    db.operations = 0
+    print(f"Running the report pipeline (LLM {args.latency_ms:.0f}±{args.jitter_ms:.0f}ms, "
+          f"{args.rate_limit_rate:.0%} rate limited, {args.error_rate:.0%} errors)...")
+    run_started = time.time()
+    functions_main._trigger_reports()
+    wall_seconds = time.time() - run_started
+
+    runs = [doc.to_dict() for doc in db.collection('reportRuns').get()]
+    jobs = Counter(doc.to_dict().get('status') for doc in db.collection('reportJobs').get())
+    summary = runs[-1] if runs else {}
+    total_jobs = sum(jobs.values())
+    failed = jobs.get('failed', 0) + jobs.get('pending', 0) + jobs.get('leased', 0)
+    llm_outcomes = Counter(
+        doc.to_dict().get('reportData', {}).get('promptStats', {}).get('llmOutcome')
+        for collection in ('userProgressReports', 'classProgressReports')
+        for doc in db.collection(collection).get()
+    )
+
+    print("\nLoad test results:")
+    print("-" * 30)
+    print(f"Report jobs:          {total_jobs} ({dict(jobs)})")
+    print(f"Wall time:            {wall_seconds:.1f}s")
+    print(f"Reports per minute:   {summary.get('reportsPerMinute', 0):.1f}")
+    print(f"Latency p50 / p95:    {summary.get('latencyP50', 0):.2f}s / {summary.get('latencyP95', 0):.2f}s")
+    print(f"Job failure rate:     {failed / total_jobs if total_jobs else 0:.2%}")
+    print(f"LLM requests:         {server.stats['requests']} "
+          f"({server.stats['rateLimited']} rate limited, {server.stats['errors']} errors)")
+    print(f"LLM outcomes:         {dict(llm_outcomes)}")
+    print(f"Retries:              {summary.get('retries', 0)}")
+    print(f"Concurrency min/final/ceiling: {summary.get('concurrencyMin')}/"
+          f"{summary.get('concurrencyFinal')}/{summary.get('concurrencyCeiling')}")
+    print(f"Firestore operations: {db.operations}")
+    print(f"\nRun summary: {json.dumps(summary, indent=2, default=str)}")
+
+if __name__ == "__main__":
+    main()
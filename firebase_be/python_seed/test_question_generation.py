@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta, timezone
+import argparse
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 import json
 import os
 from dotenv import load_dotenv
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import random
 from openai import OpenAI
 from pydantic import BaseModel, Field
@@ -25,6 +26,12 @@ class QuestionResponse(BaseModel):
     options: List[str] = Field(..., description="Four possible answer options, with the first one being correct")
     explanation: str = Field(..., description="Detailed explanation of why the correct answer is right")
 
+class BatchQuestionItem(QuestionResponse):
+    videoIndex: int = Field(..., description="Number of the video this question is about, as given in the prompt")
+
+class BatchQuestionResponse(BaseModel):
+    questions: List[BatchQuestionItem] = Field(..., description="One question per video in the prompt")
+
 def generate_test_question(user_id: str, video_ids: List[str]):
     """Generate a test question for the given user and video context."""
     try:
@@ -220,7 +227,137 @@ Generate a multiple-choice question that:
             'explanation': "This is a placeholder explanation for the correct answer."
         }
 
+def shuffle_question(response_data: Dict) -> dict:
+    """Shuffle options (first one correct) and return the question with the new correct index."""
+    options = list(response_data['options'])
+    correct_option = options[0]
+    random.shuffle(options)
+    return {
+        'questionText': response_data['questionText'],
+        'options': options,
+        'correctAnswer': options.index(correct_option),
+        'explanation': response_data['explanation']
+    }
+
+def is_valid_question(question: Dict) -> bool:
+    """Check a generated question has text, an explanation and four distinct options."""
+    options = question.get('options') or []
+    return (
+        bool((question.get('questionText') or '').strip())
+        and bool((question.get('explanation') or '').strip())
+        and len(options) == 4
+        and all((option or '').strip() for option in options)
+        and len(set(options)) == 4
+    )
+
+def generate_questions_from_videos(client: OpenAI, videos: List[Dict]) -> List[Optional[dict]]:
+    """
+    Generate one question per video for several videos in a single OpenAI request.
+    
+    Args:
+        client: OpenAI client instance
+        videos: List of video details dictionaries (title, description, transcript, etc.)
+        
+    Returns:
+        List[Optional[dict]]: Shuffled question per video, in input order. Each result
+        is validated on its own; None where the batch returned no valid question.
+    """
+    sections = [
+        f"""Video {index}:
+Video Title: {video_details['title']}
+Video Description: {video_details['description']}
+Video Transcript: {video_details['transcript']}
+Additional Context: {video_details['description2']}"""
+        for index, video_details in enumerate(videos)
+    ]
+    prompt = f"""Based on the following {len(videos)} videos, generate one educational question for EACH video that tests the viewer's understanding.
+Return one question per video with its videoIndex; each question must only be about that video.
+
+{chr(10).join(sections)}
+
+Generate multiple-choice questions that:
+1. Test comprehension of the main concepts
+2. Have 4 options where the FIRST option is ALWAYS the correct answer
+3. Include a clear explanation of why the correct answer is right
+4. Ensure wrong options are plausible but clearly incorrect
+5. Use clear, unambiguous language
+6. Mention the video title in the question
+"""
+
+    results: List[Optional[dict]] = [None] * len(videos)
+    try:
+        completion = client.beta.chat.completions.parse(
+            model="gpt-4o-mini-2024-07-18",
+            messages=[
+                {"role": "system", "content": "You are an expert educational content creator, skilled at generating clear, unambiguous multiple choice questions that test understanding."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format=BatchQuestionResponse
+        )
+        
+        for item in completion.choices[0].message.parsed.questions:
+            response_data = item.model_dump()
+            index = response_data.pop('videoIndex')
+            if not 0 <= index < len(videos) or results[index] is not None:
+                print(f"Dropping question for unknown or repeated video index {index}")
+                continue
+            if not is_valid_question(response_data):
+                print(f"Dropping invalid question for video index {index}: {json.dumps(response_data, indent=2)}")
+                continue
+            results[index] = shuffle_question(response_data)
+
+    except Exception as e:
+        print(f"Error in batched OpenAI question generation: {str(e)}")
+    
+    return results
+
+def generate_test_questions_batch(video_ids: List[str], batch_size: int):
+    """Generate one question per video, batch_size videos per request, falling
+    back to single-video generation for videos a batch returned nothing valid for."""
+    openai_api_key = os.getenv('OPENAI_API_KEY')
+    if not openai_api_key:
+        print("Error: OPENAI_API_KEY not found in environment variables")
+        return
+    
+    client = OpenAI(api_key=openai_api_key)
+    
+    video_docs = db.get_all([db.collection('videos').document(video_id) for video_id in video_ids])
+    videos = {}
+    for doc in video_docs:
+        if not doc.exists:
+            print(f"Video {doc.id} not found, skipping")
+            continue
+        data = doc.to_dict()
+        videos[doc.id] = {
+            'title': data['metadata']['title'],
+            'description': data['metadata']['description'],
+            'transcript': data['metadata']['transcript'],
+            'description2': data['classification']['explicit']['description'],
+        }
+    
+    ids = [video_id for video_id in video_ids if video_id in videos]
+    questions = {}
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        start_time = datetime.now(timezone.utc)
+        results = generate_questions_from_videos(client, [videos[video_id] for video_id in chunk])
+        duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+        print(f"Batch of {len(chunk)} videos took {duration:.2f}s, {sum(1 for r in results if r)} valid")
+        
+        for video_id, question in zip(chunk, results):
+            if question is None:
+                print(f"Retrying video {video_id} on its own")
+                question = generate_question_from_video(client, videos[video_id])
+            questions[video_id] = question
+    
+    return questions
+
 def main():
+    parser = argparse.ArgumentParser(description="Test in-feed question generation")
+    parser.add_argument('--batch', action='store_true', help="Generate one question per video in batched requests")
+    parser.add_argument('--batch-size', type=int, default=5, help="Videos per batched request")
+    args = parser.parse_args()
+    
     print("\nTesting In-Feed Question Generation:")
     print("-" * 30)
     
@@ -232,6 +369,13 @@ def main():
         # Use some test video IDs if no recent videos found
         video_ids = ["01DUDtdTW0KYrmM5pelN", "0J7aFtdE1H4B4gy2w4UL"]  # Replace with actual video IDs from your database
     
+    if args.batch:
+        # Generate one question per video in batched requests
+        result = generate_test_questions_batch(video_ids, args.batch_size)
+        print("\nBatch Question Generation Result:")
+        print(json.dumps(result, indent=2))
+        return
+    
     # Generate a test question
     result = generate_test_question(TEST_USER_ID, video_ids)
     print(f"\nQuestion Generation Result:")
@@ -151,27 +151,43 @@ class ClassProgressScreen extends ConsumerStatefulWidget {
 
 class _ClassProgressScreenState extends ConsumerState<ClassProgressScreen> {
   bool _isModalOpen = false;
+  // The in-progress report, if any, as last seen by the in-progress query
+  String? _inProgressReportId;
 
   void _showGenerateReportModal(BuildContext context, String classId) {
     setState(() {
       _isModalOpen = true;
     });
     
-    showDialog(
+    showDialog<bool>(
       context: context,
       builder: (context) => ProgressReportModal(
         sourceType: 'class',
         sourceId: classId,
       ),
-    ).then((_) {
+    ).then((generationStarted) {
       if (mounted) {
         setState(() {
           _isModalOpen = false;
         });
+        // Follow the new report as its summary streams in
+        if (generationStarted == true && _inProgressReportId != null) {
+          _openReport(_inProgressReportId!);
+        }
       }
     });
   }
 
+  void _openReport(String reportId) {
+    Navigator.of(context).push(
+      MaterialPageRoute(
+        builder: (context) => ClassReportDetailScreen(
+          reportId: reportId,
+        ),
+      ),
+    );
+  }
+
   String _formatDate(Timestamp timestamp) {
     return DateFormat.yMMMd().format(timestamp.toDate());
   }
@@ -229,6 +245,7 @@ class _ClassProgressScreenState extends ConsumerState<ClassProgressScreen> {
 
                       if (reportSnapshot.hasData) {
                         final hasInProgressReport = reportSnapshot.data!.docs.isNotEmpty;
+                        _inProgressReportId = hasInProgressReport ? reportSnapshot.data!.docs.first.id : null;
 
                         WidgetsBinding.instance.addPostFrameCallback((_) {
                           final previousState = ref.read(reportGenerationInProgressProvider(widget.classId));
@@ -238,10 +255,13 @@ class _ClassProgressScreenState extends ConsumerState<ClassProgressScreen> {
                         });
                       }
 
+                      final inProgressReportId = _inProgressReportId;
                       return SizedBox(
                         width: double.infinity,
                         child: ElevatedButton(
-                          onPressed: isGenerating ? null : () => _showGenerateReportModal(context, widget.classId),
+                          onPressed: inProgressReportId != null
+                              ? () => _openReport(inProgressReportId)
+                              : isGenerating ? null : () => _showGenerateReportModal(context, widget.classId),
                           style: ElevatedButton.styleFrom(
                             padding: const EdgeInsets.symmetric(vertical: 16),
                             backgroundColor: Colors.blue,
@@ -258,7 +278,7 @@ class _ClassProgressScreenState extends ConsumerState<ClassProgressScreen> {
                                     const Icon(Icons.add, color: Colors.white),
                                   if (!isGenerating) 
                                     const SizedBox(width: 8),
-                                  Text(isGenerating ? 'Report in Progress' : 'Generate Report'),
+                                  Text(inProgressReportId != null ? 'View Report in Progress' : isGenerating ? 'Report in Progress' : 'Generate Report'),
                                 ],
                               ),
                               if (isGenerating)
@@ -19,27 +19,43 @@ class UserProgressScreen extends ConsumerStatefulWidget {
 
 class _UserProgressScreenState extends ConsumerState<UserProgressScreen> {
   bool _isModalOpen = false;
+  // The in-progress report, if any, as last seen by the in-progress query
+  String? _inProgressReportId;
 
   void _showGenerateReportModal(BuildContext context, String userId) {
     setState(() {
       _isModalOpen = true;
     });
     
-    showDialog(
+    showDialog<bool>(
       context: context,
       builder: (context) => ProgressReportModal(
         sourceType: 'user',
         sourceId: userId,
       ),
-    ).then((_) {
+    ).then((generationStarted) {
       if (mounted) {
         setState(() {
           _isModalOpen = false;
         });
+        // Follow the new report as its summary streams in
+        if (generationStarted == true && _inProgressReportId != null) {
+          _openReport(_inProgressReportId!);
+        }
       }
     });
   }
 
+  void _openReport(String reportId) {
+    Navigator.of(context).push(
+      MaterialPageRoute(
+        builder: (context) => UserReportDetailScreen(
+          reportId: reportId,
+        ),
+      ),
+    );
+  }
+
   String _formatDate(Timestamp timestamp) {
     return DateFormat.yMMMd().format(timestamp.toDate());
   }
@@ -99,6 +115,7 @@ class _UserProgressScreenState extends ConsumerState<UserProgressScreen> {
 
                         if (reportSnapshot.hasData) {
                           final hasInProgressReport = reportSnapshot.data!.docs.isNotEmpty;
+                          _inProgressReportId = hasInProgressReport ? reportSnapshot.data!.docs.first.id : null;
 
                           WidgetsBinding.instance.addPostFrameCallback((_) {
                             final previousState = ref.read(reportGenerationInProgressProvider(widget.userId!));
@@ -108,10 +125,13 @@ class _UserProgressScreenState extends ConsumerState<UserProgressScreen> {
                           });
                         }
 
+                        final inProgressReportId = _inProgressReportId;
                         return SizedBox(
                           width: double.infinity,
                           child: ElevatedButton(
-                            onPressed: isGenerating ? null : () => _showGenerateReportModal(context, widget.userId!),
+                            onPressed: inProgressReportId != null
+                                ? () => _openReport(inProgressReportId)
+                                : isGenerating ? null : () => _showGenerateReportModal(context, widget.userId!),
                             style: ElevatedButton.styleFrom(
                               padding: const EdgeInsets.symmetric(vertical: 16),
                               backgroundColor: Colors.blue,
@@ -128,7 +148,7 @@ class _UserProgressScreenState extends ConsumerState<UserProgressScreen> {
                                       const Icon(Icons.add, color: Colors.white),
                                     if (!isGenerating) 
                                       const SizedBox(width: 8),
-                                    Text(isGenerating ? 'Report in Progress' : 'Generate Report'),
+                                    Text(inProgressReportId != null ? 'View Report in Progress' : isGenerating ? 'Report in Progress' : 'Generate Report'),
                                   ],
                                 ),
                                 if (isGenerating)
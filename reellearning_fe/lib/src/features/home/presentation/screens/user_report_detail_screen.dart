@@ -37,12 +37,19 @@ class UserReportDetailScreen extends StatelessWidget {
             return Center(child: Text('Error: ${snapshot.error}'));
           }
 
-          if (!snapshot.hasData || !snapshot.data!.exists) {
+          if (!snapshot.hasData) {
             return const Center(child: CircularProgressIndicator());
           }
 
+          // Reports are removed when the period turns out to have no activity
+          if (!snapshot.data!.exists) {
+            return const Center(child: Text('This report is no longer available'));
+          }
+
           final report = snapshot.data!.data() as Map<String, dynamic>;
-          final reportData = report['reportData'] as Map<String, dynamic>;
+          // In-progress reports have no reportData until the first streamed text arrives
+          final reportData = report['reportData'] as Map<String, dynamic>? ?? {};
+          final isInProgress = report['status'] == 'in_progress';
 
           return SingleChildScrollView(
             child: Padding(
@@ -155,8 +162,8 @@ class UserReportDetailScreen extends StatelessWidget {
                   ),
                   const SizedBox(height: 24),
 
-                  // Report Body
-                  if (reportData['body'] != null) ...[
+                  // Report Body, streamed in while the report is in progress
+                  if (reportData['body'] != null || isInProgress) ...[
                     const Text(
                       'Summary',
                       style: TextStyle(
@@ -165,11 +172,20 @@ class UserReportDetailScreen extends StatelessWidget {
                       ),
                     ),
                     const SizedBox(height: 8),
+                    if (isInProgress) ...[
+                      const LinearProgressIndicator(),
+                      const SizedBox(height: 8),
+                    ],
                     Text(
-                      reportData['body'],
+                      reportData['body'] ?? 'Generating summary...',
                       style: Theme.of(context).textTheme.bodyLarge,
                     ),
                   ],
+                  if (report['status'] == 'error')
+                    const Text(
+                      'This report could not be generated. Please try again later.',
+                      style: TextStyle(color: Colors.red),
+                    ),
                 ],
               ),
             ),
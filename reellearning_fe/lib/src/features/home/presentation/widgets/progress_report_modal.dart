@@ -26,6 +26,8 @@ class _ProgressReportModalState extends ConsumerState<ProgressReportModal> {
   DateTime? startDate;
   DateTime? endDate;
   bool isLoading = false;
+  // Set once the modal closed itself to show the report being generated
+  bool _closedForProgress = false;
 
   // TODO: Move this to a configuration file
   static const String _functionBaseUrl = 'https://us-central1-reellearning-prj3.cloudfunctions.net';
@@ -94,6 +96,10 @@ class _ProgressReportModalState extends ConsumerState<ProgressReportModal> {
       isLoading = true;
     });
 
+    // The modal may close before the request returns (see build), so results
+    // are shown through the screen's messenger
+    final messenger = ScaffoldMessenger.of(context);
+
     try {
       print('[ProgressReportModal] Attempting API call');
       // Get the current user's ID token
@@ -146,12 +152,23 @@ class _ProgressReportModalState extends ConsumerState<ProgressReportModal> {
 
       final responseData = json.decode(response.body);
 
-      if (response.statusCode == 200) {
+      if (response.statusCode == 200 && responseData['noActivity'] == true) {
+        print('[ProgressReportModal] No activity in the selected period');
+        if (mounted) {
+          Navigator.of(context, rootNavigator: true).pop();
+        }
+        messenger.showSnackBar(
+          const SnackBar(
+            content: Text('No activity in this period, so no report was created'),
+            backgroundColor: Colors.orange,
+          ),
+        );
+      } else if (response.statusCode == 200) {
         print('[ProgressReportModal] API call successful');
-        // Set the in-progress state
-        ref.read(reportGenerationInProgressProvider(widget.sourceId).notifier).state = true;
-        
         if (mounted) {
+          // Set the in-progress state
+          ref.read(reportGenerationInProgressProvider(widget.sourceId).notifier).state = true;
+
           print('[ProgressReportModal] Closing modal after successful API call');
           // Try using rootNavigator: true to ensure we close the modal
           Navigator.of(context, rootNavigator: true).pop();
@@ -164,8 +181,8 @@ class _ProgressReportModalState extends ConsumerState<ProgressReportModal> {
         }
       } else if (response.statusCode == 409) {
         print('[ProgressReportModal] Report already in progress (409)');
-        ref.read(reportGenerationInProgressProvider(widget.sourceId).notifier).state = true;
         if (mounted) {
+          ref.read(reportGenerationInProgressProvider(widget.sourceId).notifier).state = true;
           print('[ProgressReportModal] Closing modal due to 409');
           Navigator.of(context, rootNavigator: true).pop();
           ScaffoldMessenger.of(context).showSnackBar(
@@ -181,14 +198,12 @@ class _ProgressReportModalState extends ConsumerState<ProgressReportModal> {
       }
     } catch (e) {
       print('[ProgressReportModal] Error caught: $e');
-      if (mounted) {
-        ScaffoldMessenger.of(context).showSnackBar(
-          SnackBar(
-            content: Text('Error generating report: $e'),
-            backgroundColor: Colors.red,
-          ),
-        );
-      }
+      messenger.showSnackBar(
+        SnackBar(
+          content: Text('Error generating report: $e'),
+          backgroundColor: Colors.red,
+        ),
+      );
     } finally {
       if (mounted) {
         setState(() {
@@ -204,6 +219,16 @@ class _ProgressReportModalState extends ConsumerState<ProgressReportModal> {
     final isGenerating = ref.watch(reportGenerationInProgressProvider(widget.sourceId));
     if (isGenerating) {
       print('[ProgressReportModal] Report generation in progress, not showing modal');
+      // Our own request is now in progress: close with true so the screen
+      // opens the report and its summary can be read as it streams in
+      if (isLoading && !_closedForProgress) {
+        _closedForProgress = true;
+        WidgetsBinding.instance.addPostFrameCallback((_) {
+          if (mounted) {
+            Navigator.of(context, rootNavigator: true).pop(true);
+          }
+        });
+      }
       return const SizedBox.shrink(); // Don't show modal if report is being generated
     }
 